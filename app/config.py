@@ -1,12 +1,43 @@
 import os
 import json
 
-def load_config():
-    # Path to config.json inside the config folder
-    CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config", "config.json")
+# Path to config.json inside the config folder
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config", "config.json")
+
+# Top-level keys of config.json and the JSON type of each. The sections are
+# checked in detail where they are compiled: app.services.snapshots and
+# app.services.kpi_rules, both imported by main.
+CONFIG_SCHEMA = {
+    "overflow_locations": list,
+    "snapshots": dict,
+    "kpi_rules": dict,
+    "site": dict,
+}
+
 
+def validate_config(config, path=CONFIG_PATH):
+    """Raises ValueError listing every problem, so a bad deploy fails at import instead of on a request."""
+    if not isinstance(config, dict):
+        raise ValueError(f"{path}: must hold a JSON object")
+    problems = [f"unknown key {key!r}" for key in config if key not in CONFIG_SCHEMA]
+    for key, kind in CONFIG_SCHEMA.items():
+        if key in config and not isinstance(config[key], kind):
+            problems.append(f"{key} must be a JSON {'array' if kind is list else 'object'}")
+    locations = config.get("overflow_locations", [])
+    if isinstance(locations, list) and not all(isinstance(location, str) for location in locations):
+        problems.append("overflow_locations must hold strings")
+    if problems:
+        raise ValueError(f"{path}: " + "; ".join(problems))
+    return config
+
+
+def load_config():
     # Read and parse JSON
-    with open(CONFIG_PATH, "r") as f:
-        return json.load(f)
+    try:
+        with open(CONFIG_PATH, "r") as f:
+            config = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"Cannot load {CONFIG_PATH}: {e}") from e
+    return validate_config(config)
 
 config = load_config()
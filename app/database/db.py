@@ -1,9 +1,169 @@
 # app/database/db.py
-from pymongo import MongoClient
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from pymongo import AsyncMongoClient, MongoClient, monitoring
+from pymongo.asynchronous.database import AsyncDatabase
 from pymongo.database import Database
 from dotenv import load_dotenv
 
+from app.services.metrics import command_listener
+
 load_dotenv()
+
+DB_NAME = os.getenv("MONGODB_DB", "ASD")
+
+
+class PoolStatsListener(monitoring.ConnectionPoolListener):
+    """Keeps running counters of connection pool activity for /pool-stats."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.pools_created = 0
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.checked_out = 0
+        self.checkout_failures = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+
+    def pool_created(self, event):
+        with self._lock:
+            self.pools_created += 1
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self.checked_out += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use -= 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "pools_created": self.pools_created,
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "connections_open": self.connections_created - self.connections_closed,
+                "connections_in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "total_checkouts": self.checked_out,
+                "checkout_failures": self.checkout_failures,
+            }
+
+
+pool_listener = PoolStatsListener()
+
+# Routes use the async client; jobs and worker-pool code use the sync one
+_client: Optional[MongoClient] = None
+_async_client: Optional[AsyncMongoClient] = None
+_client_lock = threading.Lock()
+
+
+def client_options() -> Dict[str, Any]:
+    """MongoClient keyword arguments, read from the environment."""
+    return {
+        "maxPoolSize": int(os.getenv("MONGODB_MAX_POOL_SIZE", "50")),
+        "minPoolSize": int(os.getenv("MONGODB_MIN_POOL_SIZE", "0")),
+        "maxIdleTimeMS": int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000")),
+        "waitQueueTimeoutMS": int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "10000")),
+        "serverSelectionTimeoutMS": int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+        "connectTimeoutMS": int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000")),
+        "socketTimeoutMS": int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "60000")),
+        "readPreference": os.getenv("MONGODB_READ_PREFERENCE", "primaryPreferred"),
+        "appname": os.getenv("MONGODB_APP_NAME", "backend_vanderlande"),
+    }
+
+
+def _uri() -> str:
+    return os.getenv("MONGODB_URI", "mongodb://localhost:27017")
+
+
+def connect() -> MongoClient:
+    """Create the application-wide clients. Called once at startup."""
+    global _client, _async_client
+    with _client_lock:
+        if _client is None:
+            _client = MongoClient(_uri(), event_listeners=[pool_listener, command_listener], **client_options())
+        if _async_client is None:
+            _async_client = AsyncMongoClient(_uri(), event_listeners=[pool_listener, command_listener], **client_options())
+        return _client
+
+
+async def close() -> None:
+    """Close the shared clients and release their pooled sockets. Called at shutdown."""
+    global _client, _async_client
+    with _client_lock:
+        client, async_client = _client, _async_client
+        _client = _async_client = None
+    if client is not None:
+        client.close()
+    if async_client is not None:
+        await async_client.close()
+
+
+def get_client() -> MongoClient:
+    # Scripts and tests may use the database without going through app startup
+    return _client if _client is not None else connect()
+
+
 def get_db() -> Database:
-    client = MongoClient("MONGODB_URI")
-    return client["ASD"]
+    """Blocking handle for jobs and code running in the worker pool."""
+    return get_client()[DB_NAME]
+
+
+def get_async_client() -> AsyncMongoClient:
+    if _async_client is None:
+        connect()
+    return _async_client
+
+
+def get_async_db() -> AsyncDatabase:
+    """Non-blocking handle for the async route handlers."""
+    return get_async_client()[DB_NAME]
+
+
+def pool_stats() -> Dict[str, Any]:
+    options = client_options()
+    return {
+        "connected": _client is not None,
+        "async_connected": _async_client is not None,
+        "max_pool_size": options["maxPoolSize"],
+        "min_pool_size": options["minPoolSize"],
+        "read_preference": options["readPreference"],
+        **pool_listener.snapshot(),
+    }
@@ -0,0 +1,37 @@
+# app/jobs/export.py
+"""
+Exports date collections to memory-mappable columnar files for offline
+analysis (see app.services.columnar and app.jobs.offline).
+
+    python -m app.jobs.export 2025-06-01 2025-06-02
+    python -m app.jobs.export --all --out /data/exports
+"""
+import argparse
+
+from app.database.db import get_db
+from app.jobs.materialize import DATE_COLLECTION
+from app.services.columnar import EXPORT_DIR, export_collection
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export date collections to columnar .npy files")
+    parser.add_argument("dates", nargs="*", help="date collections (YYYY-MM-DD)")
+    parser.add_argument("--all", action="store_true", help="process every date collection")
+    parser.add_argument("--out", default=EXPORT_DIR, help=f"export root directory (default {EXPORT_DIR})")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    dates = args.dates
+    if args.all:
+        dates = sorted(name for name in db.list_collection_names() if DATE_COLLECTION.match(name))
+    if not dates:
+        parser.error("give at least one date or --all")
+
+    for date in dates:
+        meta = export_collection(db[date], args.out, args.batch_size)
+        print({"collection": date, "parcels": meta["parcels"], "events": meta["events"]})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+# app/jobs/materialize.py
+"""
+Writes the pre-parsed "kpi" sub-document onto every parcel of a date
+collection and creates the indexes the KPI and journey routes rely on.
+
+    python -m app.jobs.materialize 2025-06-02 2025-06-03
+    python -m app.jobs.materialize --all --only-missing
+
+A parcel's "kpi" sub-document is final: the routes read it instead of the
+events. So only dates the site clock (app.services.siteclock) has closed
+are materialized in full. On a date still open, only deregistered parcels
+are written, as no further events are expected for them; the others stay
+with their events until a later run after the day has closed.
+
+Parcels materialized under other kpi_rules or overflow_locations are
+ignored by the routes, and --only-missing rewrites them too.
+"""
+import argparse
+import re
+from typing import Any, Dict, List
+
+from pymongo import ASCENDING, UpdateOne
+from pymongo.collection import Collection
+
+from app.config import config
+from app.database.db import get_db
+from app.services.kpi_rules import kpi_rules
+from app.services.parcel_record import (
+    MATERIALIZED_FINGERPRINT, MATERIALIZED_VERSION, SOURCE_PROJECTION, classify_parcel, to_materialized,
+)
+from app.services.siteclock import site_clock
+
+DATE_COLLECTION = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+INDEXES = [
+    "kpi.register_ms",
+    "kpi.in_ms",
+    "kpi.out_ms",
+    "hostId",
+    "alibi_id",
+    "barcode_data.barcodes",
+    "registerTS",
+]
+
+
+def ensure_indexes(collection: Collection) -> List[str]:
+    return [collection.create_index([(field, ASCENDING)]) for field in INDEXES]
+
+
+def materialize_collection(collection: Collection, only_missing: bool = False,
+                           batch_size: int = 1000) -> Dict[str, Any]:
+    overflow_locations = set(config.get("overflow_locations", []))
+    query = ({"$or": [{"kpi.v": {"$ne": MATERIALIZED_VERSION}}, {"kpi.rules": {"$ne": MATERIALIZED_FINGERPRINT}}]}
+             if only_missing else {})
+    closed = site_clock.is_closed(collection.name)
+    if not closed:
+        # Parcels still in flight would be frozen without their later events
+        query = {**query, "events.msg_id": {"$in": list(kpi_rules.roles["dereg"].msg_ids)}}
+
+    updated = 0
+    batch = []
+    for doc in collection.find(query, SOURCE_PROJECTION, batch_size=batch_size):
+        record = classify_parcel(doc, overflow_locations)
+        batch.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"kpi": to_materialized(record)}}))
+        if len(batch) >= batch_size:
+            updated += collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += collection.bulk_write(batch, ordered=False).modified_count
+
+    return {"collection": collection.name, "closed": closed, "updated": updated,
+            "indexes": ensure_indexes(collection)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Materialize pre-parsed KPI fields for date collections")
+    parser.add_argument("dates", nargs="*", help="date collections (YYYY-MM-DD)")
+    parser.add_argument("--all", action="store_true", help="process every date collection")
+    parser.add_argument("--only-missing", action="store_true",
+                        help="only parcels without an up-to-date kpi sub-document")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    dates = args.dates
+    if args.all:
+        dates = sorted(name for name in db.list_collection_names() if DATE_COLLECTION.match(name))
+    if not dates:
+        parser.error("give at least one date or --all")
+
+    for date in dates:
+        print(materialize_collection(db[date], args.only_missing, args.batch_size))
+
+
+if __name__ == "__main__":
+    main()
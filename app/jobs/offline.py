@@ -0,0 +1,129 @@
+# app/jobs/offline.py
+"""
+Runs the /summary, /throughput or /volume KPIs over columnar exports, with
+no database. Output is one JSON line per shift and then the aggregate, as
+from the /range routes.
+
+    python -m app.jobs.offline summary 2025-01-01 2025-12-31 --start 06:00 --end 14:00
+    python -m app.jobs.offline throughput 2025-01-01 2025-12-31 --start 22:00 --end 06:00 --bin-size 30
+    python -m app.jobs.offline summary 2025-01-01 2025-12-31 --start 00:00 --end 23:59 \\
+        --overflow-location 0101 --overflow-location 0102     # backtest other overflow locations
+"""
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.config import config
+from app.services import columnar
+from app.services.ranges import RangeWindow, Segment, parse_range, shift_segments
+from app.services.summary_engine import merge_summary_totals, offset_summary_totals, summary_from_totals
+from app.services.throughput_engine import MAX_BIN_SIZE, ThroughputAccumulator, join_counts, sum_counts, throughput_bins
+from app.services.volume_engine import merge_columns, volume_report
+
+# A year of shifts, plus a leap day
+OFFLINE_MAX_DAYS = 366
+
+
+class OfflineRange:
+    """The per-shift partials of one KPI over the exports under `root`."""
+
+    def __init__(self, root: str, window: RangeWindow, overflow_locations: List[str]):
+        self.root = Path(root)
+        self.window = window
+        self.overflow_locations = set(overflow_locations)
+
+    def _day(self, date: str) -> Optional[columnar.ColumnarDay]:
+        path = self.root / date
+        return columnar.ColumnarDay(path) if (path / "meta.json").exists() else None
+
+    def _segments(self, shift: str):
+        return [(segment, self._day(segment.date)) for segment in shift_segments(self.window, shift)]
+
+    def summary(self, shift: str) -> Optional[Dict[str, Any]]:
+        parts = [
+            offset_summary_totals(columnar.summary_totals(day, s.start_ms, s.end_ms, self.overflow_locations),
+                                  s.offset_ms)
+            for s, day in self._segments(shift) if day is not None
+        ]
+        return merge_summary_totals(parts) if parts else None
+
+    def throughput(self, shift: str) -> Optional[Dict[str, Any]]:
+        segments = self._segments(shift)
+        if all(day is None for _, day in segments):
+            return None
+
+        def counts(s: Segment, day):
+            if day is None:
+                # A missing export still takes its place on the shift's timeline, with zero counts
+                return ThroughputAccumulator(s.start_ms, s.end_ms, ()).result()
+            return columnar.throughput_counts(day, s.start_ms, s.end_ms, self.overflow_locations)
+
+        return join_counts([counts(s, day) for s, day in segments])
+
+    def volume(self, shift: str) -> Optional[Dict[str, Any]]:
+        parts = [
+            columnar.volume_columns(day, s.start_ms // 60_000, s.end_ms // 60_000)
+            for s, day in self._segments(shift) if day is not None
+        ]
+        return merge_columns(parts) if parts else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="KPIs over columnar exports, without MongoDB")
+    parser.add_argument("kpi", choices=("summary", "throughput", "volume"))
+    parser.add_argument("date_from", help="first shift (YYYY-MM-DD)")
+    parser.add_argument("date_to", help="last shift (YYYY-MM-DD)")
+    parser.add_argument("--start", default="00:00", help="shift start HH:MM")
+    parser.add_argument("--end", default="23:59", help="shift end HH:MM; before --start for overnight shifts")
+    parser.add_argument("--dir", default=columnar.EXPORT_DIR, help="export root directory")
+    parser.add_argument("--overflow-location", action="append", dest="overflow_locations",
+                        help="overflow location to classify with (repeatable; default: config.json)")
+    parser.add_argument("--bin-size", type=int, default=60, help="throughput bin size in minutes")
+    parser.add_argument("--bin-width", type=float, help="volume histogram bin width")
+    args = parser.parse_args(argv)
+
+    try:
+        window = parse_range(args.date_from, args.date_to, args.start, args.end, max_days=OFFLINE_MAX_DAYS)
+    except ValueError as e:
+        parser.error(str(e))
+    if not 1 <= args.bin_size <= MAX_BIN_SIZE:
+        parser.error(f"--bin-size must be from 1 to {MAX_BIN_SIZE}")
+    if args.bin_width is not None and args.bin_width <= 0:
+        parser.error("--bin-width must be positive")
+
+    overflow_locations = args.overflow_locations
+    if overflow_locations is None:
+        overflow_locations = config.get("overflow_locations", [])
+    offline = OfflineRange(args.dir, window, overflow_locations)
+
+    def throughput_report(counts, periods=1):
+        bins = throughput_bins(counts["in_per_minute"], counts["out_per_minute"], window.start_minute,
+                               window.end_minute, args.bin_size, periods)
+        return {"total_in": counts["total_in"], "total_out": counts["total_out"],
+                "overflow": counts["overflow"], **bins}
+
+    compute, report, merge = {
+        "summary": (offline.summary, summary_from_totals, merge_summary_totals),
+        "throughput": (offline.throughput, throughput_report, sum_counts),
+        "volume": (offline.volume, lambda columns: volume_report(columns, args.bin_width), merge_columns),
+    }[args.kpi]
+
+    shifts = []
+    for shift in window.shifts:
+        partial = compute(shift)
+        if partial is None:
+            print(json.dumps({"date": shift, "message": f"No export found for date {shift}"}))
+            continue
+        shifts.append(partial)
+        print(json.dumps({"date": shift, **report(partial)}))
+
+    aggregate = None
+    if shifts:
+        aggregate = report(merge(shifts), len(shifts)) if args.kpi == "throughput" else report(merge(shifts))
+    print(json.dumps({"date_from": args.date_from, "date_to": args.date_to, "days": len(shifts),
+                      "aggregate": aggregate}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+# app/jobs/rollup.py
+"""
+Builds or extends the per-minute KPI rollups of date collections.
+
+    python -m app.jobs.rollup 2025-06-01 2025-06-02
+    python -m app.jobs.rollup --all
+    python -m app.jobs.rollup 2025-06-03 --incremental   # today's collection, new parcels only
+"""
+import argparse
+
+from app.database.db import get_db
+from app.jobs.materialize import DATE_COLLECTION
+from app.services.rollup import build_rollup, update_rollup
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build per-minute KPI rollups for date collections")
+    parser.add_argument("dates", nargs="*", help="date collections (YYYY-MM-DD)")
+    parser.add_argument("--all", action="store_true", help="process every date collection")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only add parcels inserted since the last run")
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    dates = args.dates
+    if args.all:
+        dates = sorted(name for name in db.list_collection_names() if DATE_COLLECTION.match(name))
+    if not dates:
+        parser.error("give at least one date or --all")
+
+    for date in dates:
+        print(update_rollup(db, date) if args.incremental else build_rollup(db, date))
+
+
+if __name__ == "__main__":
+    main()
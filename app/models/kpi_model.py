@@ -1,8 +1,22 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 
 class DateRequest(BaseModel):
     date: str  # format: "YYYY-MM-DD"
     bin_size: Optional[int] = None  # in minutes: 10, 15, 30, 45, or 60
+    bin_sizes: Optional[List[int]] = None  # /throughput: extra bin sizes returned under "bins"
     start_time: Optional[str] = None    # "HH:MM" format
     end_time: Optional[str] = None # "HH:MM" format
+    bin_width: Optional[float] = None  # /volume: fixed-width histogram bins, same unit as the dimensions
+
+class DashboardRequest(DateRequest):
+    sections: Optional[List[str]] = None  # any of "summary", "throughput", "volume"; all when omitted
+
+class RangeRequest(BaseModel):
+    date_from: str  # format: "YYYY-MM-DD", first shift
+    date_to: str  # format: "YYYY-MM-DD", last shift (inclusive)
+    start_time: Optional[str] = None    # "HH:MM" format
+    end_time: Optional[str] = None  # "HH:MM"; before start_time means the shift ends the next day
+    bin_size: Optional[int] = None  # /throughput, in minutes
+    bin_sizes: Optional[List[int]] = None  # /throughput: extra bin sizes returned under "bins"
+    bin_width: Optional[float] = None  # /volume: fixed-width histogram bins
@@ -1,8 +1,26 @@
 # app/models/parcel_journey_model.py
 
 from pydantic import BaseModel
+from typing import List, Optional
 
 class ParcelJourneyRequest(BaseModel):
     date: str
     search_by: str  # must be one of: 'host_id', 'barcode', 'alibi_id'
     search_value: str
+    fields: Optional[List[str]] = None  # journey row fields to return; all when omitted
+    include_raw: bool = True  # False leaves out RAW, so raw telegrams are neither fetched nor serialized
+
+class ParcelJourneyBatchRequest(BaseModel):
+    dates: List[str]  # date collections to search, "YYYY-MM-DD"
+    host_ids: List[str] = []
+    barcodes: List[str] = []
+    alibi_ids: List[str] = []
+    fields: Optional[List[str]] = None
+    include_raw: bool = True
+
+class ParcelEventsRequest(BaseModel):
+    date: str
+    search_by: str  # must be one of: 'host_id', 'barcode', 'alibi_id'
+    search_value: str
+    offset: int = 0
+    limit: int = 100
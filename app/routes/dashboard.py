@@ -0,0 +1,102 @@
+from fastapi import APIRouter, Depends, HTTPException
+from pymongo.asynchronous.database import AsyncDatabase
+from app.database.db import get_async_db, get_db
+from app.models.kpi_model import DashboardRequest
+from app.services.cache import request_key, response_cache
+from app.services.catalog import collection_catalog
+from app.services.metrics import TimedRoute
+from typing import Any, Dict
+from app.config import config
+from app.routes.throughput import throughput_response, validate_bin_sizes
+from app.routes.volume import validate_bin_width
+from app.services.dashboard_engine import DASHBOARD_SECTIONS
+from app.services.parallel import reduce_kpi
+from app.services.responses import KPIResponse
+from app.services.rollup import (
+    ensure_rollup, load_buckets, summary_totals_from_buckets, throughput_from_buckets, volume_columns_from_buckets,
+)
+from app.services.summary_engine import summary_from_totals
+from app.services.timeparse import parse_hhmm
+from app.services.volume_engine import volume_report
+from app.services.workers import run_in_worker
+
+router = APIRouter(route_class=TimedRoute)
+
+@router.post("/dashboard")
+async def get_dashboard(payload: DashboardRequest, db: AsyncDatabase = Depends(get_async_db)):
+    """
+    The /summary, /throughput and /volume responses of one request, from a
+    single read of the date collection. `sections` picks which of the three
+    to return (all by default); each comes back under its own key, in the
+    same schema as its endpoint.
+    """
+    return KPIResponse(await response_cache.get_or_compute(request_key("dashboard", payload), payload.date,
+                                                           lambda: compute_dashboard(payload, db)))
+
+
+async def compute_dashboard(payload: DashboardRequest, db: AsyncDatabase) -> Dict[str, Any]:
+    try:
+        requested = payload.sections or DASHBOARD_SECTIONS
+        unknown = set(requested) - set(DASHBOARD_SECTIONS)
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unknown dashboard sections {sorted(unknown)}. Choose from {list(DASHBOARD_SECTIONS)}"
+            )
+        sections = tuple(section for section in DASHBOARD_SECTIONS if section in requested)
+
+        bin_size = validate_bin_sizes(payload.bin_size, payload.bin_sizes) if "throughput" in sections else None
+        validate_bin_width(payload.bin_width)
+
+        # Parse start and end times
+        start_minute = parse_hhmm(payload.start_time)
+        end_minute = parse_hhmm(payload.end_time)
+        if start_minute is None or end_minute is None:
+            raise HTTPException(status_code=400, detail="Time format must be HH:MM")
+        if end_minute <= start_minute:
+            raise HTTPException(status_code=400, detail="End time must be after start time")
+
+        if not await collection_catalog.exists(db, payload.date):
+            raise HTTPException(status_code=404, detail=f"No collection found for date {payload.date}")
+
+        collection = db[payload.date]
+        if await collection.find_one({}, {"_id": 1}) is None:
+            return {"message": "No data found for this date"}
+
+        if await run_in_worker(ensure_rollup, get_db(), payload.date):
+            # One read of the per-minute rollup answers every section of a closed day
+            buckets = await load_buckets(db, payload.date, start_minute, end_minute, hosts="summary" in sections)
+            parts = {
+                "summary": lambda: summary_totals_from_buckets(buckets, start_minute, end_minute),
+                "throughput": lambda: throughput_from_buckets(buckets, start_minute, end_minute),
+                "volume": lambda: volume_columns_from_buckets(buckets),
+            }
+            parts = {section: parts[section]() for section in sections}
+        else:
+            # Configurable locations for overflow detection
+            overflow_locations = set(config.get("overflow_locations", []))
+            parts = await reduce_kpi(collection, "dashboard", sections, start_minute * 60_000, end_minute * 60_000,
+                                     overflow_locations)
+
+        response = {}
+        if "summary" in parts:
+            kpis = summary_from_totals(parts["summary"])
+            if kpis["total_parcels"] == 0:
+                response["summary"] = {
+                    "message": "No parcels found in the given time range",
+                    "start_time": payload.start_time,
+                    "end_time": payload.end_time
+                }
+            else:
+                response["summary"] = {"date": payload.date, **kpis}
+        if "throughput" in parts:
+            response["throughput"] = throughput_response(parts["throughput"], payload.start_time, payload.end_time,
+                                                         start_minute, end_minute, bin_size, payload.bin_sizes)
+        if "volume" in parts:
+            response["volume"] = await run_in_worker(volume_report, parts["volume"], payload.bin_width)
+        return response
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
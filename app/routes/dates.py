@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends
+from pymongo.asynchronous.database import AsyncDatabase
+
+from app.database.db import get_async_db
+from app.jobs.materialize import DATE_COLLECTION
+from app.services.catalog import collection_catalog
+from app.services.metrics import TimedRoute
+from app.services.ranges import fan_out
+
+router = APIRouter(route_class=TimedRoute)
+
+
+@router.get("/dates")
+async def get_dates(db: AsyncDatabase = Depends(get_async_db)):
+    """
+    Every date collection with its parcel count and first/last registerTS,
+    for the frontend's date picker. The catalog keeps the stats of closed
+    dates, so after the first call this costs one catalog lookup.
+    """
+    dates = sorted(name for name in await collection_catalog.names(db) if DATE_COLLECTION.match(name))
+
+    async def stats(date: str):
+        return await collection_catalog.date_stats(db, date)
+
+    by_date = {date: result async for date, result in fan_out(dates, stats)}
+    return {"dates": [by_date[date] for date in dates]}
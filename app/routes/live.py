@@ -0,0 +1,53 @@
+import asyncio
+import json
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from pymongo.asynchronous.database import AsyncDatabase
+
+from app.database.db import get_async_db
+from app.services.catalog import collection_catalog
+from app.services.live import live_hub
+from app.services.metrics import TimedRoute
+from app.services.siteclock import site_clock
+
+router = APIRouter(route_class=TimedRoute)
+
+LIVE_KEEPALIVE_SECONDS = float(os.getenv("LIVE_KEEPALIVE_SECONDS", "15"))
+
+
+@router.get("/live")
+async def live_kpis(date: Optional[str] = None, db: AsyncDatabase = Depends(get_async_db)):
+    """
+    Server-Sent Events with the full-day summary and per-minute throughput of
+    `date` (default: today): a "snapshot" event first, then "delta" events as
+    parcels arrive or change.
+    """
+    date = date or site_clock.today()
+    if not await collection_catalog.exists(db, date):
+        raise HTTPException(status_code=404, detail=f"No collection found for date {date}")
+
+    try:
+        feed, queue = await live_hub.subscribe(db, date)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    async def events():
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=LIVE_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+                if message["type"] == "error":
+                    return
+        finally:
+            await live_hub.unsubscribe(feed, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
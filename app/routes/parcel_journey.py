@@ -1,63 +1,202 @@
-from fastapi import APIRouter, Depends, HTTPException
-from pymongo.database import Database
-from typing import List, Dict
-import json
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from pymongo.asynchronous.database import AsyncDatabase
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import orjson
+import os
 
-from app.database.db import get_db
-from app.models.parcel_journey_model import ParcelJourneyRequest
+from app.database.db import get_async_db
+from app.models.parcel_journey_model import ParcelEventsRequest, ParcelJourneyBatchRequest, ParcelJourneyRequest
+from app.services.catalog import collection_catalog
+from app.services.metrics import TimedRoute
+from app.services.responses import KPIResponse, ndjson_response, wants_ndjson
+
+router = APIRouter(route_class=TimedRoute)
+
+# search_by -> document field; each has an index (app.jobs.materialize)
+SEARCH_FIELDS = {
+    "host_id": "hostId",
+    "barcode": "barcode_data.barcodes",
+    "alibi_id": "alibi_id",
+}
+
+JOURNEY_MAX_KEYS = int(os.getenv("JOURNEY_MAX_KEYS", "10000"))
+EVENTS_MAX_LIMIT = int(os.getenv("EVENTS_MAX_LIMIT", "1000"))
+
+
+def _on_and_at(ts_field: str, location_field: str) -> Callable[[Dict], str]:
+    return lambda doc: f'{doc.get(ts_field, "")} {doc.get(location_field, "")}'
+
+
+def _volume(doc: Dict) -> str:
+    volume_data = doc.get("volume_data", {})
+    return (
+        f"L:{volume_data.get('length', '')}, "
+        f"H:{volume_data.get('height', '')}, "
+        f"W:{volume_data.get('width', '')}, "
+        f"BoxVol:{volume_data.get('box_volume', '')}, "
+        f"RealVol:{volume_data.get('real_volume', '')}"
+    )
+
+
+def _raw(doc: Dict) -> str:
+    # Safely convert event["raw"] to stringified JSON for frontend compatibility
+    raw_data = {
+        str(i): event.get("raw")
+        for i, event in enumerate(doc.get("events", []))
+        if event.get("raw") is not None
+    }
+    return orjson.dumps(raw_data, option=orjson.OPT_INDENT_2).decode()  # Convert to formatted string
+
+
+# Journey row field -> (document fields it is built from, builder)
+ROW_FIELDS: Dict[str, Tuple[Tuple[str, ...], Callable[[Dict], Any]]] = {
+    "host_id": (("hostId",), lambda doc: doc.get("hostId")),
+    "status": (("status",), lambda doc: doc.get("status")),
+    "barcode": (("barcode_data.barcodes",), lambda doc: doc.get("barcode_data", {}).get("barcodes", [])),
+    "alibi_id": (("alibi_id",), lambda doc: doc.get("alibi_id")),
+    "register_on_and_at": (("registerTS", "Registered_location"), _on_and_at("registerTS", "Registered_location")),
+    "identification_on_and_at": (("identificationTS", "identification_location"),
+                                 _on_and_at("identificationTS", "identification_location")),
+    "exit_on_and_at": (("exitTS", "exit_location"), _on_and_at("exitTS", "exit_location")),
+    "destination": (("actual_destination",), lambda doc: doc.get("actual_destination")),
+    "volume": (("volume_data",), _volume),
+    "RAW": (("events.raw",), _raw),
+}
+
+
+def row_fields(fields: Optional[List[str]], include_raw: bool) -> Tuple[str, ...]:
+    """The requested journey row fields, in row order; raw telegrams only when asked for."""
+    if fields is None:
+        fields = list(ROW_FIELDS)
+    unknown = [field for field in fields if field not in ROW_FIELDS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields {unknown}. Choose from {list(ROW_FIELDS)}")
+    return tuple(field for field in ROW_FIELDS if field in fields and (include_raw or field != "RAW"))
+
+
+def journey_projection(fields: Tuple[str, ...]) -> Dict[str, int]:
+    # Raw telegrams are only read from the database when the RAW field is requested
+    return {source: 1 for field in fields for source in ROW_FIELDS[field][0]}
+
+
+def journey_row(doc: Dict, fields: Tuple[str, ...] = tuple(ROW_FIELDS)) -> Dict:
+    return {field: ROW_FIELDS[field][1](doc) for field in fields}
 
-router = APIRouter()
 
 @router.post("/parcel-journey")
-def get_parcel_journey(payload: ParcelJourneyRequest, db: Database = Depends(get_db)) -> List[Dict]:
+async def get_parcel_journey(payload: ParcelJourneyRequest, request: Request,
+                             db: AsyncDatabase = Depends(get_async_db)) -> Response:
+    """
+    Journey rows of the parcels matching the search, as a JSON list, or with
+    Accept: application/x-ndjson streamed one row per line as they are read.
+    """
     collection_name = payload.date
 
-    if collection_name not in db.list_collection_names():
+    if not await collection_catalog.exists(db, collection_name):
         raise HTTPException(status_code=404, detail="Collection not found")
 
     # Build MongoDB query
-    if payload.search_by == "host_id":
-        query = {"hostId": payload.search_value}
-    elif payload.search_by == "barcode":
-        query = {"barcode_data.barcodes": {"$in": [payload.search_value]}}  # Nested field
-    elif payload.search_by == "alibi_id":
-        query = {"alibi_id": payload.search_value}
-    else:
+    field = SEARCH_FIELDS.get(payload.search_by)
+    if field is None:
         raise HTTPException(status_code=400, detail="Invalid search_by value")
+    query = {field: payload.search_value}  # matches barcode_data.barcodes elements too
+    fields = row_fields(payload.fields, payload.include_raw)
+
+    cursor = db[collection_name].find(query, journey_projection(fields))
+    if wants_ndjson(request):
+        return ndjson_response(journey_row(doc, fields) async for doc in cursor)
 
     try:
-        results = []
-        for doc in db[collection_name].find(query):
-            # Safely convert event["raw"] to stringified JSON for frontend compatibility
-            raw_data = {
-                str(i): event.get("raw")
-                for i, event in enumerate(doc.get("events", []))
-                if event.get("raw") is not None
-            }
-
-            volume_data = doc.get("volume_data", {})
-            volume_str = (
-            f"L:{volume_data.get('length', '')}, "
-            f"H:{volume_data.get('height', '')}, "
-            f"W:{volume_data.get('width', '')}, "
-            f"BoxVol:{volume_data.get('box_volume', '')}, "
-            f"RealVol:{volume_data.get('real_volume', '')}"
-        )
-
-            results.append({
-                "host_id": doc.get("hostId"),
-                "status": doc.get("status"),
-                "barcode": doc.get("barcode_data", {}).get("barcodes", []),  # Return full list of barcodes
-                "alibi_id": doc.get("alibi_id"),
-                "register_on_and_at": f'{doc.get("registerTS", "")} {doc.get("Registered_location", "")}',
-                "identification_on_and_at": f'{doc.get("identificationTS", "")} {doc.get("identification_location", "")}',
-                "exit_on_and_at": f'{doc.get("exitTS", "")} {doc.get("exit_location", "")}',
-                "destination": doc.get("actual_destination"),
-                "volume":volume_str,
-                "RAW": json.dumps(raw_data, indent=2)  # Convert to formatted string
-            })
-
-        return results
+        return KPIResponse([journey_row(doc, fields) async for doc in cursor])
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
+
+
+@router.post("/parcel-journey/events")
+async def get_parcel_events(payload: ParcelEventsRequest, request: Request,
+                            db: AsyncDatabase = Depends(get_async_db)):
+    """
+    One page of the events of every parcel the search matches, sliced in the
+    database so a long journey is never sent in full. With Accept:
+    application/x-ndjson, one line per parcel instead of a JSON list.
+    """
+    if not await collection_catalog.exists(db, payload.date):
+        raise HTTPException(status_code=404, detail="Collection not found")
+
+    field = SEARCH_FIELDS.get(payload.search_by)
+    if field is None:
+        raise HTTPException(status_code=400, detail="Invalid search_by value")
+    if payload.offset < 0 or not 1 <= payload.limit <= EVENTS_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"offset must be >= 0 and limit between 1 and {EVENTS_MAX_LIMIT}")
+
+    events = {"$ifNull": ["$events", []]}
+    pipeline = [
+        {"$match": {field: payload.search_value}},
+        {"$project": {
+            "_id": 0,
+            "hostId": 1,
+            "total_events": {"$size": events},
+            "events": {"$slice": [events, payload.offset, payload.limit]},
+        }},
+    ]
+
+    def page(doc: Dict) -> Dict:
+        return {
+            "host_id": doc.get("hostId"),
+            "total_events": doc["total_events"],
+            "offset": payload.offset,
+            "limit": payload.limit,
+            "events": [{"index": payload.offset + i, **event} for i, event in enumerate(doc["events"])],
+        }
+
+    try:
+        cursor = await db[payload.date].aggregate(pipeline)
+        if wants_ndjson(request):
+            return ndjson_response(page(doc) async for doc in cursor)
+        return KPIResponse([page(doc) async for doc in cursor])
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Server error: {str(e)}")
+
+
+@router.post("/parcel-journey/batch")
+async def get_parcel_journeys(payload: ParcelJourneyBatchRequest, db: AsyncDatabase = Depends(get_async_db)):
+    """
+    Journeys of many parcels across several dates, streamed as NDJSON: one
+    line per matching parcel, then a line with the keys nothing matched.
+    Each date is searched with one indexed $in query per key type.
+    """
+    keys = {search_by: set(getattr(payload, f"{search_by}s")) for search_by in SEARCH_FIELDS}
+    n_keys = sum(len(values) for values in keys.values())
+    if not n_keys:
+        raise HTTPException(status_code=400, detail="Give at least one host_id, barcode or alibi_id")
+    if n_keys > JOURNEY_MAX_KEYS:
+        raise HTTPException(status_code=400, detail=f"At most {JOURNEY_MAX_KEYS} keys per request")
+
+    existing = await collection_catalog.names(db)
+    dates = [date for date in dict.fromkeys(payload.dates) if date in existing]
+    query = {"$or": [{SEARCH_FIELDS[search_by]: {"$in": sorted(values)}}
+                     for search_by, values in keys.items() if values]}
+    fields = row_fields(payload.fields, payload.include_raw)
+    # Key matching below needs the searched fields even when the row leaves them out
+    projection = {**journey_projection(fields), **{field: 1 for field in SEARCH_FIELDS.values()}}
+
+    async def lines():
+        found = {search_by: set() for search_by in SEARCH_FIELDS}
+        for date in dates:
+            async for doc in db[date].find(query, projection):
+                matched = {
+                    "host_id": [doc.get("hostId")],
+                    "barcode": doc.get("barcode_data", {}).get("barcodes", []),
+                    "alibi_id": [doc.get("alibi_id")],
+                }
+                for search_by, values in matched.items():
+                    found[search_by].update(value for value in values if value in keys[search_by])
+                yield {"date": date, **journey_row(doc, fields)}
+        yield {
+            "not_found": {search_by: sorted(keys[search_by] - found[search_by]) for search_by in SEARCH_FIELDS},
+            "missing_dates": [date for date in dict.fromkeys(payload.dates) if date not in existing],
+        }
+
+    return ndjson_response(lines())
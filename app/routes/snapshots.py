@@ -0,0 +1,38 @@
+from fastapi import APIRouter, HTTPException
+
+from app.services.metrics import TimedRoute
+from app.services.responses import KPIResponse
+from app.services.snapshots import response, snapshot_scheduler, snapshot_store
+
+router = APIRouter(route_class=TimedRoute)
+
+
+@router.get("/snapshots")
+async def get_snapshots():
+    """
+    The configured windows of today with the request each snapshot answers
+    and when it was computed, plus the scheduler's state.
+    """
+    return {
+        "scheduler": snapshot_scheduler.stats(),
+        "snapshots": [
+            {
+                "window": s.window,
+                "kpi": s.kpi,
+                "request": s.request.model_dump(exclude_none=True),
+                "as_of": s.as_of,
+                "seconds": s.seconds,
+                "fresh": snapshot_store.get(s.window, s.kpi) is not None,
+            }
+            for s in snapshot_store.all()
+        ],
+    }
+
+
+@router.get("/snapshots/{window}/{kpi}")
+async def get_snapshot(window: str, kpi: str):
+    """The latest response of one window and KPI, e.g. /snapshots/last_hour/summary."""
+    snapshot = snapshot_store.get(window, kpi)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"No current snapshot for {window}/{kpi}")
+    return KPIResponse(response(snapshot))
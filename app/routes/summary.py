@@ -1,155 +1,61 @@
+import asyncio
+import os
 from fastapi import APIRouter, Depends, HTTPException
-from pymongo.database import Database
-from app.database.db import get_db
-from app.models.kpi_model import DateRequest
-from datetime import datetime
+from pymongo.asynchronous.database import AsyncDatabase
+from app.database.db import get_async_db, get_db
+from app.models.kpi_model import DateRequest, RangeRequest
+from app.services.cache import request_key, response_cache
+from app.services.catalog import collection_catalog
+from app.services.day_engine import DayProfile
+from typing import Any, Dict, Optional
 from app.config import config
-
-router = APIRouter()
+from app.services.ranges import fan_out, parse_range, shift_segments
+from app.services.rollup import ensure_rollup, load_buckets, summary_totals_from_buckets
+from app.services.metrics import TimedRoute, stage
+from app.services.parallel import reduce_kpi
+from app.services.responses import KPIResponse, ndjson_response
+from app.services.snapshots import snapshot_store
+from app.services.timeparse import parse_hhmm
+from app.services.summary_engine import (
+    merge_summary_totals, offset_summary_totals, summary_from_totals, summary_totals_with_pipeline,
+)
+from app.services.workers import run_in_worker
+
+router = APIRouter(route_class=TimedRoute)
+
+# "pipeline" computes the KPIs inside MongoDB, "python" uses the reference implementation
+SUMMARY_ENGINE = os.getenv("SUMMARY_ENGINE", "pipeline")
 
 @router.post("/summary")
-def get_summary(payload: DateRequest, db: Database = Depends(get_db)):
+async def get_summary(payload: DateRequest, db: AsyncDatabase = Depends(get_async_db)):
+    # Today's configured windows are precomputed in the background
+    result = snapshot_store.match("summary", payload)
+    if result is None:
+        result = await response_cache.get_or_compute(request_key("summary", payload), payload.date,
+                                                     lambda: compute_summary(payload, db))
+    # Encoded by orjson as it is, without FastAPI's jsonable_encoder pass
+    return KPIResponse(result)
+
+
+async def compute_summary(payload: DateRequest, db: AsyncDatabase):
     try:
-        if payload.date not in db.list_collection_names():
+        if not await collection_catalog.exists(db, payload.date):
             raise HTTPException(status_code=404, detail=f"No collection found for date {payload.date}")
 
         collection = db[payload.date]
-        parcels = list(collection.find({}))
-        if not parcels:
+        if await collection.find_one({}, {"_id": 1}) is None:
             return {"message": "No data found for this date"}
 
         # Parse start and end times
-        try:
-            start_time = datetime.strptime(payload.start_time, "%H:%M")
-            end_time = datetime.strptime(payload.end_time, "%H:%M")
-        except ValueError:
+        start_minute = parse_hhmm(payload.start_time)
+        end_minute = parse_hhmm(payload.end_time)
+        if start_minute is None or end_minute is None:
             raise HTTPException(status_code=400, detail="Time format must be HH:MM")
-        if end_time <= start_time:
+        if end_minute <= start_minute:
             raise HTTPException(status_code=400, detail="End time must be after start time")
 
-        # --- Helper to parse DB times like throughput ---
-        def safe_parse_time(ts_str, start_time):
-                formats = ["%H:%M:%S,%f", "%H:%M:%S"]  # support both with and without milliseconds
-                for fmt in formats:
-                    try:
-                        ts = datetime.strptime(ts_str.strip(), fmt).replace(
-                            year=start_time.year, month=start_time.month, day=start_time.day
-                        )
-                        return ts
-                    except ValueError:
-                        continue
-                return None
-
-        # --- Filter parcels by time range ---
-        filtered_parcels = []
-        for p in parcels:
-            ts_str = p.get("registerTS")
-            if not ts_str:
-                continue
-            ts = safe_parse_time(ts_str, start_time)
-            if ts and start_time <= ts <= end_time:
-                filtered_parcels.append(p)
-        
-        # 1. Total parcels
-        unique_hosts = {p.get("hostId") for p in filtered_parcels if p.get("hostId")}
-        total_parcels = len(unique_hosts)
-
-        if total_parcels == 0:
-            return {
-                "message": "No parcels found in the given time range",
-                "start_time": payload.start_time,
-                "end_time": payload.end_time
-            }
-
-        # 2. Sorted Parcels
-        sorted_parcels = sum(
-            1 for p in filtered_parcels
-            if p.get("status") == "sorted" and p.get("sort_strategy") == "1"
-        )
-
-        # 3. Total parcels in the system
-        parcels_in_system = []
-        for p in filtered_parcels:
-            msg_ids = {event.get("msg_id") for event in p.get("events", [])}
-            if "2" in msg_ids and not msg_ids.intersection({"6", "7"}):
-                parcels_in_system.append(p)
-        total_in_system = len(parcels_in_system)
-
-        # 4. Overflow
-        overflow_locations = config.get("overflow_locations", [])
-        def calculate_overflow(parcels, overflow_locations):
-            overflow_count = 0
-            for parcel in parcels:
-                events = parcel.get("events", [])
-
-                has_verified_sort_999 = any(
-                    e.get("msg_id") == "6" and
-                    len(e.get("raw", "").split("|")) > 10 and
-                    e.get("raw", "").split("|")[10] == "999"
-                    for e in events
-                )
-                if has_verified_sort_999:
-                    if any(ev.get("msg_id") == "2" for ev in events):
-                        overflow_count += 1
-                        continue
-
-                has_msg_id_7_in_overflow_location = any(
-                    e.get("msg_id") == "7" and
-                    len(e.get("raw", "").split("|")) > 11 and
-                    e.get("raw", "").split("|")[11] in overflow_locations
-                    for e in events
-                )
-                if has_msg_id_7_in_overflow_location:
-                    overflow_count += 1
-            return overflow_count
-
-        overflow = calculate_overflow(filtered_parcels, overflow_locations)
-
-        # 5. Barcode Read Ratio
-        barcode_read = sum(1 for p in filtered_parcels if p.get("barcode_error") is False)
-        barcode_read_ratio = round((barcode_read / total_parcels) * 100, 2) if total_parcels else 0.0
-
-        # 6. Volume Rate
-        volume_valid = sum(
-            1 for p in filtered_parcels
-            if isinstance(p.get("volume_data", {}).get("real_volume"), (int, float))
-            and p["volume_data"]["real_volume"] > 0
-        )
-        volume_rate = round((volume_valid / total_parcels) * 100, 2) if total_parcels else 0.0
-
-        # 7. Throughput
-        in_timestamps = []
-        for p in filtered_parcels:
-            for event in p.get("events", []):
-                if event.get("msg_id") == "2":
-                    ts = safe_parse_time(event.get("ts", ""), start_time)
-                    if ts:
-                        in_timestamps.append(ts)
-                        break
-        throughput_per_hour = 0.0
-        if in_timestamps:
-            duration_hours = (max(in_timestamps) - min(in_timestamps)).total_seconds() / 3600
-            throughput_per_hour = round(len(in_timestamps) / duration_hours, 2) if duration_hours > 0 else 0.0
-
-        # 8. Tracking Performance
-        def has_required_msg_ids(events):
-            msg_ids = {e.get("msg_id") for e in events}
-            return {"2", "3", "6"}.issubset(msg_ids)
-
-        tracking_ok = sum(1 for p in filtered_parcels if has_required_msg_ids(p.get("events", [])))
-        tracking_performance = round((tracking_ok / total_parcels) * 100, 2) if total_parcels else 0.0
-
-        return {
-            "date": payload.date,
-            "total_parcels": total_parcels,
-            "total_in_system": total_in_system,
-            "sorted_parcels": sorted_parcels,
-            "overflow": overflow,
-            "barcode_read_ratio_percent": barcode_read_ratio,
-            "volume_rate_percent": volume_rate,
-            "throughput_avg_per_hour": throughput_per_hour,
-            "tracking_performance_percent": tracking_performance,
-        }
+        return summary_response(payload, await summary_totals(db, payload.date, start_minute * 60_000,
+                                                              end_minute * 60_000))
 
     except HTTPException as e:
         raise e
@@ -157,6 +63,73 @@ def get_summary(payload: DateRequest, db: Database = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def summary_response(payload: DateRequest, totals: Dict[str, Any]) -> Dict[str, Any]:
+    kpis = summary_from_totals(totals)
+    if kpis["total_parcels"] == 0:
+        return {
+            "message": "No parcels found in the given time range",
+            "start_time": payload.start_time,
+            "end_time": payload.end_time
+        }
+    return {"date": payload.date, **kpis}
+
+
+def summary_from_profile(payload: DateRequest, profile: DayProfile) -> Dict[str, Any]:
+    """compute_summary's response for a window of today, sliced from the snapshot refresh's day profile."""
+    return summary_response(payload, profile.summary_totals(parse_hhmm(payload.start_time),
+                                                            parse_hhmm(payload.end_time)))
+
+
+async def summary_totals(db: AsyncDatabase, date: str, start_ms: int, end_ms: int) -> Dict[str, Any]:
+    """Mergeable /summary counters of one date collection for registerTS in [start_ms, end_ms]."""
+    overflow_locations = config.get("overflow_locations", [])
+    if await run_in_worker(ensure_rollup, get_db(), date):
+        start_minute, end_minute = start_ms // 60_000, end_ms // 60_000
+        buckets = await load_buckets(db, date, start_minute, end_minute, hosts=True)
+        return summary_totals_from_buckets(buckets, start_minute, end_minute)
+    if SUMMARY_ENGINE == "python":
+        return await reduce_kpi(db[date], "summary", start_ms, end_ms, set(overflow_locations))
+    with stage("fetch"):
+        return await summary_totals_with_pipeline(db[date], start_ms, end_ms, overflow_locations)
+
+
+@router.post("/summary/range")
+async def get_summary_range(payload: RangeRequest, db: AsyncDatabase = Depends(get_async_db)):
+    """
+    Summary KPIs for every shift of date_from..date_to, streamed as NDJSON:
+    one line per shift as it completes, then the aggregate over all shifts.
+    """
+    try:
+        window = parse_range(payload.date_from, payload.date_to, payload.start_time, payload.end_time)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    existing = await collection_catalog.names(db)
+
+    async def shift_totals(shift: str) -> Optional[Dict[str, Any]]:
+        segments = [segment for segment in shift_segments(window, shift) if segment.date in existing]
+        if not segments:
+            return None
+        parts = await asyncio.gather(*(summary_totals(db, s.date, s.start_ms, s.end_ms) for s in segments))
+        return merge_summary_totals(offset_summary_totals(part, s.offset_ms) for part, s in zip(parts, segments))
+
+    async def lines():
+        shifts = []
+        async for shift, totals in fan_out(window.shifts, shift_totals):
+            if totals is None:
+                yield {"date": shift, "message": f"No collection found for date {shift}"}
+                continue
+            shifts.append(totals)
+            yield {"date": shift, **summary_from_totals(totals)}
+        yield {
+            "date_from": payload.date_from,
+            "date_to": payload.date_to,
+            "days": len(shifts),
+            "aggregate": summary_from_totals(merge_summary_totals(shifts)),
+        }
+
+    return ndjson_response(lines())
+
+
 # from fastapi import APIRouter, Depends, HTTPException
 # from pymongo.database import Database
 # from app.database.db import get_db
@@ -1,188 +1,171 @@
-from fastapi import APIRouter, Depends, HTTPException
-from pymongo.database import Database
-from app.database.db import get_db
-from app.models.kpi_model import DateRequest
-from datetime import datetime, timedelta
-from collections import defaultdict, OrderedDict
-from app.config import config
-
-router = APIRouter()
-
-@router.post("/throughput")
-def get_throughput(payload: DateRequest, db: Database = Depends(get_db)):
-    try:
-        print(f"Fetching data from collection: {payload.date}")
-
-        # Validate bin_size
-        valid_bins = [1, 10, 20, 30, 60]
-        bin_size = payload.bin_size
-        if bin_size not in valid_bins:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Invalid bin size. Choose from {valid_bins}"
-            )
-
-        if payload.date not in db.list_collection_names():
-            raise HTTPException(status_code=404, detail=f"No collection found for date {payload.date}")
-
-        collection = db[payload.date]
-        parcels = list(collection.find({}))
-        if not parcels:
-            return {"message": "No data found for this date"}
-
-        # Parse start and end times
-        try:
-            start_time = datetime.strptime(payload.start_time, "%H:%M")
-            end_time = datetime.strptime(payload.end_time, "%H:%M")
-        except ValueError:
-            raise HTTPException(status_code=400, detail="Time format must be HH:MM")
-        if end_time <= start_time:
-            raise HTTPException(status_code=400, detail="End time must be after start time")
-
-        # Configurable locations for overflow detection
-        overflow_locations = config.get("overflow_locations", [])
-
-        time_bins = OrderedDict()
-        current_time = start_time
-        while current_time < end_time:
-            label = current_time.strftime("%H:%M")
-            time_bins[label] = 0
-            current_time += timedelta(minutes=bin_size)
-
-        parcels_in_time = time_bins.copy()
-        parcels_out_time = time_bins.copy()
-
-        total_in = 0
-        total_out = 0
-        overflow_count = 0
-
-        for parcel in parcels:
-            events = parcel.get("events", [])
-            ts_in = None
-            ts_out = None
-
-            # IN event
-            for event in events:
-                if event.get("msg_id") == "2":
-                    ts_str = event.get("ts")
-                    try:
-                        ts = datetime.strptime(ts_str, "%H:%M:%S,%f").replace(
-                            year=start_time.year, month=start_time.month, day=start_time.day
-                        )
-                    except:
-                        continue
-
-                    if start_time <= ts <= end_time:
-                        total_in += 1
-                        # Floor the timestamp to the nearest bin
-                        minutes_since_start = int((ts - start_time).total_seconds() // 60)
-                        floored_minutes = (minutes_since_start // bin_size) * bin_size
-                        bin_time = start_time + timedelta(minutes=floored_minutes)
-                        bin_label = bin_time.strftime("%H:%M")
-
-                        if bin_label in parcels_in_time:
-                            parcels_in_time[bin_label] += 1
-
-
-            # OUT event
-            for event in events:
-                if event.get("msg_id") == "6":
-                    ts_str = event.get("ts")
-                    try:
-                        ts = datetime.strptime(ts_str, "%H:%M:%S,%f").replace(
-                            year=start_time.year, month=start_time.month, day=start_time.day
-                        )
-                    except:
-                        continue
-
-                    if start_time <= ts <= end_time:
-                        sort_code = event.get("sort_code")
-                        sort_status = event.get("raw", "")
-                        raw_parts = sort_status.split("|")  # ✅ fixed
-
-                        if len(raw_parts) > 10:
-                            sort_status = raw_parts[10]
-                            # Compute floored bin label
-                            minutes_since_start = int((ts - start_time).total_seconds() // 60)
-                            floored_minutes = (minutes_since_start // bin_size) * bin_size
-                            bin_time = start_time + timedelta(minutes=floored_minutes)
-                            bin_label = bin_time.strftime("%H:%M")
-
-                            if sort_code == "1":
-                                total_out += 1
-                                if bin_label in parcels_out_time:
-                                    parcels_out_time[bin_label] += 1
-                                break
-
-                            elif sort_status == "999":
-                                for ev in events:
-                                    if ev.get("msg_id") == "7":
-                                        raw_dereg = ev.get("raw", "")
-                                        parts = raw_dereg.split("|")
-                                        if len(parts) > 9 and parts[9] == "2":
-                                            total_out += 1
-                                            if bin_label in parcels_out_time:
-                                                parcels_out_time[bin_label] += 1
-                                            break
-                                break
-
-
-            def safe_parse_time(ts_str, start_time):
-                formats = ["%H:%M:%S,%f", "%H:%M:%S"]  # support both with and without milliseconds
-                for fmt in formats:
-                    try:
-                        ts = datetime.strptime(ts_str.strip(), fmt).replace(
-                            year=start_time.year, month=start_time.month, day=start_time.day
-                        )
-                        return ts
-                    except ValueError:
-                        continue
-                return None
-
-            # Overflow Case 1
-            for event in events:
-                if event.get("msg_id") == "6":
-                    ts_str = event.get("ts")
-                    ts = safe_parse_time(ts_str, start_time)
-                    if not ts or not (start_time <= ts <= end_time):
-                        continue
-
-                    raw = event.get("raw", "")
-                    parts = raw.split("|")
-                    if len(parts) > 10 and parts[10] == "999":
-                        for ev in events:
-                            if ev.get("msg_id") == "2":
-                                overflow_count += 1
-                                break
-
-            # Overflow Case 2
-            for event in events:
-                if event.get("msg_id") == "7":
-                    ts_str = event.get("ts")
-                    ts = safe_parse_time(ts_str, start_time)
-                    if not ts or not (start_time <= ts <= end_time):
-                        continue
-
-                    raw = event.get("raw", "")
-                    parts = raw.split("|")
-                    if len(parts) > 11 and parts[11] in overflow_locations:
-                        overflow_count += 1
-
-        avg_in = round(total_in / len(parcels_in_time), 2) if parcels_in_time else 0
-        avg_out = round(total_out / len(parcels_out_time), 2) if parcels_out_time else 0
-
-        return {
-            "bin_size_minutes": bin_size,
-            "start_time": payload.start_time,
-            "end_time": payload.end_time,
-            "total_in": total_in,
-            "total_out": total_out,
-            "avg_in": avg_in,
-            "avg_out": avg_out,
-            "overflow": overflow_count,
-            "parcels_in_time": parcels_in_time,
-            "parcels_out_time": parcels_out_time
-        }
-
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException
+from pymongo.asynchronous.database import AsyncDatabase
+from app.database.db import get_async_db, get_db
+from app.models.kpi_model import DateRequest, RangeRequest
+from app.services.cache import request_key, response_cache
+from app.services.catalog import collection_catalog
+from app.services.day_engine import DayProfile
+from app.services.metrics import TimedRoute
+from typing import Any, Dict, List, Optional
+from app.config import config
+from app.services.ranges import Segment, fan_out, parse_range, shift_segments
+from app.services.rollup import ensure_rollup, load_buckets, throughput_from_buckets
+from app.services.parallel import reduce_kpi
+from app.services.responses import KPIResponse, ndjson_response
+from app.services.snapshots import snapshot_store
+from app.services.timeparse import parse_hhmm
+from app.services.throughput_engine import (
+    MAX_BIN_SIZE, ThroughputAccumulator, join_counts, sum_counts, throughput_bins,
+)
+from app.services.workers import run_in_worker
+
+router = APIRouter(route_class=TimedRoute)
+
+@router.post("/throughput")
+async def get_throughput(payload: DateRequest, db: AsyncDatabase = Depends(get_async_db)):
+    # Today's configured windows are precomputed in the background
+    result = snapshot_store.match("throughput", payload)
+    if result is None:
+        result = await response_cache.get_or_compute(request_key("throughput", payload), payload.date,
+                                                     lambda: compute_throughput(payload, db))
+    # Encoded by orjson as it is, without FastAPI's jsonable_encoder pass
+    return KPIResponse(result)
+
+
+async def compute_throughput(payload: DateRequest, db: AsyncDatabase):
+    try:
+        bin_size = validate_bin_sizes(payload.bin_size, payload.bin_sizes)
+
+        if not await collection_catalog.exists(db, payload.date):
+            raise HTTPException(status_code=404, detail=f"No collection found for date {payload.date}")
+
+        collection = db[payload.date]
+        if await collection.find_one({}, {"_id": 1}) is None:
+            return {"message": "No data found for this date"}
+
+        # Parse start and end times
+        start_minute = parse_hhmm(payload.start_time)
+        end_minute = parse_hhmm(payload.end_time)
+        if start_minute is None or end_minute is None:
+            raise HTTPException(status_code=400, detail="Time format must be HH:MM")
+        if end_minute <= start_minute:
+            raise HTTPException(status_code=400, detail="End time must be after start time")
+
+        counts = await throughput_counts(db, payload.date, start_minute * 60_000, end_minute * 60_000)
+        return throughput_response(counts, payload.start_time, payload.end_time, start_minute, end_minute,
+                                   bin_size, payload.bin_sizes)
+
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def throughput_from_profile(payload: DateRequest, profile: DayProfile) -> Dict[str, Any]:
+    """compute_throughput's response for a window of today, sliced from the snapshot refresh's day profile."""
+    bin_size = validate_bin_sizes(payload.bin_size, payload.bin_sizes)
+    start_minute, end_minute = parse_hhmm(payload.start_time), parse_hhmm(payload.end_time)
+    return throughput_response(profile.throughput_counts(start_minute, end_minute), payload.start_time,
+                               payload.end_time, start_minute, end_minute, bin_size, payload.bin_sizes)
+
+
+def validate_bin_sizes(bin_size: Optional[int], extra: Optional[List[int]]) -> int:
+    """Checks every requested bin size and returns the primary one (bin_size, else the first of bin_sizes)."""
+    if bin_size is None:
+        bin_size = (extra or [None])[0]
+    # Any whole number of minutes up to a day
+    if any(not isinstance(size, int) or not 1 <= size <= MAX_BIN_SIZE for size in [bin_size, *(extra or [])]):
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid bin size. Choose a number of minutes from 1 to {MAX_BIN_SIZE}"
+        )
+    return bin_size
+
+
+async def throughput_counts(db: AsyncDatabase, date: str, start_ms: int, end_ms: int) -> Dict[str, Any]:
+    """Per-minute IN/OUT counts and overflow of one date collection between start_ms and end_ms."""
+    if await run_in_worker(ensure_rollup, get_db(), date):
+        start_minute, end_minute = start_ms // 60_000, end_ms // 60_000
+        buckets = await load_buckets(db, date, start_minute, end_minute)
+        return throughput_from_buckets(buckets, start_minute, end_minute)
+
+    # Configurable locations for overflow detection
+    overflow_locations = set(config.get("overflow_locations", []))
+    return await reduce_kpi(db[date], "throughput", start_ms, end_ms, overflow_locations)
+
+
+def throughput_response(counts: Dict[str, Any], start_time: str, end_time: str, start_minute: int,
+                        end_minute: int, bin_size: int, extra: Optional[List[int]],
+                        periods: int = 1) -> Dict[str, Any]:
+    # Every bin size is a floor_divide + bincount over the same per-minute counts
+    binned = {
+        size: throughput_bins(counts["in_per_minute"], counts["out_per_minute"], start_minute, end_minute, size,
+                              periods)
+        for size in {bin_size, *(extra or [])}
+    }
+    primary = binned[bin_size]
+
+    response = {
+        "bin_size_minutes": bin_size,
+        "start_time": start_time,
+        "end_time": end_time,
+        "total_in": counts["total_in"],
+        "total_out": counts["total_out"],
+        "avg_in": primary["avg_in"],
+        "avg_out": primary["avg_out"],
+        "overflow": counts["overflow"],
+        "parcels_in_time": primary["parcels_in_time"],
+        "parcels_out_time": primary["parcels_out_time"]
+    }
+    if extra:
+        response["bins"] = {str(size): binned[size] for size in extra}
+    return response
+
+
+@router.post("/throughput/range")
+async def get_throughput_range(payload: RangeRequest, db: AsyncDatabase = Depends(get_async_db)):
+    """
+    Throughput for every shift of date_from..date_to, streamed as NDJSON:
+    one line per shift as it completes, then the aggregate over all shifts,
+    whose bins add up the same time of day across shifts.
+    """
+    bin_size = validate_bin_sizes(payload.bin_size, payload.bin_sizes)
+    try:
+        window = parse_range(payload.date_from, payload.date_to, payload.start_time, payload.end_time)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    existing = await collection_catalog.names(db)
+
+    async def segment_counts(segment: Segment) -> Dict[str, Any]:
+        if segment.date not in existing:
+            # A missing collection still takes its place on the shift's timeline, with zero counts
+            return ThroughputAccumulator(segment.start_ms, segment.end_ms, ()).result()
+        return await throughput_counts(db, segment.date, segment.start_ms, segment.end_ms)
+
+    async def shift_counts(shift: str) -> Optional[Dict[str, Any]]:
+        segments = shift_segments(window, shift)
+        if not any(segment.date in existing for segment in segments):
+            return None
+        return join_counts(await asyncio.gather(*(segment_counts(segment) for segment in segments)))
+
+    def response(counts, periods=1):
+        return throughput_response(counts, payload.start_time, payload.end_time, window.start_minute,
+                                   window.end_minute, bin_size, payload.bin_sizes, periods)
+
+    async def lines():
+        shifts = []
+        async for shift, counts in fan_out(window.shifts, shift_counts):
+            if counts is None:
+                yield {"date": shift, "message": f"No collection found for date {shift}"}
+                continue
+            shifts.append(counts)
+            yield {"date": shift, **response(counts)}
+        yield {
+            "date_from": payload.date_from,
+            "date_to": payload.date_to,
+            "days": len(shifts),
+            "aggregate": response(sum_counts(shifts), len(shifts)) if shifts else None,
+        }
+
+    return ndjson_response(lines())
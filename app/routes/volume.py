@@ -1,94 +1,128 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from pymongo.database import Database
-from app.database.db import get_db
-from app.models.kpi_model import DateRequest
-from collections import defaultdict
-from typing import Dict, Any, List
-import numpy as np
-
-router = APIRouter()
-
-@router.post("/volume")
-def get_volume(payload: DateRequest, db: Database = Depends(get_db)) -> Dict[str, Any]:
-    """
-    Retrieves height, width, and length distributions + normal distribution
-    parameters for parcels within a given date and time range.
-    """
-
-    date = payload.date
-    start_time = payload.start_time
-    end_time = payload.end_time
-
-    # Ensure collection exists
-    if date not in db.list_collection_names():
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"No collection found for date {date}"
-        )
-
-    collection = db[date]
-    parcels: List[Dict[str, Any]] = list(collection.find({}))
-
-    if not parcels:
-        return {"message": "No data found for this date"}
-
-    def extract_hhmm(ts_str: str) -> str:
-        """
-        Extract HH:MM from HH:MM:SS,milliseconds.
-        If format invalid, returns '00:00'.
-        """
-        try:
-            # Example: "09:15:26,625" -> "09:15"
-            return ts_str.split(",")[0][:5]
-        except Exception:
-            return "00:00"
-
-    def is_in_time_range(ts_str: str) -> bool:
-        """Check if timestamp is within the given HH:MM range."""
-        hhmm = extract_hhmm(ts_str)
-        return start_time <= hhmm <= end_time
-
-    # Filter parcels by time range
-    filtered_parcels = [
-        p for p in parcels
-        if is_in_time_range(p.get("registerTS", "00:00"))
-    ]
-
-    height_count = defaultdict(int)
-    width_count = defaultdict(int)
-    length_count = defaultdict(int)
-
-    heights, widths, lengths = [], [], []
-
-    for parcel in filtered_parcels:
-        volume = parcel.get("volume_data", {})
-        if (h := volume.get("height")) is not None:
-            height_count[h] += 1
-            heights.append(h)
-        if (w := volume.get("width")) is not None:
-            width_count[w] += 1
-            widths.append(w)
-        if (l := volume.get("length")) is not None:
-            length_count[l] += 1
-            lengths.append(l)
-
-    def normal_stats(values: List[float]) -> Dict[str, float]:
-        """Return mean and std deviation for normal distribution."""
-        if not values:
-            return {"mean": 0, "std_dev": 0}
-        arr = np.array(values)
-        return {
-            "mean": round(float(np.mean(arr)), 2),
-            "std_dev": round(float(np.std(arr)), 2)
-        }
-
-    return {
-        "height_distribution": dict(height_count),
-        "width_distribution": dict(width_count),
-        "length_distribution": dict(length_count),
-        "normal_distribution": {
-            "height": normal_stats(heights),
-            "width": normal_stats(widths),
-            "length": normal_stats(lengths)
-        }
-    }
\ No newline at end of file
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, status
+from pymongo.asynchronous.database import AsyncDatabase
+from app.database.db import get_async_db, get_db
+from app.models.kpi_model import DateRequest, RangeRequest
+from app.services.cache import request_key, response_cache
+from app.services.catalog import collection_catalog
+from app.services.day_engine import DayProfile
+from app.services.metrics import TimedRoute
+from app.services.ranges import fan_out, parse_range, shift_segments
+from app.services.rollup import ensure_rollup, load_buckets, volume_columns_from_buckets, volume_from_buckets
+from app.services.parallel import reduce_kpi
+from app.services.responses import KPIResponse, ndjson_response
+from app.services.snapshots import snapshot_store
+from app.services.timeparse import parse_hhmm
+from app.services.volume_engine import merge_columns, volume_report
+from app.services.workers import run_in_worker
+from typing import Dict, Any, Optional
+
+router = APIRouter(route_class=TimedRoute)
+
+@router.post("/volume")
+async def get_volume(payload: DateRequest, db: AsyncDatabase = Depends(get_async_db)) -> Dict[str, Any]:
+    """
+    Retrieves height, width, and length distributions + normal distribution
+    parameters, percentiles and outlier counts for parcels within a given
+    date and time range. With bin_width, also fixed-width histograms.
+    """
+    # Today's configured windows are precomputed in the background
+    result = snapshot_store.match("volume", payload)
+    if result is None:
+        result = await response_cache.get_or_compute(request_key("volume", payload), payload.date,
+                                                     lambda: compute_volume(payload, db))
+    # Encoded by orjson as it is, without FastAPI's jsonable_encoder pass
+    return KPIResponse(result)
+
+
+async def compute_volume(payload: DateRequest, db: AsyncDatabase) -> Dict[str, Any]:
+    date = payload.date
+    start_minute = parse_hhmm(payload.start_time)
+    end_minute = parse_hhmm(payload.end_time)
+
+    validate_bin_width(payload.bin_width)
+    if start_minute is None or end_minute is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Time format must be HH:MM"
+        )
+
+    # Ensure collection exists
+    if not await collection_catalog.exists(db, date):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No collection found for date {date}"
+        )
+
+    collection = db[date]
+    if await collection.find_one({}, {"_id": 1}) is None:
+        return {"message": "No data found for this date"}
+
+    # Closed days are answered from the per-minute rollup (registerTS minute in [start, end])
+    if await run_in_worker(ensure_rollup, get_db(), date):
+        return volume_from_buckets(await load_buckets(db, date, start_minute, end_minute), payload.bin_width)
+
+    columns = await reduce_kpi(collection, "volume", start_minute, end_minute)
+    return await run_in_worker(volume_report, columns, payload.bin_width)
+
+
+def volume_from_profile(payload: DateRequest, profile: DayProfile) -> Dict[str, Any]:
+    """compute_volume's response for a window of today, sliced from the snapshot refresh's day profile."""
+    columns = profile.volume_columns(parse_hhmm(payload.start_time), parse_hhmm(payload.end_time))
+    return volume_report(columns, payload.bin_width)
+
+
+def validate_bin_width(bin_width: Optional[float]) -> None:
+    if bin_width is not None and bin_width <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="bin_width must be positive"
+        )
+
+
+async def volume_columns(db: AsyncDatabase, date: str, start_minute: int, end_minute: int) -> Dict[str, Any]:
+    """Mergeable dimension value counts of one date collection, registerTS minute in [start_minute, end_minute]."""
+    if await run_in_worker(ensure_rollup, get_db(), date):
+        return volume_columns_from_buckets(await load_buckets(db, date, start_minute, end_minute))
+    return await reduce_kpi(db[date], "volume", start_minute, end_minute)
+
+
+@router.post("/volume/range")
+async def get_volume_range(payload: RangeRequest, db: AsyncDatabase = Depends(get_async_db)):
+    """
+    Dimension distributions for every shift of date_from..date_to, streamed
+    as NDJSON: one line per shift as it completes, then the aggregate over
+    all shifts. Histograms, moments and percentiles of the aggregate are
+    computed from the merged value counts, not averaged across days.
+    """
+    validate_bin_width(payload.bin_width)
+    try:
+        window = parse_range(payload.date_from, payload.date_to, payload.start_time, payload.end_time)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    existing = await collection_catalog.names(db)
+
+    async def shift_columns(shift: str) -> Optional[Dict[str, Any]]:
+        segments = [segment for segment in shift_segments(window, shift) if segment.date in existing]
+        if not segments:
+            return None
+        return merge_columns(await asyncio.gather(*(
+            volume_columns(db, s.date, s.start_ms // 60_000, s.end_ms // 60_000) for s in segments
+        )))
+
+    async def lines():
+        shifts = []
+        async for shift, columns in fan_out(window.shifts, shift_columns):
+            if columns is None:
+                yield {"date": shift, "message": f"No collection found for date {shift}"}
+                continue
+            shifts.append(columns)
+            yield {"date": shift, **volume_report(columns, payload.bin_width)}
+        yield {
+            "date_from": payload.date_from,
+            "date_to": payload.date_to,
+            "days": len(shifts),
+            "aggregate": volume_report(merge_columns(shifts), payload.bin_width),
+        }
+
+    return ndjson_response(lines())
@@ -0,0 +1,124 @@
+# app/services/cache.py
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from pydantic import BaseModel
+
+from app.services.metrics import mark_cache
+from app.services.siteclock import site_clock
+
+
+class ResultCache:
+    """
+    In-process LRU cache for KPI responses.
+
+    Entries for closed dates (app.services.siteclock) live for `past_ttl`
+    seconds, entries for today's date and others still open for `today_ttl`. Concurrent misses on the same key are coalesced:
+    the first caller computes, the others wait for its result.
+    """
+
+    def __init__(self, max_entries: int = 256, past_ttl: float = 3600, today_ttl: float = 15):
+        self.max_entries = max_entries
+        self.past_ttl = past_ttl
+        self.today_ttl = today_ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, str, Any]]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    async def get_or_compute(self, key: Hashable, date: str, compute: Callable[[], Awaitable[Any]]) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, _, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    mark_cache("hit")
+                    return value
+                del self._entries[key]
+
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = self._inflight[key] = asyncio.get_running_loop().create_future()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+        mark_cache("miss" if leader else "coalesced")
+
+        if not leader:
+            # shield: a cancelled follower must not cancel the leader's computation
+            return await asyncio.shield(future)
+
+        try:
+            value = await compute()
+        except asyncio.CancelledError:
+            with self._lock:
+                del self._inflight[key]
+            future.cancel()
+            raise
+        except Exception as e:
+            with self._lock:
+                del self._inflight[key]
+            future.set_exception(e)
+            # Mark the exception as retrieved when nobody else was waiting for it
+            future.exception()
+            raise
+
+        ttl = self.past_ttl if site_clock.is_closed(date) else self.today_ttl
+        with self._lock:
+            del self._inflight[key]
+            if ttl > 0:
+                self._entries[key] = (time.monotonic() + ttl, date, value)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+        future.set_result(value)
+        return value
+
+    def invalidate(self, date: Optional[str] = None) -> int:
+        """Drops every entry of `date`, or everything when no date is given."""
+        with self._lock:
+            if date is None:
+                dropped = len(self._entries)
+                self._entries.clear()
+                return dropped
+            keys = [key for key, (_, entry_date, _) in self._entries.items() if entry_date == date]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "hit_ratio": round((self.hits + self.coalesced) / lookups, 4) if lookups else 0.0,
+            }
+
+
+def request_key(endpoint: str, payload: BaseModel) -> Hashable:
+    """Cache key for a route and its request model, independent of field order."""
+    return (endpoint, tuple(sorted((k, tuple(v) if isinstance(v, list) else v)
+                                   for k, v in payload.model_dump().items())))
+
+
+response_cache = ResultCache(
+    max_entries=int(os.getenv("CACHE_MAX_ENTRIES", "256")),
+    past_ttl=float(os.getenv("CACHE_TTL_PAST_SECONDS", "3600")),
+    today_ttl=float(os.getenv("CACHE_TTL_TODAY_SECONDS", "15")),
+)
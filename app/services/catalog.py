@@ -0,0 +1,110 @@
+# app/services/catalog.py
+"""
+Which date collections exist, without a listCollections round-trip per request.
+
+The catalog keeps the collection names of the database for
+CATALOG_TTL_SECONDS. A name that is not in the catalog triggers one
+refresh, at most every CATALOG_MISS_REFRESH_SECONDS, so a collection
+created during the day is found on its first request while clients probing
+dates that do not exist cannot turn every request into a listing.
+
+It also keeps the /dates statistics of each date collection: for good once
+the site clock has closed the date, for CATALOG_TTL_SECONDS before that.
+They are dropped with the collection's name when it disappears.
+"""
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+from pymongo import ASCENDING, DESCENDING
+from pymongo.asynchronous.database import AsyncDatabase
+
+from app.services.metrics import stage
+from app.services.siteclock import site_clock
+
+CATALOG_TTL_SECONDS = float(os.getenv("CATALOG_TTL_SECONDS", "60"))
+CATALOG_MISS_REFRESH_SECONDS = float(os.getenv("CATALOG_MISS_REFRESH_SECONDS", "2"))
+
+
+class CollectionCatalog:
+    def __init__(self, ttl: float = CATALOG_TTL_SECONDS, miss_refresh: float = CATALOG_MISS_REFRESH_SECONDS):
+        self.ttl = ttl
+        self.miss_refresh = miss_refresh
+        self._names: Optional[Set[str]] = None
+        self._refreshed_at = 0.0
+        self._lock = asyncio.Lock()
+        # date -> (expires at, or None once closed; date_stats())
+        self._stats: Dict[str, Tuple[Optional[float], Dict[str, Any]]] = {}
+        self.refreshes = 0
+        self.hits = 0
+        self.misses = 0
+
+    async def _refresh(self, db: AsyncDatabase, max_age: float) -> Set[str]:
+        # Concurrent refreshes are coalesced: whoever waited on the lock reuses the fresh listing
+        async with self._lock:
+            if self._names is None or time.monotonic() - self._refreshed_at >= max_age:
+                with stage("check"):
+                    self._names = set(await db.list_collection_names())
+                for name in set(self._stats) - self._names:
+                    del self._stats[name]
+                self._refreshed_at = time.monotonic()
+                self.refreshes += 1
+            return self._names
+
+    async def names(self, db: AsyncDatabase) -> Set[str]:
+        if self._names is not None and time.monotonic() - self._refreshed_at < self.ttl:
+            return self._names
+        return await self._refresh(db, self.ttl)
+
+    async def exists(self, db: AsyncDatabase, name: str) -> bool:
+        if name in await self.names(db):
+            self.hits += 1
+            return True
+        self.misses += 1
+        return name in await self._refresh(db, self.miss_refresh)
+
+    async def date_stats(self, db: AsyncDatabase, date: str) -> Dict[str, Any]:
+        entry = self._stats.get(date)
+        if entry is not None and (entry[0] is None or time.monotonic() < entry[0]):
+            return entry[1]
+        stats = await date_stats(db, date)
+        self._stats[date] = (None if site_clock.is_closed(date) else time.monotonic() + self.ttl, stats)
+        return stats
+
+    def invalidate(self) -> None:
+        self._names = None
+        self._stats.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "collections": len(self._names) if self._names is not None else None,
+            "date_stats": len(self._stats),
+            "age_seconds": round(time.monotonic() - self._refreshed_at, 1) if self._names is not None else None,
+            "refreshes": self.refreshes,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+async def date_stats(db: AsyncDatabase, date: str) -> Dict[str, Any]:
+    """
+    Parcel count and first/last registerTS of a date collection. Both ends
+    are read through an index: registerTS's once app.jobs.materialize has
+    created it, otherwise _id's, i.e. the first and last parcel inserted.
+    """
+    collection = db[date]
+    indexes = await collection.index_information()
+    order = "registerTS" if any(index["key"][0][0] == "registerTS" for index in indexes.values()) else "_id"
+    registered = {"registerTS": {"$type": "string"}}
+    first = await collection.find_one(registered, {"_id": 0, "registerTS": 1}, sort=[(order, ASCENDING)])
+    last = await collection.find_one(registered, {"_id": 0, "registerTS": 1}, sort=[(order, DESCENDING)])
+    return {
+        "date": date,
+        "count": await collection.estimated_document_count(),
+        "first_register_ts": first["registerTS"] if first else None,
+        "last_register_ts": last["registerTS"] if last else None,
+    }
+
+
+collection_catalog = CollectionCatalog()
@@ -0,0 +1,336 @@
+# app/services/columnar.py
+"""
+Columnar exports of date collections and the KPI engines run on them.
+
+An export is a directory per date holding one .npy file per column, so
+every column can be memory-mapped and a year of days analysed without a
+database:
+
+    <root>/<date>/meta.json
+    <root>/<date>/parcels/<column>.npy   one row per parcel
+    <root>/<date>/events/<column>.npy    one row per event, ordered by parcel then position
+
+Missing times are stored as -1 and missing strings as "". Overflow is not
+exported: it depends on overflow_locations, so the engines derive it from
+the events table with whatever locations they are given, which is what
+makes it possible to backtest overflow rules. Everything else is
+classified with the kpi_rules in force at export, and an export made
+under other rules has to be redone.
+"""
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Collection, Dict, Iterable, Tuple
+
+import numpy as np
+from pymongo.collection import Collection as MongoCollection
+
+from app.services.kpi_rules import ROLE_FLAGS, FlagRule, Match, kpi_rules
+from app.services.parcel_record import OVERFLOW_NONE, SOURCE_PROJECTION, classify_parcel
+from app.services.throughput_engine import minute_counts
+from app.services.timeparse import MISSING_MS, parse_ms_many
+from app.services.volume_engine import DIMENSIONS, VOLUME_PROJECTION, value_counts
+
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+
+# Bump when the layout of an export changes
+COLUMNAR_VERSION = 3
+
+MISSING = MISSING_MS
+
+PARCEL_TIMES = ("register_ms", "in_ms", "sort_ms", "dereg_ms", "out_ms")
+PARCEL_FLAGS = ("has_2", "has_3", "has_6", "has_7", "is_sorted", "barcode_read", "volume_valid")
+PARCEL_STRINGS = ("host_id", "status", "sort_code", "sort_status", "dereg_reason", "dereg_location")
+
+# Event attributes and raw telegram fields the kpi_rules can test, exported as event columns
+EVENT_ATTRIBUTES = kpi_rules.event_attributes
+RAW_COLUMNS = kpi_rules.raw_columns
+EVENT_STRINGS = ("msg_id", *EVENT_ATTRIBUTES, *RAW_COLUMNS)
+
+# msg_id -> (column, telegram position) of each raw column; a field the event's role lacks stays ""
+RAW_POSITIONS = {
+    msg_id: tuple((name, role.raw_fields[name]) for name in RAW_COLUMNS if name in role.raw_fields)
+    for role in kpi_rules.roles.values() for msg_id in role.msg_ids
+}
+
+
+def _text(value: Any) -> str:
+    return value if isinstance(value, str) else ""
+
+
+def _time(ms: Any) -> int:
+    return MISSING if ms is None else ms
+
+
+# ---------------------------------------------------------------------------
+# Export
+# ---------------------------------------------------------------------------
+
+class ColumnarWriter:
+    """
+    Flattens parcel documents into columns. Every chunk_size parcels the
+    columns are spooled to <path>/.chunks and only joined into the final
+    .npy files by save(), so memory stays bounded by one chunk however
+    large the day is.
+    """
+
+    def __init__(self, path: Path, chunk_size: int = 50_000):
+        self.path = Path(path)
+        self.spool = self.path / ".chunks"
+        self.chunk_size = chunk_size
+        self.chunks = 0
+        self.rows = {"parcels": 0, "events": 0}
+        # table.column -> dtype of every spooled chunk
+        self.dtypes: Dict[str, list] = {}
+        # Left over by an export that did not finish
+        shutil.rmtree(self.spool, ignore_errors=True)
+        self._reset()
+
+    def _reset(self) -> None:
+        self.parcels: Dict[str, list] = {name: [] for name in PARCEL_TIMES + PARCEL_FLAGS + PARCEL_STRINGS}
+        for dim in DIMENSIONS:
+            self.parcels[dim] = []
+            self.parcels[f"{dim}_present"] = []
+        self.events: Dict[str, list] = {name: [] for name in ("parcel", "position", "ts_ms", *EVENT_STRINGS)}
+
+    def add(self, docs: Iterable[Dict[str, Any]]) -> None:
+        for doc in docs:
+            self._add(doc)
+            if len(self.parcels["register_ms"]) >= self.chunk_size:
+                self._flush()
+
+    def _add(self, doc: Dict[str, Any]) -> None:
+        parcels, events = self.parcels, self.events
+        row = self.rows["parcels"] + len(parcels["register_ms"])
+        # Overflow is left to the reader, so no locations are needed here
+        r = classify_parcel(doc, ())
+        for name in PARCEL_TIMES:
+            parcels[name].append(_time(getattr(r, name)))
+        for name in PARCEL_FLAGS:
+            parcels[name].append(bool(getattr(r, name)))
+        parcels["host_id"].append(str(r.host_id) if r.host_id else "")
+        parcels["status"].append(_text(r.status))
+        for name in ("sort_code", "sort_status", "dereg_reason", "dereg_location"):
+            parcels[name].append(_text(getattr(r, name)))
+
+        volume = doc.get("volume_data") or {}
+        for dim in DIMENSIONS:
+            value = volume.get(dim) if isinstance(volume, dict) else None
+            parcels[dim].append(value if value is not None else 0)
+            parcels[f"{dim}_present"].append(value is not None)
+
+        separator = kpi_rules.separator
+        for position, event in enumerate(doc.get("events") or ()):
+            msg_id = event.get("msg_id")
+            raw = event.get("raw")
+            parts = raw.split(separator) if isinstance(raw, str) else []
+            events["parcel"].append(row)
+            events["position"].append(position)
+            events["msg_id"].append(_text(msg_id))
+            # Parsed per column in _arrays
+            events["ts_ms"].append(event.get("ts"))
+            for name in EVENT_ATTRIBUTES:
+                events[name].append(_text(event.get(name)))
+            fields = dict(RAW_POSITIONS.get(msg_id, ()))
+            for name in RAW_COLUMNS:
+                index = fields.get(name)
+                events[name].append(parts[index] if index is not None and len(parts) > index else "")
+
+    def _arrays(self, columns: Dict[str, list]) -> Dict[str, np.ndarray]:
+        arrays = {}
+        for name, values in columns.items():
+            if name in PARCEL_STRINGS or name in EVENT_STRINGS:
+                arrays[name] = np.array(values, dtype=str)
+            elif name in PARCEL_FLAGS or name.endswith("_present"):
+                arrays[name] = np.array(values, dtype=bool)
+            elif name == "ts_ms":
+                arrays[name] = parse_ms_many(values)
+            elif name in DIMENSIONS:
+                # int64 when every value is an int so histogram keys keep their type, as in VolumeAccumulator;
+                # a column is float as soon as one of its chunks is
+                present = [v for v, ok in zip(values, columns[f"{name}_present"]) if ok]
+                all_int = all(type(v) is int for v in present)
+                arrays[name] = np.array(values, dtype=np.int64 if all_int else float)
+            else:
+                arrays[name] = np.array(values, dtype=np.int64)
+        return arrays
+
+    def _flush(self) -> None:
+        for table, columns in (("parcels", self.parcels), ("events", self.events)):
+            for name, array in self._arrays(columns).items():
+                directory = self.spool / table / name
+                directory.mkdir(parents=True, exist_ok=True)
+                np.save(directory / f"{self.chunks:05d}.npy", array)
+                self.dtypes.setdefault(f"{table}.{name}", []).append(array.dtype)
+        self.rows["parcels"] += len(self.parcels["register_ms"])
+        self.rows["events"] += len(self.events["parcel"])
+        self.chunks += 1
+        self._reset()
+
+    def _join(self, table: str, name: str) -> np.dtype:
+        """Copies the spooled chunks of one column into its .npy file, one chunk at a time."""
+        target = self.path / table / f"{name}.npy"
+        # The widest string, or float over int64, as np.array over the whole column would pick
+        dtype = np.result_type(*self.dtypes[f"{table}.{name}"])
+        rows = self.rows[table]
+        if rows == 0:
+            np.save(target, np.empty(0, dtype=dtype))
+            return dtype
+        out = np.lib.format.open_memmap(target, mode="w+", dtype=dtype, shape=(rows,))
+        offset = 0
+        for chunk in sorted((self.spool / table / name).glob("*.npy")):
+            values = np.load(chunk)
+            out[offset:offset + len(values)] = values
+            offset += len(values)
+        out.flush()
+        del out
+        return dtype
+
+    def save(self, date: str) -> Dict[str, Any]:
+        if self.parcels["register_ms"] or not self.chunks:
+            self._flush()
+        meta = {"version": COLUMNAR_VERSION, "rules": kpi_rules.fingerprint, "date": date,
+                "parcels": self.rows["parcels"], "events": self.rows["events"], "columns": {}}
+        for table, columns in (("parcels", self.parcels), ("events", self.events)):
+            (self.path / table).mkdir(parents=True, exist_ok=True)
+            for name in columns:
+                meta["columns"][f"{table}.{name}"] = self._join(table, name).str
+        shutil.rmtree(self.spool, ignore_errors=True)
+        (self.path / "meta.json").write_text(json.dumps(meta, indent=2))
+        return meta
+
+
+def export_collection(collection: MongoCollection, root: str = EXPORT_DIR, batch_size: int = 2000,
+                      chunk_size: int = 50_000) -> Dict[str, Any]:
+    """Writes one date collection to <root>/<collection name>, chunk_size parcels at a time."""
+    writer = ColumnarWriter(Path(root) / collection.name, chunk_size)
+    writer.add(collection.find({}, {**SOURCE_PROJECTION, **VOLUME_PROJECTION}, batch_size=batch_size))
+    return writer.save(collection.name)
+
+
+# ---------------------------------------------------------------------------
+# Offline engines
+# ---------------------------------------------------------------------------
+
+class ColumnarDay:
+    """A memory-mapped export of one date; columns are only read when used."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.meta = json.loads((self.path / "meta.json").read_text())
+        if self.meta.get("version") != COLUMNAR_VERSION:
+            raise ValueError(f"{self.path} is export version {self.meta.get('version')}, "
+                             f"expected {COLUMNAR_VERSION}; re-export it")
+        if self.meta.get("rules") != kpi_rules.fingerprint:
+            raise ValueError(f"{self.path} was exported under other kpi_rules; re-export it")
+        self.date = self.meta["date"]
+        self._columns: Dict[str, np.ndarray] = {}
+
+    def _load(self, table: str, name: str) -> np.ndarray:
+        key = f"{table}.{name}"
+        if key not in self._columns:
+            self._columns[key] = np.load(self.path / table / f"{name}.npy", mmap_mode="r")
+        return self._columns[key]
+
+    def parcel(self, name: str) -> np.ndarray:
+        return self._load("parcels", name)
+
+    def event(self, name: str) -> np.ndarray:
+        return self._load("events", name)
+
+
+def _first_per_parcel(mask: np.ndarray, parcel: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Events are stored in order, so the first occurrence of a parcel is its earliest matching event
+    parcels, first = np.unique(parcel[mask], return_index=True)
+    return parcels, values[mask][first]
+
+
+def _match_mask(day: ColumnarDay, m: Match, locations: np.ndarray) -> np.ndarray:
+    """The events a kpi_rules `where` matches."""
+    mask = np.isin(day.event("msg_id"), np.array(kpi_rules.roles[m.role].msg_ids, dtype=str))
+    for c in m.conditions:
+        values = locations if c.values is None else np.array(sorted(c.values), dtype=str)
+        mask &= np.isin(day.event(c.field), values)
+    return mask
+
+
+def overflow_columns(day: ColumnarDay, overflow_locations: Collection[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Per-parcel overflow kind and time, classified as classify_parcel does for these locations."""
+    n = day.meta["parcels"]
+    kind = np.full(n, OVERFLOW_NONE, dtype=np.int8)
+    ms = np.full(n, MISSING, dtype=np.int64)
+    if not day.meta["events"]:
+        return kind, ms
+    parcel, ts_ms = day.event("parcel"), day.event("ts_ms")
+    locations = np.array(sorted(overflow_locations), dtype=str)
+
+    # Later rules first, so that an earlier rule matching the same parcel takes precedence
+    for i in reversed(range(len(kpi_rules.overflow))):
+        rule = kpi_rules.overflow[i]
+        parcels, times = _first_per_parcel(_match_mask(day, rule.match, locations), parcel, ts_ms)
+        keep = np.ones(len(parcels), dtype=bool)
+        for role in rule.requires:
+            keep &= day.parcel(ROLE_FLAGS[role])[parcels]
+        kind[parcels[keep]], ms[parcels[keep]] = i + 1, times[keep]
+    return kind, ms
+
+
+def _flag_count(day: ColumnarDay, rule: FlagRule, selected: np.ndarray) -> int:
+    """How many selected parcels pass an in_system or tracking rule."""
+    mask = selected.copy()
+    for role in rule.all:
+        mask &= day.parcel(ROLE_FLAGS[role])
+    for role in rule.none:
+        mask &= ~day.parcel(ROLE_FLAGS[role])
+    return int(mask.sum())
+
+
+def _in_window(times: np.ndarray, start_ms: int, end_ms: int) -> np.ndarray:
+    return (times != MISSING) & (times >= start_ms) & (times <= end_ms)
+
+
+def summary_totals(day: ColumnarDay, start_ms: int, end_ms: int, overflow_locations: Collection[str]) -> Dict[str, Any]:
+    """The mergeable /summary counters of SummaryAccumulator.totals()."""
+    selected = _in_window(day.parcel("register_ms"), start_ms, end_ms)
+    hosts = day.parcel("host_id")[selected]
+    in_ms = day.parcel("in_ms")[selected]
+    in_ms = in_ms[in_ms != MISSING]
+    overflow_kind, _ = overflow_columns(day, overflow_locations)
+
+    return {
+        "hosts": len(np.unique(hosts[hosts != ""])),
+        "total_in_system": _flag_count(day, kpi_rules.in_system, selected),
+        "sorted_parcels": int(day.parcel("is_sorted")[selected].sum()),
+        "overflow": int((overflow_kind[selected] != OVERFLOW_NONE).sum()),
+        "barcode_read": int(day.parcel("barcode_read")[selected].sum()),
+        "volume_valid": int(day.parcel("volume_valid")[selected].sum()),
+        "tracking_ok": _flag_count(day, kpi_rules.tracking, selected),
+        "in_count": len(in_ms),
+        "in_min": int(in_ms.min()) if len(in_ms) else None,
+        "in_max": int(in_ms.max()) if len(in_ms) else None,
+    }
+
+
+def throughput_counts(day: ColumnarDay, start_ms: int, end_ms: int,
+                      overflow_locations: Collection[str]) -> Dict[str, Any]:
+    """The per-minute counts of ThroughputAccumulator.result()."""
+    n_minutes = (end_ms - start_ms) // 60_000
+    in_ms, out_ms = day.parcel("in_ms"), day.parcel("out_ms")
+    in_per_minute = minute_counts(in_ms[_in_window(in_ms, start_ms, end_ms)], start_ms, n_minutes)
+    out_per_minute = minute_counts(out_ms[_in_window(out_ms, start_ms, end_ms)], start_ms, n_minutes)
+    overflow_kind, overflow_ms = overflow_columns(day, overflow_locations)
+    return {
+        "total_in": int(in_per_minute.sum()),
+        "total_out": int(out_per_minute.sum()),
+        "overflow": int(((overflow_kind != OVERFLOW_NONE) & _in_window(overflow_ms, start_ms, end_ms)).sum()),
+        "in_per_minute": in_per_minute,
+        "out_per_minute": out_per_minute,
+    }
+
+
+def volume_columns(day: ColumnarDay, start_minute: int, end_minute: int) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """The dimension value counts of VolumeAccumulator.columns() for registerTS minutes in [start, end]."""
+    register_ms = day.parcel("register_ms")
+    selected = (register_ms >= start_minute * 60_000) & (register_ms <= end_minute * 60_000 + 59_999)
+    return {dim: value_counts(day.parcel(dim)[selected & day.parcel(f"{dim}_present")]) for dim in DIMENSIONS}
@@ -0,0 +1,158 @@
+# app/services/compression.py
+"""
+Negotiated gzip/brotli compression of HTTP responses.
+
+A response is compressed when the client accepts br or gzip
+(Accept-Encoding, q-values honoured; br is preferred when the brotli
+package is installed) and its body is at least COMPRESS_MIN_BYTES.
+Streamed responses such as NDJSON are compressed chunk by chunk and
+flushed after every chunk, so each line still reaches the client as soon
+as it is produced. Server-sent events and bodies that already carry a
+Content-Encoding pass through unchanged.
+
+    COMPRESSION_ENABLED=0          turn it off
+    COMPRESS_MIN_BYTES=1024        smaller complete bodies are sent as they are
+    COMPRESS_GZIP_LEVEL=6
+    COMPRESS_BROTLI_QUALITY=4      brotli's default of 11 costs far too much CPU per response
+"""
+import os
+import zlib
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.services.metrics import stage
+
+try:
+    import brotli
+except ImportError:  # optional: without it only gzip is offered
+    brotli = None
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "1") == "1"
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.getenv("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.getenv("COMPRESS_BROTLI_QUALITY", "4"))
+
+# Compressing these would hold back events until a buffer fills on some proxies
+UNCOMPRESSED_TYPES = ("text/event-stream",)
+
+
+def accepted_encodings(header: str) -> Dict[str, float]:
+    """An Accept-Encoding header as {coding: q}."""
+    accepted = {}
+    for part in header.split(","):
+        coding, _, params = part.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate(header: str) -> Optional[str]:
+    """"br", "gzip" or None (send uncompressed) for an Accept-Encoding header."""
+    accepted = accepted_encodings(header)
+    offered = ("br", "gzip") if brotli is not None else ("gzip",)
+    best, best_q = None, 0.0
+    for coding in offered:
+        q = accepted.get(coding, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class Compressor:
+    """An incremental gzip or brotli stream."""
+
+    def __init__(self, encoding: str, gzip_level: int = COMPRESS_GZIP_LEVEL,
+                 brotli_quality: int = COMPRESS_BROTLI_QUALITY):
+        self.encoding = encoding
+        if encoding == "br":
+            self._stream = brotli.Compressor(quality=brotli_quality)
+        else:
+            self._stream = zlib.compressobj(gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool = True) -> bytes:
+        """The compressed form of `data`, flushed so the client can decode everything sent so far."""
+        if self.encoding == "br":
+            return self._stream.process(data) + (self._stream.finish() if final else self._stream.flush())
+        return self._stream.compress(data) + self._stream.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    def __init__(self, app: ASGIApp, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        encoding = None
+        if scope["type"] == "http" and COMPRESSION_ENABLED:
+            encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSend(send, encoding, self.minimum_size))
+
+
+class _CompressingSend:
+    """The send() of one response: holds back its start until the first body chunk shows whether to compress."""
+
+    def __init__(self, send: Send, encoding: str, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Optional[Message] = None
+        self.compressor: Optional[Compressor] = None
+        self.passthrough = False
+
+    async def __call__(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            headers = MutableHeaders(raw=start["headers"])
+            if not self._compressible(headers, body, more_body):
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            self.compressor = Compressor(self.encoding)
+            with stage("compress"):
+                body = self.compressor.compress(body, final=not more_body)
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if more_body:
+                # A streamed body's length is only known at the end
+                if "content-length" in headers:
+                    del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(body))
+            await self.send(start)
+        else:
+            with stage("compress"):
+                body = self.compressor.compress(body, final=not more_body)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    def _compressible(self, headers: MutableHeaders, body: bytes, more_body: bool) -> bool:
+        if "content-encoding" in headers:
+            return False
+        if headers.get("content-type", "").startswith(UNCOMPRESSED_TYPES):
+            return False
+        # A stream is compressed whatever its first chunk; a complete body only when it is worth it
+        return more_body or len(body) >= self.minimum_size
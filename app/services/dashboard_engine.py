@@ -0,0 +1,48 @@
+# app/services/dashboard_engine.py
+from typing import Any, Collection, Dict, Iterable, Tuple
+
+import numpy as np
+
+from app.services.parcel_record import RECORD_PROJECTION, classify_parcel
+from app.services.summary_engine import SummaryAccumulator
+from app.services.throughput_engine import ThroughputAccumulator
+from app.services.timeparse import MISSING_MS
+from app.services.volume_engine import VOLUME_PROJECTION, VolumeAccumulator
+
+DASHBOARD_SECTIONS = ("summary", "throughput", "volume")
+
+# Everything the three accumulators read, fetched once
+DASHBOARD_PROJECTION = {**RECORD_PROJECTION, **VOLUME_PROJECTION}
+
+
+class DashboardAccumulator:
+    """
+    The /summary, /throughput and /volume accumulators of one DateRequest,
+    fed from a single pass: every parcel is classified once and the record
+    is shared by the selected sections.
+    """
+
+    def __init__(self, sections: Tuple[str, ...], start_ms: int, end_ms: int, overflow_locations: Collection[str]):
+        self.overflow_locations = overflow_locations
+        self.sections: Dict[str, Any] = {}
+        if "summary" in sections:
+            self.sections["summary"] = SummaryAccumulator(start_ms, end_ms, overflow_locations)
+        if "throughput" in sections:
+            self.sections["throughput"] = ThroughputAccumulator(start_ms, end_ms, overflow_locations)
+        if "volume" in sections:
+            # /volume windows are whole minutes with the end minute included
+            self.sections["volume"] = VolumeAccumulator(start_ms // 60_000, end_ms // 60_000)
+
+    def add(self, parcels: Iterable[Dict[str, Any]]) -> None:
+        parcels = parcels if isinstance(parcels, list) else list(parcels)
+        records = [classify_parcel(parcel, self.overflow_locations) for parcel in parcels]
+        if "summary" in self.sections:
+            summary = self.sections["summary"]
+            for record in records:
+                summary.add_record(record)
+        if "throughput" in self.sections:
+            self.sections["throughput"].add_records(records)
+        if "volume" in self.sections:
+            register_ms = np.fromiter((MISSING_MS if r.register_ms is None else r.register_ms for r in records),
+                                      dtype=np.int64, count=len(records))
+            self.sections["volume"].add_registered(parcels, register_ms)
@@ -0,0 +1,168 @@
+# app/services/day_engine.py
+"""
+Per-minute KPI counters of a whole day, from one pass over its parcels.
+
+Any window of whole minutes is then sliced out of the DayProfile without
+another pass, with the same numbers the per-window accumulators give:
+
+    summary_totals(s, e)     SummaryAccumulator.totals(), registerTS in [s:00.000, e:00.000]
+    throughput_counts(s, e)  ThroughputAccumulator.result() for the same bounds
+    volume_columns(s, e)     VolumeAccumulator.columns(), registerTS minute in [s, e]
+
+Summary and throughput windows include the single millisecond their end
+minute starts at, so besides the counts per minute the profile keeps those
+of the parcels stamped exactly on a minute's first millisecond.
+"""
+from collections import defaultdict
+from typing import Any, Collection, Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+
+from app.services.parcel_record import classify_parcel
+from app.services.summary_engine import SummaryAccumulator, merge_summary_totals
+from app.services.volume_engine import DIMENSIONS, counts_from_histogram
+
+MINUTES_PER_DAY = 24 * 60
+
+# (SummaryAccumulator.totals(), distinct hostIds) of one minute
+MinuteSummary = Tuple[Dict[str, Any], Set[Any]]
+
+
+def _minute_counts(times_ms: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """Times per minute of the day, and of those exactly on the minute's first millisecond."""
+    times = np.asarray(times_ms, dtype=np.int64)
+    times = times[(times >= 0) & (times < MINUTES_PER_DAY * 60_000)]
+    minutes, offsets = np.divmod(times, 60_000)
+    return (np.bincount(minutes, minlength=MINUTES_PER_DAY),
+            np.bincount(minutes[offsets == 0], minlength=MINUTES_PER_DAY))
+
+
+class DayProfile:
+    """The mergeable result of a DayAccumulator."""
+
+    def __init__(self):
+        self.summary: Dict[int, MinuteSummary] = {}
+        self.summary_at: Dict[int, MinuteSummary] = {}
+        # (per minute, on the minute's first millisecond)
+        self.counts = {name: (np.zeros(MINUTES_PER_DAY, dtype=np.int64), np.zeros(MINUTES_PER_DAY, dtype=np.int64))
+                       for name in ("in", "out", "overflow")}
+        # dimension -> registerTS minute -> value -> parcels
+        self.volume: Dict[str, Dict[int, Dict[Any, int]]] = {dim: {} for dim in DIMENSIONS}
+
+    @classmethod
+    def merge(cls, parts: List["DayProfile"]) -> "DayProfile":
+        """Adds up the profiles of disjoint sets of parcels, e.g. the _id ranges of app.services.parallel."""
+        merged = cls()
+        for part in parts:
+            for own, other in ((merged.summary, part.summary), (merged.summary_at, part.summary_at)):
+                for minute, (totals, hosts) in other.items():
+                    if minute in own:
+                        own_totals, own_hosts = own[minute]
+                        own[minute] = (merge_summary_totals([own_totals, totals]), own_hosts | hosts)
+                    else:
+                        own[minute] = (totals, set(hosts))
+            for name, (per_minute, at) in part.counts.items():
+                merged.counts[name][0][:] += per_minute
+                merged.counts[name][1][:] += at
+            for dim, minutes in part.volume.items():
+                for minute, histogram in minutes.items():
+                    target = merged.volume[dim].setdefault(minute, defaultdict(int))
+                    for value, count in histogram.items():
+                        target[value] += count
+        return merged
+
+    def summary_totals(self, start_minute: int, end_minute: int) -> Dict[str, Any]:
+        parts = [self.summary[m] for m in range(start_minute, end_minute) if m in self.summary]
+        if end_minute in self.summary_at:
+            parts.append(self.summary_at[end_minute])
+        totals = merge_summary_totals(part for part, _ in parts)
+        totals["hosts"] = len(set().union(*(hosts for _, hosts in parts)))
+        return totals
+
+    def throughput_counts(self, start_minute: int, end_minute: int) -> Dict[str, Any]:
+        def window(name: str) -> np.ndarray:
+            per_minute, at = self.counts[name]
+            return np.append(per_minute[start_minute:end_minute], at[end_minute])
+
+        in_per_minute, out_per_minute = window("in"), window("out")
+        return {
+            "total_in": int(in_per_minute.sum()),
+            "total_out": int(out_per_minute.sum()),
+            "overflow": int(window("overflow").sum()),
+            "in_per_minute": in_per_minute,
+            "out_per_minute": out_per_minute,
+        }
+
+    def volume_columns(self, start_minute: int, end_minute: int) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        columns = {}
+        for dim, minutes in self.volume.items():
+            histogram = defaultdict(int)
+            for minute in range(start_minute, end_minute + 1):
+                for value, count in minutes.get(minute, {}).items():
+                    histogram[value] += count
+            columns[dim] = counts_from_histogram(histogram)
+        return columns
+
+
+class DayAccumulator:
+    """
+    Feeds the selected sections of a DayProfile from one pass; every
+    parcel is classified once, as in DashboardAccumulator.
+    """
+
+    def __init__(self, sections: Tuple[str, ...], overflow_locations: Collection[str]):
+        self.sections = sections
+        self.overflow_locations = overflow_locations
+        # Per registerTS minute, and for the parcels registered on its first millisecond
+        self.summary: Dict[int, SummaryAccumulator] = {}
+        self.summary_at: Dict[int, SummaryAccumulator] = {}
+        self._profile = DayProfile()
+
+    def _summary(self, accumulators: Dict[int, SummaryAccumulator], minute: int, end_ms: int) -> SummaryAccumulator:
+        accumulator = accumulators.get(minute)
+        if accumulator is None:
+            accumulator = accumulators[minute] = SummaryAccumulator(minute * 60_000, end_ms, self.overflow_locations)
+        return accumulator
+
+    def add(self, parcels: Iterable[Dict[str, Any]]) -> None:
+        parcels = parcels if isinstance(parcels, list) else list(parcels)
+        records = [classify_parcel(parcel, self.overflow_locations) for parcel in parcels]
+
+        if "summary" in self.sections:
+            for record in records:
+                if record.register_ms is None:
+                    continue
+                minute, offset = divmod(record.register_ms, 60_000)
+                self._summary(self.summary, minute, minute * 60_000 + 59_999).add_record(record)
+                if offset == 0:
+                    self._summary(self.summary_at, minute, minute * 60_000).add_record(record)
+
+        if "throughput" in self.sections:
+            times = {
+                "in": [r.in_ms for r in records if r.in_ms is not None],
+                "out": [r.out_ms for r in records if r.out_ms is not None],
+                "overflow": [r.overflow_ms for r in records if r.overflow and r.overflow_ms is not None],
+            }
+            for name, values in times.items():
+                if values:
+                    per_minute, at = _minute_counts(values)
+                    self._profile.counts[name][0][:] += per_minute
+                    self._profile.counts[name][1][:] += at
+
+        if "volume" in self.sections:
+            volume_by_dim = self._profile.volume
+            for parcel, record in zip(parcels, records):
+                if record.register_ms is None:
+                    continue
+                minute = record.register_ms // 60_000
+                volume = parcel.get("volume_data") or {}
+                for dim in DIMENSIONS:
+                    if (value := volume.get(dim)) is not None:
+                        volume_by_dim[dim].setdefault(minute, defaultdict(int))[value] += 1
+
+    def profile(self) -> DayProfile:
+        """The profile of every parcel added so far; also the partial of one _id range."""
+        profile = self._profile
+        profile.summary = {minute: (a.totals(), a.unique_hosts) for minute, a in self.summary.items()}
+        profile.summary_at = {minute: (a.totals(), a.unique_hosts) for minute, a in self.summary_at.items()}
+        return profile
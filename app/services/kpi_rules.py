@@ -0,0 +1,325 @@
+# app/services/kpi_rules.py
+"""
+The rules that turn parcel events into IN, OUT, overflow, in-system and
+tracking, declared under "kpi_rules" in config.json:
+
+    "kpi_rules": {
+        "raw_separator": "|",
+        "events": {
+            "in":             {"msg_id": "2"},
+            "identification": {"msg_id": "3"},
+            "sort":           {"msg_id": "6", "raw_fields": {"sort_status": 10}},
+            "dereg":          {"msg_id": "7", "raw_fields": {"dereg_reason": 9, "dereg_location": 11}}
+        },
+        "in_system": {"all": ["in"], "none": ["sort", "dereg"]},
+        "tracking": {"all": ["in", "identification", "sort"]},
+        "out": [
+            {"where": {"sort_code": ["1"]}},
+            {"where": {"sort_status": ["999"]}, "with": {"event": "dereg", "where": {"dereg_reason": ["2"]}}}
+        ],
+        "overflow": [
+            {"event": "sort", "where": {"sort_status": ["999"]}, "requires": ["in"]},
+            {"event": "dereg", "where": {"dereg_location": "$overflow_locations"}}
+        ]
+    }
+
+The four event roles are fixed, because the parcel record keeps one set of
+fields per role. Which msg_id (or msg_ids) plays each role, and where its
+fields sit in the raw telegram, is configured per site. The sort role must
+name a sort_status field and the dereg role dereg_reason and
+dereg_location, since the record keeps those.
+
+A `where` matches an event of its role when every named field has one of
+the listed values. A field is a raw_fields name of the role, or otherwise
+an attribute of the event such as sort_code. "$overflow_locations" stands
+for the overflow_locations in force.
+
+- `in_system` and `tracking` test which roles occur on a parcel.
+- `out` clauses test the parcel's first sort event. A clause's `with`
+  also needs some event of another role to match.
+- `overflow` rules are tried in order. The first one that matches, with
+  its `requires` roles present, gives the parcel's overflow kind (its
+  1-based position) and the time of its first matching event.
+
+Missing keys fall back to DEFAULT_RULES, the layout above. The section is
+checked and compiled once, at import; a malformed one raises ValueError.
+classify_parcel then looks up each event's role in a msg_id dispatch
+table and splits the telegram once, only as far as the last field it
+needs. The same rules render as MongoDB aggregation expressions for the
+summary pipeline.
+"""
+import hashlib
+import json
+from typing import Any, Callable, Collection, Dict, FrozenSet, List, NamedTuple, Optional, Sequence, Tuple
+
+from app.config import config
+
+ROLES = ("in", "identification", "sort", "dereg")
+
+# ParcelRecord flag telling that a role occurred; named after the default msg_ids
+ROLE_FLAGS = {"in": "has_2", "identification": "has_3", "sort": "has_6", "dereg": "has_7"}
+
+# Raw telegram fields the parcel record keeps, per role
+RECORD_RAW_FIELDS = {"sort": ("sort_status",), "dereg": ("dereg_reason", "dereg_location")}
+
+OVERFLOW_LOCATIONS = "$overflow_locations"
+
+DEFAULT_RULES = {
+    "raw_separator": "|",
+    "events": {
+        "in": {"msg_id": "2"},
+        "identification": {"msg_id": "3"},
+        "sort": {"msg_id": "6", "raw_fields": {"sort_status": 10}},
+        "dereg": {"msg_id": "7", "raw_fields": {"dereg_reason": 9, "dereg_location": 11}},
+    },
+    "in_system": {"all": ["in"], "none": ["sort", "dereg"]},
+    "tracking": {"all": ["in", "identification", "sort"]},
+    "out": [
+        {"where": {"sort_code": ["1"]}},
+        {"where": {"sort_status": ["999"]}, "with": {"event": "dereg", "where": {"dereg_reason": ["2"]}}},
+    ],
+    "overflow": [
+        {"event": "sort", "where": {"sort_status": ["999"]}, "requires": ["in"]},
+        {"event": "dereg", "where": {"dereg_location": OVERFLOW_LOCATIONS}},
+    ],
+}
+
+
+class Condition(NamedTuple):
+    field: str
+    index: Optional[int]               # position in the raw telegram; None for an event attribute
+    values: Optional[FrozenSet[str]]   # None stands for the overflow locations
+
+
+Predicate = Callable[[Dict[str, Any], Sequence[str], Collection[str]], bool]
+
+
+def _condition_test(condition: Condition) -> Predicate:
+    index, field, values = condition.index, condition.field, condition.values
+    if index is None:
+        if values is None:
+            return lambda event, parts, locations: isinstance(v := event.get(field), str) and v in locations
+        return lambda event, parts, locations: isinstance(v := event.get(field), str) and v in values
+    # Telegram fields are strings already
+    if values is None:
+        return lambda event, parts, locations: len(parts) > index and parts[index] in locations
+    return lambda event, parts, locations: len(parts) > index and parts[index] in values
+
+
+def _compile_test(conditions: Tuple[Condition, ...]) -> Predicate:
+    tests = [_condition_test(condition) for condition in conditions]
+    if len(tests) == 1:
+        return tests[0]
+    return lambda event, parts, locations: all(test(event, parts, locations) for test in tests)
+
+
+class Match(NamedTuple):
+    """A compiled `where` on the events of one role."""
+    role: str
+    conditions: Tuple[Condition, ...]
+    # test(event, raw telegram split up to Role.split, overflow locations)
+    test: Predicate
+
+
+class Role(NamedTuple):
+    name: str
+    msg_ids: Tuple[str, ...]
+    raw_fields: Dict[str, int]
+    split: int                                 # maxsplit reaching the last raw field any rule reads; 0: none
+    overflow: Tuple[Tuple[int, Match], ...]    # (rule index, match) of the overflow rules on this role
+    also: Tuple[Tuple[int, Match], ...]        # (clause index, match) of the out clauses' `with` on this role
+
+
+class FlagRule(NamedTuple):
+    """Roles that must, and must not, occur on a parcel."""
+    all: Tuple[str, ...]
+    none: Tuple[str, ...] = ()
+
+    def test(self, record: Any) -> bool:
+        return (all(getattr(record, ROLE_FLAGS[role]) for role in self.all)
+                and not any(getattr(record, ROLE_FLAGS[role]) for role in self.none))
+
+
+class OutClause(NamedTuple):
+    where: Match                # on the first sort event
+    also: Optional[int]         # index into KpiRules.also_matches, for a `with`
+
+
+class OverflowRule(NamedTuple):
+    match: Match
+    requires: Tuple[str, ...]
+
+
+def raw_field_expr(event: str, index: int, separator: str = "|") -> Dict[str, Any]:
+    """Aggregation expression for field `index` of an event's raw telegram."""
+    raw = f"{event}.raw"
+    return {"$arrayElemAt": [
+        {"$split": [{"$cond": [{"$eq": [{"$type": raw}, "string"]}, raw, ""]}, separator]},
+        index,
+    ]}
+
+
+def _roles(value: Any, what: str) -> Tuple[str, ...]:
+    roles = tuple(value or ())
+    unknown = [role for role in roles if role not in ROLES]
+    if unknown:
+        raise ValueError(f"KPI rules {what}: unknown event roles {unknown}. Choose from {list(ROLES)}")
+    return roles
+
+
+def _flag_rule(value: Any, what: str) -> FlagRule:
+    if not isinstance(value, dict) or not value.get("all"):
+        raise ValueError(f"KPI rules {what}: needs {{\"all\": [roles]}} and optionally \"none\"")
+    return FlagRule(_roles(value.get("all"), what), _roles(value.get("none"), what))
+
+
+class KpiRules:
+    """The compiled "kpi_rules" section."""
+
+    def __init__(self, section: Optional[Dict[str, Any]] = None):
+        rules = {**DEFAULT_RULES, **(section or {})}
+        # Materialized parcels and rollups record which rules they were classified with
+        self.fingerprint = hashlib.sha1(json.dumps(rules, sort_keys=True).encode()).hexdigest()[:12]
+
+        self.separator = rules["raw_separator"]
+        if not isinstance(self.separator, str) or not self.separator:
+            raise ValueError("KPI rules: raw_separator must be a non-empty string")
+
+        events = rules["events"]
+        if not isinstance(events, dict) or sorted(events) != sorted(ROLES):
+            raise ValueError(f"KPI rules: events must define exactly the roles {list(ROLES)}")
+        msg_ids, raw_fields = {}, {}
+        for role in ROLES:
+            spec = events[role]
+            ids = spec.get("msg_id")
+            ids = (ids,) if isinstance(ids, str) else tuple(ids or ())
+            if not ids or not all(isinstance(msg_id, str) for msg_id in ids):
+                raise ValueError(f"KPI rules: event {role} needs a msg_id string or a list of them")
+            taken = [msg_id for others in msg_ids.values() for msg_id in others]
+            if len(set(ids)) != len(ids) or set(ids) & set(taken):
+                raise ValueError(f"KPI rules: a msg_id of event {role} is given more than once")
+            msg_ids[role] = ids
+            fields = spec.get("raw_fields") or {}
+            if not all(isinstance(index, int) and index >= 0 for index in fields.values()):
+                raise ValueError(f"KPI rules: raw_fields of event {role} must be positions >= 0")
+            missing = [field for field in RECORD_RAW_FIELDS.get(role, ()) if field not in fields]
+            if missing:
+                raise ValueError(f"KPI rules: event {role} needs raw_fields {missing}")
+            raw_fields[role] = dict(fields)
+
+        def match(role: str, where: Any, what: str) -> Match:
+            if not isinstance(where, dict) or not where:
+                raise ValueError(f"KPI rules {what}: `where` needs at least one field")
+            conditions = []
+            for field, values in where.items():
+                if values == OVERFLOW_LOCATIONS:
+                    accepted = None
+                elif isinstance(values, list) and values and all(isinstance(value, str) for value in values):
+                    accepted = frozenset(values)
+                else:
+                    raise ValueError(f"KPI rules {what}: {field} needs a list of strings or {OVERFLOW_LOCATIONS!r}")
+                conditions.append(Condition(field, raw_fields[role].get(field), accepted))
+            return Match(role, tuple(conditions), _compile_test(tuple(conditions)))
+
+        self.in_system = _flag_rule(rules["in_system"], "in_system")
+        self.tracking = _flag_rule(rules["tracking"], "tracking")
+
+        self.also_matches: List[Match] = []
+        self.out: List[OutClause] = []
+        for i, clause in enumerate(rules["out"]):
+            also = None
+            if clause.get("with") is not None:
+                (role,) = _roles([clause["with"].get("event")], f"out[{i}].with")
+                self.also_matches.append(match(role, clause["with"].get("where"), f"out[{i}].with"))
+                also = len(self.also_matches) - 1
+            self.out.append(OutClause(match("sort", clause.get("where"), f"out[{i}]"), also))
+
+        self.overflow: List[OverflowRule] = []
+        for i, rule in enumerate(rules["overflow"]):
+            (role,) = _roles([rule.get("event")], f"overflow[{i}]")
+            self.overflow.append(OverflowRule(match(role, rule.get("where"), f"overflow[{i}]"),
+                                              _roles(rule.get("requires"), f"overflow[{i}]")))
+
+        # Telegram fields read per role: the record's own and those any rule tests
+        read = {role: {raw_fields[role][field] for field in RECORD_RAW_FIELDS.get(role, ())} for role in ROLES}
+        for m in [clause.where for clause in self.out] + self.also_matches + [rule.match for rule in self.overflow]:
+            read[m.role].update(c.index for c in m.conditions if c.index is not None)
+
+        self.roles: Dict[str, Role] = {
+            role: Role(
+                name=role,
+                msg_ids=msg_ids[role],
+                raw_fields=raw_fields[role],
+                split=max(read[role]) + 1 if read[role] else 0,
+                overflow=tuple((i, rule.match) for i, rule in enumerate(self.overflow) if rule.match.role == role),
+                also=tuple((i, m) for i, m in enumerate(self.also_matches) if m.role == role),
+            )
+            for role in ROLES
+        }
+        # msg_id -> (role, maxsplit, overflow tests, `with` tests), looked up once per event
+        self.dispatch: Dict[str, Tuple[str, int, Tuple[Tuple[int, Predicate], ...], Tuple[Tuple[int, Predicate], ...]]] = {
+            msg_id: (r.name, r.split, tuple((i, m.test) for i, m in r.overflow), tuple((i, m.test) for i, m in r.also))
+            for r in self.roles.values() for msg_id in r.msg_ids
+        }
+        # Telegram positions of the record's sort_status, dereg_reason and dereg_location
+        self.record_positions = tuple(raw_fields[role][field] for role, fields in RECORD_RAW_FIELDS.items()
+                                      for field in fields)
+        self.overflow_requires = tuple(tuple(ROLE_FLAGS[role] for role in rule.requires) for rule in self.overflow)
+        # Event attributes the rules read besides msg_id, ts and raw
+        self.event_attributes = tuple(sorted({"sort_code", *(
+            c.field for m in [clause.where for clause in self.out] + self.also_matches +
+            [rule.match for rule in self.overflow] for c in m.conditions if c.index is None
+        )}))
+        self.raw_columns = tuple(sorted({field for fields in raw_fields.values() for field in fields}))
+
+    def classification_fingerprint(self, overflow_locations: Collection[str]) -> str:
+        """Identifies what classify_parcel derives: these rules applied with `overflow_locations`."""
+        key = json.dumps([self.fingerprint, sorted(overflow_locations)])
+        return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+    # -- MongoDB aggregation expressions -----------------------------------
+
+    def event_role_expr(self, role: str, event: str) -> Dict[str, Any]:
+        """Whether `event` ("$$e") plays `role`."""
+        return {"$in": [{"$ifNull": [f"{event}.msg_id", None]}, list(self.roles[role].msg_ids)]}
+
+    def role_present_expr(self, role: str, msg_ids: Any) -> Dict[str, Any]:
+        """Whether the array `msg_ids` (e.g. "$events.msg_id") holds one of `role`'s."""
+        return {"$gt": [{"$size": {"$setIntersection": [{"$ifNull": [msg_ids, []]}, list(self.roles[role].msg_ids)]}},
+                        0]}
+
+    def flag_rule_expr(self, rule: FlagRule, msg_ids: Any) -> Dict[str, Any]:
+        return {"$and": [
+            *(self.role_present_expr(role, msg_ids) for role in rule.all),
+            *({"$not": [self.role_present_expr(role, msg_ids)]} for role in rule.none),
+        ]}
+
+    def flag_rule_record_expr(self, rule: FlagRule, kpi: str) -> Dict[str, Any]:
+        """The same test on the role flags of a materialized "kpi" sub-document (e.g. "$kpi")."""
+        return {"$and": [
+            *({"$eq": [f"{kpi}.{ROLE_FLAGS[role]}", True]} for role in rule.all),
+            *({"$ne": [f"{kpi}.{ROLE_FLAGS[role]}", True]} for role in rule.none),
+        ]}
+
+    def match_expr(self, m: Match, event: str, overflow_locations: Collection[str]) -> Dict[str, Any]:
+        conditions = [self.event_role_expr(m.role, event)]
+        for c in m.conditions:
+            value = f"{event}.{c.field}" if c.index is None else raw_field_expr(event, c.index, self.separator)
+            values = sorted(overflow_locations) if c.values is None else sorted(c.values)
+            conditions.append({"$in": [{"$ifNull": [value, None]}, values]})
+        return {"$and": conditions}
+
+    def overflow_expr(self, events: Any, msg_ids: Any, overflow_locations: Collection[str]) -> Dict[str, Any]:
+        """Whether any overflow rule matches the parcel with `events` and their `msg_ids`."""
+        return {"$or": [
+            {"$and": [
+                *(self.role_present_expr(role, msg_ids) for role in rule.requires),
+                {"$anyElementTrue": [{"$map": {
+                    "input": events, "as": "e", "in": self.match_expr(rule.match, "$$e", overflow_locations),
+                }}]},
+            ]}
+            for rule in self.overflow
+        ] or [False]}
+
+
+kpi_rules = KpiRules(config.get("kpi_rules"))
@@ -0,0 +1,368 @@
+# app/services/live.py
+"""
+Live KPI feeds for the SSE endpoint.
+
+One LiveFeed per date keeps the full-day KPI state of that collection in
+memory. It is seeded with a single scan and then kept current from a
+change stream, so the database sees one scan and one change stream per
+date however many dashboards are subscribed. Deployments without change
+streams (standalone mongod) fall back to polling for parcels with a
+larger _id than the last one seen; that mode does not see updates to
+parcels already counted.
+
+Every subscriber first receives a "snapshot" message and then a "delta"
+message per tick in which something changed. Throughput is sent per
+minute so clients can bin it at any size themselves.
+"""
+import asyncio
+import logging
+import os
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set
+
+import numpy as np
+from pymongo import ASCENDING
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.config import config
+from app.services.parcel_record import OVERFLOW_NONE, RECORD_PROJECTION, ParcelRecord, classify_parcel
+from app.services.parcel_table import ParcelTable
+from app.services.summary_engine import SUMMARY_COUNTERS, summary_from_totals
+from app.services.timeparse import MISSING_MS
+from app.services.workers import run_in_worker
+
+logger = logging.getLogger(__name__)
+
+LIVE_TICK_SECONDS = float(os.getenv("LIVE_TICK_SECONDS", "1"))
+LIVE_POLL_SECONDS = float(os.getenv("LIVE_POLL_SECONDS", "5"))
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "64"))
+
+MINUTES = 24 * 60
+
+
+def _hhmm(minute: int) -> str:
+    return f"{minute // 60:02d}:{minute % 60:02d}"
+
+
+# SUMMARY_COUNTERS a parcel adds 0 or 1 to; "hosts" counts distinct hostIds instead
+PARCEL_COUNTERS = tuple(field for field in SUMMARY_COUNTERS if field != "hosts")
+
+
+class Contribution(NamedTuple):
+    """What one parcel adds to the live state; recomputed from its stored record when it is updated or removed."""
+    registered: bool
+    host_id: Any             # a registered parcel's hostId, None when it has none
+    counters: tuple          # one 0/1 per PARCEL_COUNTERS entry
+    reg_in_ms: Optional[int]
+    in_ms: Optional[int]
+    out_ms: Optional[int]
+    overflow_event: bool
+
+
+def contribution(r: ParcelRecord) -> Contribution:
+    registered = r.register_ms is not None
+    counters = (
+        r.in_system, r.is_sorted, r.overflow != OVERFLOW_NONE, r.barcode_read,
+        r.volume_valid, r.tracking_ok, r.in_ms is not None,
+    ) if registered else ()
+    return Contribution(
+        registered,
+        r.host_id if registered and r.host_id else None,
+        tuple(int(flag) for flag in counters),
+        r.in_ms if registered else None,
+        r.in_ms,
+        r.out_ms,
+        r.overflow != OVERFLOW_NONE and r.overflow_ms is not None,
+    )
+
+
+class LiveState:
+    """Full-day /summary counters and per-minute /throughput counts, updated parcel by parcel."""
+
+    def __init__(self, overflow_locations: Iterable[str]):
+        self.overflow_locations = set(overflow_locations)
+        # Every parcel's record, so updates can be retracted; rows of the table by _id
+        self.table = ParcelTable()
+        self.rows: Dict[Any, int] = {}
+        self.counters = dict.fromkeys(SUMMARY_COUNTERS, 0)
+        # Registered parcels per interned hostId code of the table, so "hosts" counts each hostId once, like /summary
+        self.host_parcels: List[int] = []
+        self.in_min = self.in_max = None
+        self.in_per_minute = np.zeros(MINUTES, dtype=np.int64)
+        self.out_per_minute = np.zeros(MINUTES, dtype=np.int64)
+        self.overflow = 0
+        self.last_id = None
+        # Changes since the last delta
+        self.changed = False
+        self.in_changes = defaultdict(int)
+        self.out_changes = defaultdict(int)
+        # apply() and remove() run in a worker thread while snapshot() and delta() read on the event
+        # loop; held per parcel, so the loop never waits for more than one
+        self._lock = threading.Lock()
+
+    def apply(self, docs: Iterable[Dict[str, Any]]) -> None:
+        for doc in docs:
+            record = classify_parcel(doc, self.overflow_locations)
+            new = contribution(record)
+            with self._lock:
+                row = self.rows.get(doc["_id"])
+                if row is None:
+                    self.rows[doc["_id"]] = self.table.append(record)
+                else:
+                    old = contribution(self.table.record(row))
+                    self.table.put(row, record)
+                    if old == new:
+                        continue
+                    self._add(old, -1)
+                self._add(new, 1)
+                if self.last_id is None or doc["_id"] > self.last_id:
+                    self.last_id = doc["_id"]
+
+    def remove(self, ids: Iterable[Any]) -> None:
+        for _id in ids:
+            with self._lock:
+                row = self.rows.pop(_id, None)
+                if row is not None:
+                    self._add(contribution(self.table.record(row)), -1)
+                    self.table.release(row)
+
+    def _add(self, c: Contribution, sign: int) -> None:
+        self.changed = True
+        if c.registered:
+            if c.host_id is not None:
+                self._count_host(self.table.hosts.code(c.host_id), sign)
+            for field, flag in zip(PARCEL_COUNTERS, c.counters):
+                self.counters[field] += sign * flag
+            if c.reg_in_ms is not None:
+                if sign > 0:
+                    self.in_min = c.reg_in_ms if self.in_min is None else min(self.in_min, c.reg_in_ms)
+                    self.in_max = c.reg_in_ms if self.in_max is None else max(self.in_max, c.reg_in_ms)
+                elif c.reg_in_ms in (self.in_min, self.in_max):
+                    self._recompute_in_span()
+        if c.in_ms is not None:
+            self.in_per_minute[c.in_ms // 60_000] += sign
+            self.in_changes[c.in_ms // 60_000] += sign
+        if c.out_ms is not None:
+            self.out_per_minute[c.out_ms // 60_000] += sign
+            self.out_changes[c.out_ms // 60_000] += sign
+        self.overflow += sign * c.overflow_event
+
+    def _count_host(self, code: int, sign: int) -> None:
+        if code >= len(self.host_parcels):
+            self.host_parcels.extend([0] * (code + 1 - len(self.host_parcels)))
+        before = self.host_parcels[code]
+        self.host_parcels[code] = before + sign
+        # A hostId's first parcel adds a host, its last one retracted removes it
+        if before == 0 or before + sign == 0:
+            self.counters["hosts"] += sign
+
+    def _recompute_in_span(self) -> None:
+        # Only when a retracted parcel held the minimum or maximum; rare, since msg_id 2 comes first
+        register_ms, in_ms = self.table.column("register_ms"), self.table.column("in_ms")
+        values = in_ms[(register_ms != MISSING_MS) & (in_ms != MISSING_MS)]
+        self.in_min, self.in_max = (int(values.min()), int(values.max())) if len(values) else (None, None)
+
+    def _summary(self) -> Dict[str, Any]:
+        return summary_from_totals({**self.counters, "in_min": self.in_min, "in_max": self.in_max})
+
+    def _totals(self) -> Dict[str, int]:
+        return {
+            "total_in": int(self.in_per_minute.sum()),
+            "total_out": int(self.out_per_minute.sum()),
+            "overflow": self.overflow,
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "type": "snapshot",
+                "summary": self._summary(),
+                "throughput": {
+                    **self._totals(),
+                    "in_per_minute": {_hhmm(m): int(self.in_per_minute[m])
+                                      for m in np.flatnonzero(self.in_per_minute)},
+                    "out_per_minute": {_hhmm(m): int(self.out_per_minute[m])
+                                       for m in np.flatnonzero(self.out_per_minute)},
+                },
+            }
+
+    def delta(self) -> Optional[Dict[str, Any]]:
+        """Changes since the previous delta, or None when nothing changed."""
+        with self._lock:
+            if not self.changed:
+                return None
+            message = {
+                "type": "delta",
+                "summary": self._summary(),
+                "throughput": {
+                    **self._totals(),
+                    "in_per_minute": {_hhmm(m): d for m, d in sorted(self.in_changes.items()) if d},
+                    "out_per_minute": {_hhmm(m): d for m, d in sorted(self.out_changes.items()) if d},
+                },
+            }
+            self.changed = False
+            self.in_changes.clear()
+            self.out_changes.clear()
+            return message
+
+
+class LiveFeed:
+    """Keeps the LiveState of one date current and fans its messages out to subscribers."""
+
+    def __init__(self, db: AsyncDatabase, date: str):
+        self.db = db
+        self.date = date
+        self.state = LiveState(config.get("overflow_locations", []))
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.mode = "starting"
+        self.error: Optional[str] = None
+        self.ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=LIVE_QUEUE_SIZE)
+        await self.ready.wait()
+        if self.error is not None:
+            raise RuntimeError(self.error)
+        queue.put_nowait({"date": self.date, "source": self.mode, **self.state.snapshot()})
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self.subscribers.discard(queue)
+
+    def _publish(self, message: Optional[Dict[str, Any]] = None) -> None:
+        message = message or self.state.delta()
+        if message is None:
+            return
+        message = {"date": self.date, **message}
+        for queue in self.subscribers:
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # A slow client missed deltas: start it over from a snapshot
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait({"date": self.date, "source": self.mode, **self.state.snapshot()})
+
+    async def _seed(self, after_id: Any = None, batch_size: int = 2000) -> None:
+        query = {"_id": {"$gt": after_id}} if after_id is not None else {}
+        cursor = self.db[self.date].find(query, RECORD_PROJECTION, batch_size=batch_size).sort("_id", ASCENDING)
+        try:
+            while batch := await cursor.to_list(batch_size):
+                await run_in_worker(self.state.apply, batch)
+        finally:
+            await cursor.close()
+
+    async def _run(self) -> None:
+        try:
+            await self._track()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.exception("Live feed for %s stopped", self.date)
+            self.error = str(e)
+            self.ready.set()
+            self._publish({"type": "error", "detail": self.error})
+
+    async def _track(self) -> None:
+        collection = self.db[self.date]
+        try:
+            # Open the stream before seeding so nothing inserted meanwhile is missed; replays are idempotent
+            stream = await collection.watch(full_document="updateLookup",
+                                            max_await_time_ms=int(LIVE_TICK_SECONDS * 1000))
+        except (OperationFailure, PyMongoError) as e:
+            logger.info("Change streams unavailable for %s (%s); polling by _id", self.date, e)
+            stream = None
+
+        await self._seed()
+        self.state.delta()
+        self.mode = "change_stream" if stream is not None else "polling"
+        self.ready.set()
+
+        if stream is None:
+            await self._poll()
+            return
+        try:
+            await self._follow(stream)
+        finally:
+            await stream.close()
+
+    async def _follow(self, stream) -> None:
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + LIVE_TICK_SECONDS
+        docs, removed = [], []
+        while stream.alive:
+            change = await stream.try_next()
+            if change is not None:
+                if change["operationType"] == "delete":
+                    removed.append(change["documentKey"]["_id"])
+                elif change.get("fullDocument") is not None:
+                    docs.append(change["fullDocument"])
+            if loop.time() >= next_tick:
+                if docs or removed:
+                    await run_in_worker(self._apply, docs, removed)
+                    docs, removed = [], []
+                self._publish()
+                next_tick = loop.time() + LIVE_TICK_SECONDS
+        # Invalidated, e.g. the collection was dropped or renamed
+        raise RuntimeError(f"Change stream for {self.date} closed")
+
+    def _apply(self, docs, removed) -> None:
+        self.state.apply(docs)
+        self.state.remove(removed)
+
+    async def _poll(self) -> None:
+        while True:
+            await asyncio.sleep(LIVE_POLL_SECONDS)
+            await self._seed(after_id=self.state.last_id)
+            self._publish()
+
+
+class LiveHub:
+    """One feed per date, started by the first subscriber and stopped after the last one leaves."""
+
+    def __init__(self):
+        self.feeds: Dict[str, LiveFeed] = {}
+
+    async def subscribe(self, db: AsyncDatabase, date: str):
+        feed = self.feeds.get(date)
+        if feed is None or feed.error is not None:
+            feed = self.feeds[date] = LiveFeed(db, date)
+            feed.start()
+        return feed, await feed.subscribe()
+
+    async def unsubscribe(self, feed: LiveFeed, queue: asyncio.Queue) -> None:
+        feed.unsubscribe(queue)
+        if not feed.subscribers and self.feeds.get(feed.date) is feed:
+            del self.feeds[feed.date]
+            await feed.stop()
+
+    async def close(self) -> None:
+        feeds, self.feeds = list(self.feeds.values()), {}
+        for feed in feeds:
+            await feed.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            date: {"mode": feed.mode, "subscribers": len(feed.subscribers), "parcels": len(feed.state.rows),
+                   "table_bytes": feed.state.table.nbytes,
+                   "error": feed.error}
+            for date, feed in self.feeds.items()
+        }
+
+
+live_hub = LiveHub()
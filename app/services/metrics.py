@@ -0,0 +1,248 @@
+# app/services/metrics.py
+"""
+Per-request stage timings and process-wide counters for /metrics.
+
+Every HTTP request gets a RequestMetrics object in a context variable. Code
+on the hot path marks its stages with ``with stage("fetch"):``; the
+context is copied into the worker threads (see run_in_worker), so stages
+and MongoDB replies there count towards the request that caused them.
+Stages that run concurrently, such as fetching the next batch while the
+previous one is reduced, each report their own time, so they can add up to
+more than the request took.
+
+Stages:
+    check      collection catalog lookups
+    rollup     building or extending the per-minute rollup of a date
+    fetch      waiting for MongoDB (cursors, aggregations, rollup buckets)
+    reduce     parsing and reducing parcels (one pass, see classify_parcel)
+    serialize  encoding the response (orjson, see app.services.responses, or FastAPI's
+               encoder after the route returned)
+    compress   gzip/brotli compression of the body (app.services.compression)
+"""
+import bisect
+import contextvars
+import functools
+import inspect
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import bson
+from fastapi.routing import APIRoute
+from pymongo import monitoring
+
+# Command events do not carry the reply's size, so measuring it re-encodes every reply with
+# documents; opt in with 1 while profiling, by default only documents are counted
+METRICS_REPLY_BYTES = os.getenv("METRICS_REPLY_BYTES", "0") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class RequestMetrics:
+    """What one request spent and fetched; filled in from the event loop and worker threads."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = defaultdict(float)
+        self.documents = 0
+        self.bytes = 0
+        self.cache: Optional[str] = None
+        self.handler_done: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[name] += seconds
+
+    def add_reply(self, documents: int, size: int) -> None:
+        with self._lock:
+            self.documents += documents
+            self.bytes += size
+
+    def server_timing(self, total: float) -> str:
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        entries.append(f"total;dur={total * 1000:.1f}")
+        if self.cache is not None:
+            entries.append(f'cache;desc="{self.cache}"')
+        return ", ".join(entries)
+
+
+_current: contextvars.ContextVar[Optional[RequestMetrics]] = contextvars.ContextVar("request_metrics", default=None)
+
+
+def current() -> Optional[RequestMetrics]:
+    return _current.get()
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.add_stage(name, time.perf_counter() - started)
+
+
+def mark_cache(outcome: str) -> None:
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache = outcome
+
+
+class MetricsRegistry:
+    """Process-wide counters, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = defaultdict(int)                # (route, status class) -> count
+        self.latency_sum = defaultdict(float)           # route -> seconds
+        self.latency_buckets: Dict[str, List[int]] = {}
+        self.stage_sum = defaultdict(float)             # (route, stage) -> seconds
+        self.stage_count = defaultdict(int)
+        self.route_documents = defaultdict(int)
+        self.route_bytes = defaultdict(int)
+        self.mongo_commands = defaultdict(int)          # command name -> count
+        self.mongo_failures = defaultdict(int)
+        self.mongo_seconds = defaultdict(float)
+        self.mongo_documents = 0
+        self.mongo_bytes = 0
+
+    def observe_request(self, route: str, status: int, seconds: float, metrics: RequestMetrics) -> None:
+        with self._lock:
+            self.requests[(route, f"{status // 100}xx")] += 1
+            self.latency_sum[route] += seconds
+            buckets = self.latency_buckets.setdefault(route, [0] * (len(LATENCY_BUCKETS) + 1))
+            buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            for name, stage_seconds in metrics.stages.items():
+                self.stage_sum[(route, name)] += stage_seconds
+                self.stage_count[(route, name)] += 1
+            self.route_documents[route] += metrics.documents
+            self.route_bytes[route] += metrics.bytes
+
+    def observe_command(self, name: str, seconds: float, documents: int, size: int, failed: bool = False) -> None:
+        with self._lock:
+            self.mongo_commands[name] += 1
+            self.mongo_seconds[name] += seconds
+            self.mongo_failures[name] += failed
+            self.mongo_documents += documents
+            self.mongo_bytes += size
+
+    def render(self, gauges: Dict[str, Dict[str, Any]]) -> str:
+        """Prometheus exposition text; `gauges` adds point-in-time values, e.g. {"kpi_cache": stats}."""
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+        with self._lock:
+            metric("kpi_requests_total", "counter", "HTTP requests by route and status class",
+                   [({"route": r, "status": s}, n) for (r, s), n in sorted(self.requests.items())])
+            lines.append("# HELP kpi_request_duration_seconds Request latency")
+            lines.append("# TYPE kpi_request_duration_seconds histogram")
+            for route, buckets in sorted(self.latency_buckets.items()):
+                cumulative = 0
+                for bound, count in zip((*LATENCY_BUCKETS, "+Inf"), buckets):
+                    cumulative += count
+                    lines.append(f'kpi_request_duration_seconds_bucket{{route="{route}",le="{bound}"}} {cumulative}')
+                lines.append(f'kpi_request_duration_seconds_sum{{route="{route}"}} {self.latency_sum[route]:.6f}')
+                lines.append(f'kpi_request_duration_seconds_count{{route="{route}"}} {cumulative}')
+            metric("kpi_stage_seconds_total", "counter", "Time spent per request stage",
+                   [({"route": r, "stage": s}, f"{v:.6f}") for (r, s), v in sorted(self.stage_sum.items())])
+            metric("kpi_stage_observations_total", "counter", "Requests that went through a stage",
+                   [({"route": r, "stage": s}, v) for (r, s), v in sorted(self.stage_count.items())])
+            metric("kpi_documents_scanned_total", "counter", "Documents MongoDB returned, by route",
+                   [({"route": r}, v) for r, v in sorted(self.route_documents.items())])
+            metric("kpi_bytes_received_total", "counter", "BSON bytes MongoDB returned, by route",
+                   [({"route": r}, v) for r, v in sorted(self.route_bytes.items())])
+            metric("mongo_commands_total", "counter", "MongoDB commands by name",
+                   [({"command": c}, v) for c, v in sorted(self.mongo_commands.items())])
+            metric("mongo_command_failures_total", "counter", "Failed MongoDB commands by name",
+                   [({"command": c}, v) for c, v in sorted(self.mongo_failures.items())])
+            metric("mongo_command_seconds_total", "counter", "Time spent in MongoDB commands by name",
+                   [({"command": c}, f"{v:.6f}") for c, v in sorted(self.mongo_seconds.items())])
+            metric("mongo_documents_received_total", "counter", "Documents received from MongoDB",
+                   [({}, self.mongo_documents)])
+            metric("mongo_bytes_received_total", "counter", "BSON bytes received from MongoDB",
+                   [({}, self.mongo_bytes)])
+
+        for prefix, values in gauges.items():
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    metric(f"{prefix}_{key}", "gauge", f"{prefix} {key}", [({}, value)])
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+
+def _reply_documents(reply: Dict[str, Any]) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+        if isinstance(batch, list):
+            return len(batch)
+    return 0
+
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Counts commands, documents and reply bytes, globally and for the request that issued them."""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        reply = event.reply
+        documents = _reply_documents(reply)
+        size = len(bson.encode(reply)) if METRICS_REPLY_BYTES and documents else 0
+        registry.observe_command(event.command_name, event.duration_micros / 1e6, documents, size)
+        metrics = _current.get()
+        if metrics is not None:
+            metrics.add_reply(documents, size)
+
+    def failed(self, event):
+        registry.observe_command(event.command_name, event.duration_micros / 1e6, 0, 0, failed=True)
+
+
+command_listener = CommandMetricsListener()
+
+
+@contextmanager
+def track_request() -> Iterator[RequestMetrics]:
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _current.reset(token)
+
+
+class TimedRoute(APIRoute):
+    """Notes when the endpoint returned, so the middleware can tell serialization apart."""
+
+    def __init__(self, path: str, endpoint: Callable[..., Any], **kwargs: Any):
+        if inspect.iscoroutinefunction(endpoint):
+            original = endpoint
+
+            @functools.wraps(original)
+            async def endpoint(*args, **kw):
+                try:
+                    return await original(*args, **kw)
+                finally:
+                    metrics = _current.get()
+                    if metrics is not None:
+                        metrics.handler_done = time.perf_counter()
+
+        super().__init__(path, endpoint, **kwargs)
@@ -0,0 +1,156 @@
+# app/services/parallel.py
+"""
+Process-parallel KPI scans of large date collections.
+
+A day with at least PARALLEL_MIN_DOCS parcels is split into _id ranges of
+about equal size, PARALLEL_CHUNKS_PER_PROCESS per worker process. Each
+process scans its range with its own MongoClient and reduces it with the
+same accumulator the serial path uses; only the small partial aggregates
+travel back, and merging them gives exactly the serial result. Smaller
+days, KPI_PROCESSES <= 1 and a pool that cannot be started all take the
+serial path.
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from pymongo import ASCENDING
+from pymongo.asynchronous.collection import AsyncCollection
+
+from app.database.db import get_db
+from app.services.dashboard_engine import DASHBOARD_PROJECTION, DashboardAccumulator
+from app.services.day_engine import DayAccumulator, DayProfile
+from app.services.metrics import stage
+from app.services.parcel_record import RECORD_PROJECTION
+from app.services.streaming import STREAM_BATCH_SIZE, reduce_collection
+from app.services.summary_engine import SummaryAccumulator, merge_summary_totals
+from app.services.throughput_engine import ThroughputAccumulator, sum_counts
+from app.services.volume_engine import VOLUME_PROJECTION, VolumeAccumulator, merge_columns
+from app.services.workers import KPI_PROCESSES, discard_process_pool, process_pool, run_in_process, run_in_worker
+
+logger = logging.getLogger(__name__)
+
+PARALLEL_MIN_DOCS = int(os.getenv("PARALLEL_MIN_DOCS", "50000"))
+PARALLEL_CHUNKS_PER_PROCESS = int(os.getenv("PARALLEL_CHUNKS_PER_PROCESS", "2"))
+
+
+def _summary_chunk(accumulator: SummaryAccumulator) -> Tuple[Dict[str, Any], set]:
+    # A hostId may occur in several chunks, so the distinct hosts travel as a set
+    return accumulator.totals(), accumulator.unique_hosts
+
+
+def _merge_summary_chunks(parts: List[Tuple[Dict[str, Any], set]]) -> Dict[str, Any]:
+    totals = merge_summary_totals(part for part, _ in parts)
+    totals["hosts"] = len(set().union(*(hosts for _, hosts in parts)))
+    return totals
+
+
+class Reducer(NamedTuple):
+    make: Callable[..., Any]                # accumulator from the KPI's arguments
+    projection: Dict[str, Any]
+    result: Callable[[Any], Any]            # the mergeable partial of a whole collection
+    chunk: Callable[[Any], Any]             # the partial of one _id range
+    merge: Callable[[List[Any]], Any]       # chunk partials -> result
+
+
+REDUCERS = {
+    "summary": Reducer(SummaryAccumulator, RECORD_PROJECTION, SummaryAccumulator.totals, _summary_chunk,
+                       _merge_summary_chunks),
+    "throughput": Reducer(ThroughputAccumulator, RECORD_PROJECTION, ThroughputAccumulator.result,
+                          ThroughputAccumulator.result, sum_counts),
+    "volume": Reducer(VolumeAccumulator, VOLUME_PROJECTION, VolumeAccumulator.columns, VolumeAccumulator.columns,
+                      merge_columns),
+}
+
+
+# A dashboard partial is the partial of each selected section, merged section by section
+def _dashboard_result(accumulator: DashboardAccumulator) -> Dict[str, Any]:
+    return {kind: REDUCERS[kind].result(sub) for kind, sub in accumulator.sections.items()}
+
+
+def _dashboard_chunk(accumulator: DashboardAccumulator) -> Dict[str, Any]:
+    return {kind: REDUCERS[kind].chunk(sub) for kind, sub in accumulator.sections.items()}
+
+
+def _merge_dashboard_chunks(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {kind: REDUCERS[kind].merge([part[kind] for part in parts]) for kind in parts[0]}
+
+
+REDUCERS["dashboard"] = Reducer(DashboardAccumulator, DASHBOARD_PROJECTION, _dashboard_result, _dashboard_chunk,
+                                _merge_dashboard_chunks)
+REDUCERS["day"] = Reducer(DayAccumulator, DASHBOARD_PROJECTION, DayAccumulator.profile, DayAccumulator.profile,
+                          DayProfile.merge)
+
+
+def _range_query(lo: Any, hi: Any) -> Dict[str, Any]:
+    bounds = {}
+    if lo is not None:
+        bounds["$gte"] = lo
+    if hi is not None:
+        bounds["$lt"] = hi
+    return {"_id": bounds} if bounds else {}
+
+
+def warm_up_worker() -> int:
+    """Runs in a worker process at startup: importing this module and connecting is the warm-up."""
+    get_db().command("ping")
+    return os.getpid()
+
+
+def reduce_chunk(kind: str, name: str, args: tuple, lo: Any, hi: Any) -> Any:
+    """Runs in a worker process: reduces the parcels of collection `name` with lo <= _id < hi."""
+    reducer = REDUCERS[kind]
+    accumulator = reducer.make(*args)
+    cursor = get_db()[name].find(_range_query(lo, hi), reducer.projection, batch_size=STREAM_BATCH_SIZE)
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= STREAM_BATCH_SIZE:
+            accumulator.add(batch)
+            batch = []
+    accumulator.add(batch)
+    return reducer.chunk(accumulator)
+
+
+async def chunk_ranges(collection: AsyncCollection, n_chunks: int) -> Optional[List[Tuple[Any, Any]]]:
+    """[lo, hi) _id ranges of about equal size, or None when the collection is too small to split."""
+    n = await collection.estimated_document_count()
+    if n < PARALLEL_MIN_DOCS or n_chunks < 2:
+        return None
+    step = n // n_chunks
+    bounds = []
+    for i in range(1, n_chunks):
+        # Walks the _id index only
+        found = await collection.find({}, {"_id": 1}).sort("_id", ASCENDING).skip(i * step).limit(1).to_list(1)
+        if found and (not bounds or found[0]["_id"] > bounds[-1]):
+            bounds.append(found[0]["_id"])
+    # Open-ended first and last ranges cover parcels inserted since the count
+    edges = [None, *bounds, None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+async def reduce_kpi(collection: AsyncCollection, kind: str, *args: Any) -> Any:
+    """
+    The mergeable partial of KPI `kind` ("summary", "throughput", "volume",
+    "dashboard", "day") over a whole collection; `args` are the accumulator's
+    arguments and must be picklable.
+    """
+    reducer = REDUCERS[kind]
+    if process_pool() is not None:
+        ranges = await chunk_ranges(collection, KPI_PROCESSES * PARALLEL_CHUNKS_PER_PROCESS)
+        if ranges:
+            try:
+                # Fetching and reducing both happen in the worker processes
+                with stage("reduce"):
+                    parts = await asyncio.gather(*(
+                        run_in_process(reduce_chunk, kind, collection.name, args, lo, hi) for lo, hi in ranges
+                    ))
+                return await run_in_worker(reducer.merge, list(parts))
+            except (BrokenProcessPool, OSError) as e:
+                logger.warning("Process pool unavailable (%s); reducing %s serially", e, collection.name)
+                discard_process_pool()
+
+    accumulator = await reduce_collection(collection, reducer.projection, reducer.make(*args))
+    return await run_in_worker(reducer.result, accumulator)
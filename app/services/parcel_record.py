@@ -0,0 +1,214 @@
+# app/services/parcel_record.py
+from dataclasses import dataclass
+from typing import Any, Collection, Dict, Optional
+
+from app.config import config
+from app.services.kpi_rules import kpi_rules
+from app.services.timeparse import parse_ms
+
+# ParcelRecord.overflow is the 1-based position of the matching kpi_rules "overflow" rule
+OVERFLOW_NONE = 0
+
+# Bump when the layout of the materialized "kpi" sub-document changes
+MATERIALIZED_VERSION = 2
+
+
+@dataclass(slots=True)
+class ParcelRecord:
+    """
+    Everything the KPI routes need from one parcel document, extracted in a
+    single pass. has_2/has_3/has_6/has_7 tell that the in, identification,
+    sort and dereg events of app.services.kpi_rules occurred; they are
+    named after those events' default msg_ids.
+    """
+    host_id: Any = None
+    register_ms: Optional[int] = None
+    status: Any = None
+    sort_strategy: Any = None
+    barcode_error: Any = None
+    real_volume: Any = None
+    has_2: bool = False
+    has_3: bool = False
+    has_6: bool = False
+    has_7: bool = False
+    in_ms: Optional[int] = None           # first in event with a parseable ts
+    sort_ms: Optional[int] = None         # first sort event with a parseable ts
+    sort_code: Any = None
+    sort_status: Optional[str] = None
+    dereg_ms: Optional[int] = None        # first dereg event
+    dereg_reason: Optional[str] = None
+    dereg_location: Optional[str] = None
+    out_ms: Optional[int] = None
+    overflow: int = OVERFLOW_NONE
+    overflow_ms: Optional[int] = None
+
+    @property
+    def in_system(self) -> bool:
+        return kpi_rules.in_system.test(self)
+
+    @property
+    def tracking_ok(self) -> bool:
+        return kpi_rules.tracking.test(self)
+
+    @property
+    def is_sorted(self) -> bool:
+        return self.status == "sorted" and self.sort_strategy == "1"
+
+    @property
+    def barcode_read(self) -> bool:
+        return self.barcode_error is False
+
+    @property
+    def volume_valid(self) -> bool:
+        return isinstance(self.real_volume, (int, float)) and self.real_volume > 0
+
+
+# Record fields stored under doc["kpi"] by app.jobs.materialize
+MATERIALIZED_FIELDS = (
+    "register_ms", "has_2", "has_3", "has_6", "has_7", "in_ms",
+    "sort_ms", "sort_code", "sort_status", "dereg_ms", "dereg_reason", "dereg_location",
+    "out_ms", "overflow", "overflow_ms",
+)
+
+
+# Event fields classify_parcel reads; everything else in an event (e.g. full telegram copies) stays on the server
+EVENT_FIELDS = ("msg_id", "ts", "raw", *kpi_rules.event_attributes)
+
+# The kpi_rules and overflow_locations in force; a "kpi" sub-document written under others is ignored
+MATERIALIZED_FINGERPRINT = kpi_rules.classification_fingerprint(config.get("overflow_locations", []))
+
+# A "kpi" sub-document is current when this version wrote it under the rules and locations in force
+MATERIALIZED_EXPR = {"$and": [{"$eq": ["$kpi.v", MATERIALIZED_VERSION]},
+                              {"$eq": ["$kpi.rules", MATERIALIZED_FINGERPRINT]}]}
+
+# Projection for classifying from the raw events
+SOURCE_PROJECTION = {
+    "hostId": 1, "registerTS": 1, "status": 1, "sort_strategy": 1, "barcode_error": 1,
+    "volume_data.real_volume": 1,
+    **{f"events.{name}": 1 for name in EVENT_FIELDS},
+}
+
+# Projection for classify_parcel: materialized parcels are sent without their events (MongoDB 4.4+)
+RECORD_PROJECTION = {
+    "hostId": 1, "registerTS": 1, "status": 1, "sort_strategy": 1, "barcode_error": 1,
+    "volume_data.real_volume": 1, "kpi": 1,
+    "events": {"$cond": [
+        MATERIALIZED_EXPR,
+        "$$REMOVE",
+        {"$map": {"input": "$events", "as": "e", "in": {name: f"$$e.{name}" for name in EVENT_FIELDS}}},
+    ]},
+}
+
+
+def is_materialized(kpi: Any) -> bool:
+    return (isinstance(kpi, dict) and kpi.get("v") == MATERIALIZED_VERSION
+            and kpi.get("rules") == MATERIALIZED_FINGERPRINT)
+
+
+def to_materialized(record: ParcelRecord) -> Dict[str, Any]:
+    return {"v": MATERIALIZED_VERSION, "rules": MATERIALIZED_FINGERPRINT,
+            **{name: getattr(record, name) for name in MATERIALIZED_FIELDS}}
+
+
+def _from_materialized(doc: Dict[str, Any], kpi: Dict[str, Any]) -> ParcelRecord:
+    volume = doc.get("volume_data") or {}
+    return ParcelRecord(
+        host_id=doc.get("hostId"),
+        status=doc.get("status"),
+        sort_strategy=doc.get("sort_strategy"),
+        barcode_error=doc.get("barcode_error"),
+        real_volume=volume.get("real_volume") if isinstance(volume, dict) else None,
+        **{name: kpi.get(name) for name in MATERIALIZED_FIELDS},
+    )
+
+
+def classify_parcel(doc: Dict[str, Any], overflow_locations: Collection[str]) -> ParcelRecord:
+    """
+    Walks a parcel's events once and returns its compact ParcelRecord.
+    Documents already materialized by app.jobs.materialize skip the walk;
+    their overflow was decided with the configured overflow_locations,
+    which is what every caller passes.
+    """
+    kpi = doc.get("kpi")
+    if is_materialized(kpi):
+        return _from_materialized(doc, kpi)
+
+    volume = doc.get("volume_data") or {}
+    record = ParcelRecord(
+        host_id=doc.get("hostId"),
+        register_ms=parse_ms(doc.get("registerTS")),
+        status=doc.get("status"),
+        sort_strategy=doc.get("sort_strategy"),
+        barcode_error=doc.get("barcode_error"),
+        real_volume=volume.get("real_volume") if isinstance(volume, dict) else None,
+    )
+
+    rules = kpi_rules
+    dispatch, separator = rules.dispatch, rules.separator
+    status_at, reason_at, location_at = rules.record_positions
+    first_sort = None       # (event, raw fields) of the first sort event with a parseable ts
+    seen_dereg = False
+    overflow_hit = [False] * len(rules.overflow)
+    overflow_ms = [None] * len(rules.overflow)
+    also_hit = [False] * len(rules.also_matches)
+
+    for event in doc.get("events") or ():
+        handler = dispatch.get(event.get("msg_id"))
+        if handler is None:
+            continue
+        role, split, overflow_tests, also_tests = handler
+        # Split once, and only as far as the last field the rules read
+        parts = ()
+        if split:
+            raw = event.get("raw")
+            parts = raw.split(separator, split) if isinstance(raw, str) else ("",)
+        ts = None
+        parsed = False
+        if role == "in":
+            record.has_2 = True
+            if record.in_ms is None:
+                record.in_ms = parse_ms(event.get("ts"))
+        elif role == "sort":
+            record.has_6 = True
+            if first_sort is None:
+                ts, parsed = parse_ms(event.get("ts")), True
+                if ts is not None:
+                    first_sort = (event, parts)
+                    record.sort_ms = ts
+                    record.sort_code = event.get("sort_code")
+                    record.sort_status = parts[status_at] if len(parts) > status_at else None
+        elif role == "dereg":
+            record.has_7 = True
+            if not seen_dereg:
+                seen_dereg = True
+                ts, parsed = parse_ms(event.get("ts")), True
+                record.dereg_ms = ts
+                record.dereg_reason = parts[reason_at] if len(parts) > reason_at else None
+                record.dereg_location = parts[location_at] if len(parts) > location_at else None
+        else:
+            record.has_3 = True
+
+        for i, test in overflow_tests:
+            if not overflow_hit[i] and test(event, parts, overflow_locations):
+                overflow_hit[i] = True
+                overflow_ms[i] = ts if parsed else parse_ms(event.get("ts"))
+        for i, test in also_tests:
+            if not also_hit[i] and test(event, parts, overflow_locations):
+                also_hit[i] = True
+
+    # OUT happens at the first sort event, when one of the "out" clauses holds
+    if first_sort is not None:
+        event, parts = first_sort
+        for clause in rules.out:
+            if (clause.also is None or also_hit[clause.also]) and clause.where.test(event, parts, overflow_locations):
+                record.out_ms = record.sort_ms
+                break
+
+    if True in overflow_hit:
+        for i, requires in enumerate(rules.overflow_requires):
+            if overflow_hit[i] and all(getattr(record, flag) for flag in requires):
+                record.overflow = i + 1
+                record.overflow_ms = overflow_ms[i]
+                break
+
+    return record
@@ -0,0 +1,148 @@
+# app/services/parcel_table.py
+"""
+ParcelRecords held as columns, for state that keeps every parcel of a day
+in memory.
+
+A ParcelRecord is a slotted object whose times, codes and statuses are
+separate Python objects, around 480 bytes a parcel once its ints and
+strings are counted. A ParcelTable stores the same fields as one numpy
+array per field instead: times as int32 ms of day (MISSING_MS when
+absent), the event flags as bools, and statuses, sort codes, reasons and
+locations as int32 codes into a shared Interner, since a day has only a
+handful of distinct values. Host ids get an Interner of their own, or,
+with host_ids=False, only whether there is one is kept. About 70 bytes a
+parcel, plus the interned host id.
+
+Only what ParcelRecord keeps is stored; the events and their raw telegrams
+are dropped by classify_parcel before a record gets here.
+"""
+from typing import Any, Dict, List
+
+import numpy as np
+
+from app.services.parcel_record import ParcelRecord
+from app.services.timeparse import MISSING_MS
+
+TIME_FIELDS = ("register_ms", "in_ms", "sort_ms", "dereg_ms", "out_ms", "overflow_ms")
+FLAG_FIELDS = ("has_2", "has_3", "has_6", "has_7")
+CODE_FIELDS = ("status", "sort_strategy", "sort_code", "sort_status", "dereg_reason", "dereg_location")
+
+# barcode_error is True (1), False (0) or anything else, usually missing (-1)
+_BARCODE_VALUES = {1: True, 0: False, -1: None}
+
+COLUMNS = {
+    **{name: (np.int32, MISSING_MS) for name in TIME_FIELDS},
+    **{name: (np.bool_, False) for name in FLAG_FIELDS},
+    **{name: (np.int32, 0) for name in CODE_FIELDS},
+    "host_id": (np.int32, 0),
+    "overflow": (np.int8, 0),
+    "barcode_error": (np.int8, -1),
+    "real_volume": (np.float64, np.nan),
+}
+
+
+class Interner:
+    """Values <-> small ints; code 0 is None."""
+
+    def __init__(self):
+        self.codes: Dict[Any, int] = {None: 0}
+        self.values: List[Any] = [None]
+
+    def code(self, value: Any) -> int:
+        try:
+            code = self.codes.get(value)
+        except TypeError:
+            # Unhashable, e.g. a list in a malformed document; only compared against strings, so repr is enough
+            value = repr(value)
+            code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+class ParcelTable:
+    """Growable struct-of-arrays of ParcelRecords; rows are reused after release()."""
+
+    def __init__(self, capacity: int = 1024, host_ids: bool = True):
+        self.columns = {name: np.full(capacity, default, dtype=dtype) for name, (dtype, default) in COLUMNS.items()}
+        self.capacity = capacity
+        self.size = 0
+        self.free: List[int] = []
+        self.vocabulary = Interner()
+        self.hosts = Interner()
+        if not host_ids:
+            # Every truthy host id shares code 1
+            self.hosts.code(True)
+        self.host_ids = host_ids
+
+    def __len__(self) -> int:
+        return self.size - len(self.free)
+
+    def _grow(self) -> None:
+        capacity = self.capacity * 2
+        for name, (dtype, default) in COLUMNS.items():
+            column = np.full(capacity, default, dtype=dtype)
+            column[:self.size] = self.columns[name][:self.size]
+            self.columns[name] = column
+        self.capacity = capacity
+
+    def append(self, record: ParcelRecord) -> int:
+        if self.free:
+            row = self.free.pop()
+        else:
+            if self.size == self.capacity:
+                self._grow()
+            row = self.size
+            self.size += 1
+        self.put(row, record)
+        return row
+
+    def put(self, row: int, record: ParcelRecord) -> None:
+        columns = self.columns
+        for name in TIME_FIELDS:
+            value = getattr(record, name)
+            columns[name][row] = MISSING_MS if value is None else value
+        for name in FLAG_FIELDS:
+            columns[name][row] = getattr(record, name)
+        for name in CODE_FIELDS:
+            columns[name][row] = self.vocabulary.code(getattr(record, name))
+        # Only the truthiness of a host id is used, so every falsy one is stored as None
+        if not record.host_id:
+            columns["host_id"][row] = 0
+        else:
+            columns["host_id"][row] = self.hosts.code(record.host_id) if self.host_ids else 1
+        columns["overflow"][row] = record.overflow
+        barcode_error = record.barcode_error
+        columns["barcode_error"][row] = 1 if barcode_error is True else 0 if barcode_error is False else -1
+        real_volume = record.real_volume
+        columns["real_volume"][row] = real_volume if isinstance(real_volume, (int, float)) else np.nan
+
+    def release(self, row: int) -> None:
+        for name, (_, default) in COLUMNS.items():
+            self.columns[name][row] = default
+        self.free.append(row)
+
+    def record(self, row: int) -> ParcelRecord:
+        columns = self.columns
+        real_volume = float(columns["real_volume"][row])
+        return ParcelRecord(
+            host_id=self.hosts.values[columns["host_id"][row]],
+            barcode_error=_BARCODE_VALUES[int(columns["barcode_error"][row])],
+            real_volume=None if real_volume != real_volume else real_volume,
+            overflow=int(columns["overflow"][row]),
+            **{name: None if (ms := int(columns[name][row])) == MISSING_MS else ms for name in TIME_FIELDS},
+            **{name: bool(columns[name][row]) for name in FLAG_FIELDS},
+            **{name: self.vocabulary.values[columns[name][row]] for name in CODE_FIELDS},
+        )
+
+    def column(self, name: str) -> np.ndarray:
+        """The filled part of a column; released rows hold the defaults (times MISSING_MS)."""
+        return self.columns[name][:self.size]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(column.nbytes for column in self.columns.values())
@@ -0,0 +1,88 @@
+# app/services/profiler.py
+"""
+Low-overhead sampling profiler for production.
+
+While running, a background thread records the Python stack of every other
+thread each `interval` seconds. The report is in the collapsed-stack format
+("frame;frame;frame count" per line) that flamegraph.pl and speedscope
+read. Disabled unless PROFILER_ENABLED=1.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Optional
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "0") == "1"
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "300"))
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", os.path.basename(code.co_filename))
+    return f"{module}:{code.co_name}:{frame.f_lineno}"
+
+
+class SamplingProfiler:
+    def __init__(self):
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.interval = 0.01
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval: float = 0.01, max_seconds: float = PROFILER_MAX_SECONDS) -> None:
+        """Starts a new profile, dropping the previous one; stops by itself after max_seconds."""
+        self.stop()
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+        self.interval = interval
+        self.started_at, self.stopped_at = time.time(), None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(max_seconds,), name="sampling-profiler",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self.running:
+            self._stop.set()
+            self._thread.join()
+
+    def _run(self, max_seconds: float) -> None:
+        own = threading.get_ident()
+        deadline = time.monotonic() + max_seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            sampled = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_name(frame))
+                    frame = frame.f_back
+                sampled.append(";".join(reversed(stack)))
+            with self._lock:
+                self.stacks.update(sampled)
+                self.samples += 1
+        self.stopped_at = time.time()
+
+    def status(self) -> Dict[str, Any]:
+        return {"enabled": PROFILER_ENABLED, "running": self.running, "interval": self.interval,
+                "samples": self.samples, "started_at": self.started_at, "stopped_at": self.stopped_at}
+
+    def collapsed(self, min_count: int = 1) -> str:
+        with self._lock:
+            stacks = self.stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks if count >= min_count)
+
+
+profiler = SamplingProfiler()
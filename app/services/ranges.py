@@ -0,0 +1,101 @@
+# app/services/ranges.py
+"""
+Date-range KPI queries across the per-date collections.
+
+A range covers the shifts of date_from..date_to, each running from
+start_time to end_time. When end_time is before start_time the shift runs
+overnight and is answered from two collections: [start_time, midnight) of
+the shift date and [midnight, end_time] of the next date. Shifts are
+computed concurrently and streamed back as NDJSON lines as they complete.
+"""
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Awaitable, Callable, List, NamedTuple, Tuple
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+RANGE_MAX_DAYS = int(os.getenv("RANGE_MAX_DAYS", "93"))
+RANGE_CONCURRENCY = int(os.getenv("RANGE_CONCURRENCY", "4"))
+
+
+class Segment(NamedTuple):
+    date: str
+    start_ms: int   # ms of day
+    end_ms: int     # ms of day, inclusive; DAY_MS means "until midnight"
+    offset_ms: int  # midnight of `date` on the range's time axis (0 = midnight of date_from)
+
+
+class RangeWindow(NamedTuple):
+    shifts: List[str]
+    start_minute: int
+    end_minute: int  # past 1440 for overnight shifts
+
+    @property
+    def overnight(self) -> bool:
+        return self.end_minute > 24 * 60
+
+
+def parse_range(date_from: str, date_to: str, start_time: str, end_time: str,
+                max_days: int = RANGE_MAX_DAYS) -> RangeWindow:
+    """Validates a range request; raises ValueError with a client-facing message."""
+    try:
+        first = datetime.strptime(date_from, "%Y-%m-%d")
+        last = datetime.strptime(date_to, "%Y-%m-%d")
+    except (TypeError, ValueError):
+        raise ValueError("Date format must be YYYY-MM-DD")
+    if last < first:
+        raise ValueError("date_to must not be before date_from")
+    days = (last - first).days + 1
+    if days > max_days:
+        raise ValueError(f"Date range is limited to {max_days} days")
+
+    try:
+        start = datetime.strptime(start_time, "%H:%M")
+        end = datetime.strptime(end_time, "%H:%M")
+    except (TypeError, ValueError):
+        raise ValueError("Time format must be HH:MM")
+    if end == start:
+        raise ValueError("End time must differ from start time")
+
+    start_minute = start.hour * 60 + start.minute
+    end_minute = end.hour * 60 + end.minute
+    if end < start:
+        end_minute += 24 * 60
+
+    shifts = [(first + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+    return RangeWindow(shifts, start_minute, end_minute)
+
+
+def shift_segments(window: RangeWindow, shift: str) -> List[Segment]:
+    """The per-collection pieces of one shift."""
+    day = datetime.strptime(shift, "%Y-%m-%d")
+    offset_ms = (day - datetime.strptime(window.shifts[0], "%Y-%m-%d")).days * DAY_MS
+    start_ms = window.start_minute * 60_000
+    if not window.overnight:
+        return [Segment(shift, start_ms, window.end_minute * 60_000, offset_ms)]
+
+    next_date = (day + timedelta(days=1)).strftime("%Y-%m-%d")
+    return [
+        Segment(shift, start_ms, DAY_MS, offset_ms),
+        Segment(next_date, 0, (window.end_minute - 24 * 60) * 60_000, offset_ms + DAY_MS),
+    ]
+
+
+async def fan_out(shifts: List[str], compute: Callable[[str], Awaitable[Any]],
+                  concurrency: int = RANGE_CONCURRENCY) -> AsyncIterator[Tuple[str, Any]]:
+    """Runs compute(shift) for every shift, at most `concurrency` at a time, yielding in completion order."""
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(shift):
+        async with semaphore:
+            return shift, await compute(shift)
+
+    tasks = [asyncio.create_task(run(shift)) for shift in shifts]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        # The client went away or a shift failed: don't leave scans running
+        for task in tasks:
+            task.cancel()
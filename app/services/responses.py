@@ -0,0 +1,55 @@
+# app/services/responses.py
+"""
+orjson encoding of API responses.
+
+FastAPI runs whatever a route returns through jsonable_encoder, a Python
+walk over every value, before its response class encodes the result. For
+a throughput day in one-minute bins or journeys with raw telegrams that
+walk costs more than the encoding itself. KPI routes therefore return a
+KPIResponse (or, for lists, an NDJSON stream), which orjson encodes
+directly; numpy scalars and arrays and non-string dict keys such as
+histogram bin edges are handled natively.
+"""
+from typing import Any, AsyncIterator
+
+import orjson
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+
+from app.services.metrics import stage
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, option=ORJSON_OPTIONS)
+
+
+class KPIResponse(Response):
+    """A JSON response encoded by orjson, timed as the "serialize" stage."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        with stage("serialize"):
+            return dumps(content)
+
+
+def ndjson_response(lines: AsyncIterator[Any]) -> StreamingResponse:
+    """One JSON document per line, each sent as soon as `lines` yields it."""
+    async def encode():
+        try:
+            async for line in lines:
+                yield orjson.dumps(line, option=ORJSON_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+        except Exception as e:
+            # The status line has already been sent; report the failure in-band
+            yield orjson.dumps({"error": str(e)}, option=orjson.OPT_APPEND_NEWLINE)
+
+    return StreamingResponse(encode(), media_type=NDJSON_MEDIA_TYPE)
+
+
+def wants_ndjson(request: Request) -> bool:
+    """Whether the client asked for a list result as an NDJSON stream (Accept: application/x-ndjson)."""
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
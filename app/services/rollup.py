@@ -0,0 +1,396 @@
+# app/services/rollup.py
+"""
+Per-minute KPI rollups for date collections.
+
+Each bucket document in the sidecar collection holds the counters of one
+minute of one date, so any start_time/end_time/bin_size query is answered by
+summing at most 1440 small documents instead of re-reading every parcel:
+
+    reg_*      parcels whose registerTS falls in the minute (/summary, /volume)
+    reg_host_ids  distinct hostIds of those parcels (/summary)
+    height.*   dimension histograms of those parcels (/volume)
+    in_count   parcels whose first "in" event falls in the minute (/throughput)
+    out_count  parcels whose OUT event falls in the minute (/throughput)
+    overflow_events  parcels whose overflow event falls in the minute (/throughput)
+    at.*       the reg_*, reg_host_ids and event counters of the parcels stamped
+               exactly on the minute's first millisecond
+
+Summary and throughput windows include their end time, HH:MM:00,000, like
+the document scan, so a window adds the "at" counters of its end minute to
+the whole minutes before it. "reg_host_ids" lists the distinct hostIds
+registered in the minute, so a window counts each hostId once however many
+documents carry it, like the scan and the pipeline.
+
+A date is served from its rollup once the site clock (app.services.siteclock)
+has closed it. Its rollup is built in the background on the first request
+that finds it missing or stale, or with ``python -m app.jobs.rollup``;
+requests scan the collection until it is ready. The meta document records
+the parcel count and the last _id the rollup covers, and the rollup is
+rebuilt when the collection has gained or lost parcels since, or when the
+kpi_rules or overflow_locations differ from those it was built with.
+
+Today's collection is only served from rollups when ROLLUP_MODE=all; it is
+then extended incrementally with the parcels inserted since the last update
+(by _id), and parcels updated in place after they were rolled up are not
+revisited until the day is closed.
+"""
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import unquote
+
+import numpy as np
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.asynchronous.database import AsyncDatabase
+from pymongo.database import Database
+
+from app.config import config
+from app.services.kpi_rules import kpi_rules
+from app.services.metrics import stage
+from app.services.parcel_record import OVERFLOW_NONE, RECORD_PROJECTION, classify_parcel
+from app.services.siteclock import site_clock
+from app.services.summary_engine import merge_summary_totals
+from app.services.volume_engine import DIMENSIONS, counts_from_histogram, volume_report
+from app.services.workers import submit_background
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = os.getenv("ROLLUP_COLLECTION", "kpi_rollups")
+
+# "closed": past dates only, "all": past dates and today (incremental), "off": never
+ROLLUP_MODE = os.getenv("ROLLUP_MODE", "closed")
+
+# How often a closed date's collection is compared with its rollup's meta
+ROLLUP_CHECK_SECONDS = float(os.getenv("ROLLUP_CHECK_SECONDS", "60"))
+
+# Bumped when the bucket fields change
+ROLLUP_VERSION = 3
+
+# What a rollup's counters depend on; a rollup recorded with another one is rebuilt
+ROLLUP_FINGERPRINT = f"{ROLLUP_VERSION}-{kpi_rules.classification_fingerprint(config.get('overflow_locations', []))}"
+
+# Serializes builds and updates of the same date so they don't double count
+_build_locks = defaultdict(threading.Lock)
+# Dates with a background build queued or running
+_pending = set()
+_pending_lock = threading.Lock()
+# date -> time.monotonic() its collection last matched the rollup's meta
+_checked: Dict[str, float] = {}
+
+SOURCE_FIELDS = {**RECORD_PROJECTION, **{f"volume_data.{dim}": 1 for dim in DIMENSIONS}}
+
+
+def _meta_id(date: str) -> str:
+    return f"{date}|meta"
+
+
+def _bucket_id(date: str, minute: int) -> str:
+    return f"{date}|{minute:04d}"
+
+
+# Histogram keys are the value's type ("i" int, "f" float, "s" anything else) and its text, with
+# the characters field names may not hold %-escaped; the type comes first, so no key starts with "$"
+_KEY_ESCAPES = {"%": "%25", ".": "%2E", "$": "%24", "\0": "%00"}
+_KEY_TYPES = {"i": int, "f": float, "s": str}
+
+
+def _encode_key(value: Any) -> str:
+    if type(value) is int:
+        kind, text = "i", str(value)
+    elif type(value) is float:
+        kind, text = "f", repr(value)
+    else:
+        kind, text = "s", str(value)
+    return kind + "".join(_KEY_ESCAPES.get(c, c) for c in text)
+
+
+def _decode_key(key: str) -> Any:
+    return _KEY_TYPES[key[0]](unquote(key[1:]))
+
+
+# ---------------------------------------------------------------------------
+# Building
+# ---------------------------------------------------------------------------
+
+def _prefixes(ts_ms: int) -> Tuple[str, ...]:
+    # Counted for the whole minute, and again under "at." when stamped on its first millisecond
+    return ("", "at.") if ts_ms % 60_000 == 0 else ("",)
+
+
+def _accumulate(docs: Iterable[Dict[str, Any]], overflow_locations) -> Dict[int, Dict[str, Dict[str, Any]]]:
+    buckets = defaultdict(lambda: {"$inc": defaultdict(int), "$min": {}, "$max": {}, "hosts": defaultdict(set)})
+
+    def bump(ts_ms, field):
+        if ts_ms is not None:
+            inc = buckets[ts_ms // 60_000]["$inc"]
+            for prefix in _prefixes(ts_ms):
+                inc[prefix + field] += 1
+
+    for doc in docs:
+        r = classify_parcel(doc, overflow_locations)
+
+        bump(r.in_ms, "in_count")
+        bump(r.out_ms, "out_count")
+        if r.overflow != OVERFLOW_NONE:
+            bump(r.overflow_ms, "overflow_events")
+
+        if r.register_ms is None:
+            continue
+        bucket = buckets[r.register_ms // 60_000]
+        inc, low, high = bucket["$inc"], bucket["$min"], bucket["$max"]
+        for prefix in _prefixes(r.register_ms):
+            inc[prefix + "reg_parcels"] += 1
+            if r.host_id:
+                bucket["hosts"][prefix].add(r.host_id)
+            inc[prefix + "reg_sorted"] += r.is_sorted
+            inc[prefix + "reg_in_system"] += r.in_system
+            inc[prefix + "reg_overflow"] += r.overflow != OVERFLOW_NONE
+            inc[prefix + "reg_barcode_ok"] += r.barcode_read
+            inc[prefix + "reg_volume_valid"] += r.volume_valid
+            inc[prefix + "reg_tracking_ok"] += r.tracking_ok
+            if r.in_ms is not None:
+                inc[prefix + "reg_in_count"] += 1
+                low[prefix + "reg_in_min"] = min(low.get(prefix + "reg_in_min", r.in_ms), r.in_ms)
+                high[prefix + "reg_in_max"] = max(high.get(prefix + "reg_in_max", r.in_ms), r.in_ms)
+
+        volume = doc.get("volume_data") or {}
+        for dim in DIMENSIONS:
+            value = volume.get(dim)
+            if value is not None:
+                inc[f"{dim}.{_encode_key(value)}"] += 1
+
+    return buckets
+
+
+def _write(db: Database, date: str, buckets) -> int:
+    ops = []
+    for minute, update in buckets.items():
+        body = {"$setOnInsert": {"date": date, "minute": minute}, "$inc": dict(update["$inc"])}
+        if update["$min"]:
+            body["$min"] = update["$min"]
+            body["$max"] = update["$max"]
+        if update["hosts"]:
+            body["$addToSet"] = {f"{prefix}reg_host_ids": {"$each": list(hosts)}
+                                 for prefix, hosts in update["hosts"].items()}
+        ops.append(UpdateOne({"_id": _bucket_id(date, minute)}, body, upsert=True))
+    if ops:
+        db[ROLLUP_COLLECTION].bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def _scan(db: Database, date: str, after_id: Optional[Any], batch_size: int = 2000):
+    query = {"_id": {"$gt": after_id}} if after_id is not None else {}
+    last_id = after_id
+    chunk = []
+    for doc in db[date].find(query, SOURCE_FIELDS, batch_size=batch_size).sort("_id", ASCENDING):
+        chunk.append(doc)
+        last_id = doc["_id"]
+        if len(chunk) >= batch_size:
+            yield chunk, last_id
+            chunk = []
+    if chunk:
+        yield chunk, last_id
+
+
+def _ingest(db: Database, date: str, after_id: Optional[Any]) -> Dict[str, Any]:
+    overflow_locations = set(config.get("overflow_locations", []))
+    parcels = 0
+    last_id = after_id
+    for chunk, last_id in _scan(db, date, after_id):
+        _write(db, date, _accumulate(chunk, overflow_locations))
+        parcels += len(chunk)
+    return {"parcels": parcels, "last_id": last_id}
+
+
+def build_rollup(db: Database, date: str) -> Dict[str, Any]:
+    """(Re)builds every bucket of a date from scratch."""
+    rollups = db[ROLLUP_COLLECTION]
+    rollups.create_index([("date", ASCENDING), ("minute", ASCENDING)])
+    rollups.delete_many({"date": date})
+
+    closed = site_clock.is_closed(date)
+    result = _ingest(db, date, None)
+    rollups.replace_one(
+        {"_id": _meta_id(date)},
+        {"date": date, "meta": True, "closed": closed, "fingerprint": ROLLUP_FINGERPRINT,
+         "last_id": result["last_id"], "parcels": result["parcels"], "built_at": datetime.now()},
+        upsert=True,
+    )
+    return {"date": date, "closed": closed, "parcels": result["parcels"]}
+
+
+def update_rollup(db: Database, date: str, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Adds the parcels inserted since the last build/update to the buckets."""
+    rollups = db[ROLLUP_COLLECTION]
+    meta = meta if meta is not None else rollups.find_one({"_id": _meta_id(date)})
+    if meta is None:
+        return build_rollup(db, date)
+
+    result = _ingest(db, date, meta.get("last_id"))
+    if result["parcels"]:
+        rollups.update_one(
+            {"_id": _meta_id(date)},
+            {"$set": {"last_id": result["last_id"], "built_at": datetime.now()},
+             "$inc": {"parcels": result["parcels"]}},
+        )
+    return {"date": date, "closed": meta.get("closed", False), "parcels": result["parcels"]}
+
+
+def _background_build(db: Database, date: str) -> None:
+    try:
+        with _build_locks[date]:
+            build_rollup(db, date)
+    except Exception:
+        logger.exception("Rollup of %s failed", date)
+    finally:
+        with _pending_lock:
+            _pending.discard(date)
+
+
+def schedule_build(db: Database, date: str) -> None:
+    """Queues a rebuild of `date`'s rollup, unless one is queued already."""
+    with _pending_lock:
+        if date in _pending:
+            return
+        _pending.add(date)
+    _checked.pop(date, None)
+    submit_background(_background_build, db, date)
+
+
+def _source_unchanged(db: Database, date: str, meta: Dict[str, Any]) -> bool:
+    """Whether the collection still holds the parcels the rollup was built from, checked every ROLLUP_CHECK_SECONDS."""
+    checked = _checked.get(date)
+    if checked is not None and time.monotonic() - checked < ROLLUP_CHECK_SECONDS:
+        return True
+    last = db[date].find_one({}, {"_id": 1}, sort=[("_id", DESCENDING)])
+    unchanged = (db[date].estimated_document_count() == meta.get("parcels")
+                 and (last["_id"] if last else None) == meta.get("last_id"))
+    if unchanged:
+        _checked[date] = time.monotonic()
+    return unchanged
+
+
+def ensure_rollup(db: Database, date: str) -> bool:
+    """
+    Tells the caller whether to answer `date` from its rollup. A missing or
+    stale rollup is rebuilt in the background and the caller scans meanwhile.
+    """
+    if ROLLUP_MODE == "off":
+        return False
+
+    closed = site_clock.is_closed(date)
+    if not closed and not (ROLLUP_MODE == "all" and site_clock.is_today(date)):
+        return False
+
+    with stage("rollup"):
+        if date in _pending:
+            return False
+        meta = db[ROLLUP_COLLECTION].find_one({"_id": _meta_id(date)})
+        current = meta is not None and meta.get("fingerprint") == ROLLUP_FINGERPRINT
+        if current and not closed:
+            # Only the parcels inserted since the last update
+            with _build_locks[date]:
+                update_rollup(db, date, meta)
+            return True
+        # Rollups started while the date was still open are rebuilt once it is closed
+        if current and meta.get("closed") and _source_unchanged(db, date, meta):
+            return True
+    schedule_build(db, date)
+    return False
+
+
+# ---------------------------------------------------------------------------
+# Querying
+# ---------------------------------------------------------------------------
+
+# SummaryAccumulator.totals() field -> bucket field; "hosts" is counted from reg_host_ids
+BUCKET_SUMMARY_FIELDS = {
+    "total_in_system": "reg_in_system",
+    "sorted_parcels": "reg_sorted",
+    "overflow": "reg_overflow",
+    "barcode_read": "reg_barcode_ok",
+    "volume_valid": "reg_volume_valid",
+    "tracking_ok": "reg_tracking_ok",
+    "in_count": "reg_in_count",
+    "in_min": "reg_in_min",
+    "in_max": "reg_in_max",
+}
+
+
+async def load_buckets(db: AsyncDatabase, date: str, start_minute: int, end_minute: int,
+                       hosts: bool = False) -> List[Dict[str, Any]]:
+    """
+    Buckets of `date` with start_minute <= minute <= end_minute, in minute
+    order; with their hostIds only when `hosts`, as only /summary needs them.
+    """
+    query = {"date": date, "minute": {"$gte": start_minute, "$lte": end_minute}}
+    projection = None if hosts else {"reg_host_ids": 0, "at.reg_host_ids": 0}
+    with stage("fetch"):
+        return await db[ROLLUP_COLLECTION].find(query, projection).sort("minute", ASCENDING).to_list(None)
+
+
+def _window(buckets: List[Dict[str, Any]], start_minute: int, end_minute: int) -> List[Dict[str, Any]]:
+    """The counters of [start_minute:00.000, end_minute:00.000]: whole buckets, then end_minute's "at"."""
+    window = [b for b in buckets if start_minute <= b["minute"] < end_minute]
+    window += [b["at"] for b in buckets if b["minute"] == end_minute and "at" in b]
+    return window
+
+
+def summary_totals_from_buckets(buckets: List[Dict[str, Any]], start_minute: int,
+                                end_minute: int) -> Dict[str, Any]:
+    """
+    Same shape as SummaryAccumulator.totals(), for registerTS in
+    [start_minute:00.000, end_minute:00.000]. The buckets must be loaded
+    with hosts=True.
+    """
+    window = _window(buckets, start_minute, end_minute)
+    totals = merge_summary_totals(
+        {field: b[bucket_field] for field, bucket_field in BUCKET_SUMMARY_FIELDS.items() if bucket_field in b}
+        for b in window
+    )
+    totals["hosts"] = len(set().union(*(b.get("reg_host_ids", ()) for b in window)))
+    return totals
+
+
+def throughput_from_buckets(buckets: List[Dict[str, Any]], start_minute: int, end_minute: int) -> Dict[str, Any]:
+    """Same shape as ThroughputAccumulator.result(), for [start_minute:00.000, end_minute:00.000]."""
+    in_per_minute = np.zeros(end_minute - start_minute + 1, dtype=np.int64)
+    out_per_minute = np.zeros(end_minute - start_minute + 1, dtype=np.int64)
+    overflow = 0
+    for b in buckets:
+        minute = b["minute"]
+        if minute == end_minute:
+            # Only the end time's own millisecond
+            b = b.get("at", {})
+        elif not start_minute <= minute < end_minute:
+            continue
+        in_per_minute[minute - start_minute] = b.get("in_count", 0)
+        out_per_minute[minute - start_minute] = b.get("out_count", 0)
+        overflow += b.get("overflow_events", 0)
+
+    return {
+        "total_in": int(in_per_minute.sum()),
+        "total_out": int(out_per_minute.sum()),
+        "overflow": overflow,
+        "in_per_minute": in_per_minute,
+        "out_per_minute": out_per_minute,
+    }
+
+
+def volume_columns_from_buckets(buckets: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Same shape as VolumeAccumulator.columns()."""
+    histograms = {dim: defaultdict(int) for dim in DIMENSIONS}
+    for b in buckets:
+        for dim in DIMENSIONS:
+            for key, count in (b.get(dim) or {}).items():
+                histograms[dim][_decode_key(key)] += count
+
+    return {dim: counts_from_histogram(histograms[dim]) for dim in DIMENSIONS}
+
+
+def volume_from_buckets(buckets: List[Dict[str, Any]], bin_width: Optional[float] = None) -> Dict[str, Any]:
+    return volume_report(volume_columns_from_buckets(buckets), bin_width)
@@ -0,0 +1,57 @@
+# app/services/siteclock.py
+"""
+The site's calendar: which date collection is today's, and when a day is
+closed for good.
+
+Date collections are named after the site's local date, which need not be
+the server's (Render runs in UTC). Configured under "site" in config.json:
+
+    "site": {"timezone": "Europe/Amsterdam", "close_grace_minutes": 120}
+
+timezone is an IANA name and defaults to the server's local time. A day
+only counts as closed close_grace_minutes after the midnight that ends
+it, so events that still arrive for its last parcels are counted before
+anything treats the day as final.
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from app.config import config
+
+
+class SiteClock:
+    def __init__(self, section: Optional[Dict[str, Any]] = None):
+        section = section or {}
+        name = section.get("timezone")
+        try:
+            self.timezone = ZoneInfo(name) if name else None
+        except (ZoneInfoNotFoundError, ValueError) as e:
+            raise ValueError(f"site.timezone: unknown time zone {name!r}") from e
+        grace = section.get("close_grace_minutes", 120)
+        if isinstance(grace, bool) or not isinstance(grace, (int, float)) or grace < 0:
+            raise ValueError("site.close_grace_minutes must be a number >= 0")
+        self.close_grace = timedelta(minutes=grace)
+
+    def now(self) -> datetime:
+        """The site's wall-clock time, naive like the timestamps in the collections."""
+        if self.timezone is None:
+            return datetime.now()
+        return datetime.now(self.timezone).replace(tzinfo=None)
+
+    def today(self) -> str:
+        return self.now().strftime("%Y-%m-%d")
+
+    def is_today(self, date: str) -> bool:
+        return date == self.today()
+
+    def is_closed(self, date: str) -> bool:
+        """Whether `date` ended more than the grace period ago; False for names that are not dates."""
+        try:
+            day = datetime.strptime(date, "%Y-%m-%d")
+        except ValueError:
+            return False
+        return self.now() >= day + timedelta(days=1) + self.close_grace
+
+
+site_clock = SiteClock(config.get("site"))
@@ -0,0 +1,289 @@
+# app/services/snapshots.py
+"""
+Precomputed KPI snapshots of today's standard windows.
+
+The windows operations watch all day are listed under "snapshots" in
+config.json:
+
+    "snapshots": {
+        "refresh_seconds": 60,
+        "kpis": ["summary", "throughput"],
+        "bin_size": 60,
+        "windows": [
+            {"name": "shift_1", "start_time": "06:00", "end_time": "14:00"},
+            {"name": "last_hour", "last_minutes": 60},
+            ...
+        ]
+    }
+
+A window has a fixed start_time/end_time, or covers the last_minutes up to
+the refresh (clamped at midnight). Every refresh_seconds the scheduler
+reads today's collection once into a per-minute DayProfile
+(app.services.day_engine), slices each window for each KPI out of it and
+stores the responses. A /summary or /throughput request whose body equals
+a snapshot's request is answered from the snapshot, with an "as_of" field
+saying when it was computed. Snapshots older than max_age_seconds
+(default three refresh intervals) are not served.
+
+Snapshots are kept per process: with several uvicorn workers each one
+refreshes its own. SNAPSHOTS_ENABLED=0 turns the scheduler off.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional
+
+from fastapi import HTTPException
+from pymongo.asynchronous.database import AsyncDatabase
+
+from app.config import config
+from app.models.kpi_model import DateRequest
+from app.services.cache import request_key
+from app.services.catalog import collection_catalog
+from app.services.day_engine import DayProfile
+from app.services.metrics import mark_cache
+from app.services.parallel import reduce_kpi
+from app.services.siteclock import site_clock
+from app.services.timeparse import parse_hhmm
+from app.services.workers import run_in_worker
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOTS_ENABLED = os.getenv("SNAPSHOTS_ENABLED", "1") == "1"
+
+# A KPI's response to one window's request, sliced from the day profile
+Render = Callable[[DateRequest, DayProfile], Any]
+
+
+class Window(NamedTuple):
+    name: str
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    last_minutes: Optional[int] = None
+
+    def bounds(self, now: datetime) -> tuple:
+        """(start_time, end_time) of the window at `now`."""
+        if self.last_minutes is None:
+            return self.start_time, self.end_time
+        midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        start = max(now - timedelta(minutes=self.last_minutes), midnight)
+        return start.strftime("%H:%M"), now.strftime("%H:%M")
+
+
+class Snapshot(NamedTuple):
+    window: str
+    kpi: str
+    request: DateRequest
+    value: Any
+    as_of: str           # ISO timestamp of the refresh
+    computed_at: float   # time.monotonic()
+    seconds: float
+
+
+class SnapshotSettings(NamedTuple):
+    windows: List[Window]
+    kpis: List[str]
+    refresh_seconds: float
+    max_age_seconds: float
+    bin_size: Optional[int]
+
+
+def load_settings(section: Optional[Dict[str, Any]]) -> SnapshotSettings:
+    """The "snapshots" section of config.json; raises ValueError when it is malformed."""
+    section = section or {}
+    windows = []
+    for entry in section.get("windows", []):
+        window = Window(entry.get("name"), entry.get("start_time"), entry.get("end_time"), entry.get("last_minutes"))
+        if not window.name:
+            raise ValueError("Every snapshot window needs a name")
+        if window.last_minutes is not None:
+            if not isinstance(window.last_minutes, int) or not 1 <= window.last_minutes <= 24 * 60:
+                raise ValueError(f"Snapshot window {window.name}: last_minutes must be 1 to 1440")
+        else:
+            start, end = parse_hhmm(window.start_time), parse_hhmm(window.end_time)
+            if start is None or end is None or end <= start:
+                raise ValueError(f"Snapshot window {window.name}: needs start_time < end_time as HH:MM, "
+                                 "or last_minutes")
+        windows.append(window)
+    if len({window.name for window in windows}) != len(windows):
+        raise ValueError("Snapshot window names must be unique")
+
+    refresh_seconds = float(section.get("refresh_seconds", 60))
+    if refresh_seconds <= 0:
+        raise ValueError("Snapshot refresh_seconds must be positive")
+    return SnapshotSettings(
+        windows=windows,
+        kpis=list(section.get("kpis", ["summary", "throughput"])),
+        refresh_seconds=refresh_seconds,
+        max_age_seconds=float(section.get("max_age_seconds", 3 * refresh_seconds)),
+        bin_size=section.get("bin_size", 60),
+    )
+
+
+class SnapshotStore:
+    """The latest snapshot per (window, KPI), looked up by request."""
+
+    def __init__(self, max_age: float):
+        self.max_age = max_age
+        self._by_name: Dict[tuple, Snapshot] = {}
+        self._by_request: Dict[Hashable, Snapshot] = {}
+        self.hits = 0
+
+    def put(self, snapshot: Snapshot) -> None:
+        previous = self._by_name.get((snapshot.window, snapshot.kpi))
+        if previous is not None:
+            # A moving window's old request no longer matches it
+            self._by_request.pop(request_key(previous.kpi, previous.request), None)
+        self._by_name[(snapshot.window, snapshot.kpi)] = snapshot
+        self._by_request[request_key(snapshot.kpi, snapshot.request)] = snapshot
+
+    def _fresh(self, snapshot: Optional[Snapshot]) -> Optional[Snapshot]:
+        if snapshot is None or time.monotonic() - snapshot.computed_at > self.max_age:
+            return None
+        return snapshot
+
+    def match(self, kpi: str, payload: DateRequest) -> Optional[Dict[str, Any]]:
+        """The stored response for exactly this request, with its as_of; None when there is none or it is stale."""
+        snapshot = self._fresh(self._by_request.get(request_key(kpi, payload)))
+        if snapshot is None:
+            return None
+        self.hits += 1
+        mark_cache("snapshot")
+        return response(snapshot)
+
+    def get(self, window: str, kpi: str) -> Optional[Snapshot]:
+        return self._fresh(self._by_name.get((window, kpi)))
+
+    def all(self) -> List[Snapshot]:
+        return list(self._by_name.values())
+
+    def clear(self, date: Optional[str] = None) -> None:
+        for key, snapshot in list(self._by_name.items()):
+            if date is None or snapshot.request.date == date:
+                del self._by_name[key]
+                self._by_request.pop(request_key(snapshot.kpi, snapshot.request), None)
+
+
+def response(snapshot: Snapshot) -> Dict[str, Any]:
+    value = snapshot.value if isinstance(snapshot.value, dict) else {"value": snapshot.value}
+    return {**value, "as_of": snapshot.as_of, "snapshot": snapshot.window}
+
+
+class SnapshotScheduler:
+    """Refreshes every configured window of today in the background."""
+
+    def __init__(self, settings: SnapshotSettings, store: SnapshotStore):
+        self.settings = settings
+        self.store = store
+        self.renderers: Dict[str, Render] = {}
+        self.errors: Dict[tuple, str] = {}
+        self.refreshes = 0
+        self.last_refresh_seconds: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self._refreshed: Optional[asyncio.Event] = None
+
+    def register(self, kpi: str, render: Render) -> None:
+        """The function answering a KPI's request from the day profile, e.g. summary_from_profile."""
+        self.renderers[kpi] = render
+
+    @property
+    def enabled(self) -> bool:
+        return SNAPSHOTS_ENABLED and bool(self.settings.windows)
+
+    def start(self, db: AsyncDatabase) -> None:
+        unknown = set(self.settings.kpis) - set(self.renderers)
+        if unknown:
+            raise ValueError(f"No snapshot computation for {sorted(unknown)}")
+        if self.enabled and self._task is None:
+            self._refreshed = asyncio.Event()
+            self._task = asyncio.create_task(self._run(db))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    async def _run(self, db: AsyncDatabase) -> None:
+        while True:
+            started = time.monotonic()
+            try:
+                await self.refresh(db)
+            except Exception:
+                logger.exception("Snapshot refresh failed")
+            self._refreshed.set()
+            await asyncio.sleep(max(0.0, self.settings.refresh_seconds - (time.monotonic() - started)))
+
+    async def wait_refreshed(self) -> None:
+        """Returns once every window has been refreshed at least once since start(); at once if not running."""
+        if self._task is not None:
+            await self._refreshed.wait()
+
+    def request(self, window: Window, kpi: str, now: datetime) -> DateRequest:
+        start_time, end_time = window.bounds(now)
+        bin_size = self.settings.bin_size if kpi == "throughput" else None
+        return DateRequest(date=now.strftime("%Y-%m-%d"), start_time=start_time, end_time=end_time, bin_size=bin_size)
+
+    async def refresh(self, db: AsyncDatabase) -> None:
+        """Recomputes every window of today from one pass over today's collection."""
+        now = site_clock.now()
+        date = now.strftime("%Y-%m-%d")
+        started = time.monotonic()
+        requests = [(window, kpi, self.request(window, kpi, now))
+                    for window in self.settings.windows for kpi in self.settings.kpis]
+        # A last-minutes window right after midnight is still empty
+        requests = [(window, kpi, payload) for window, kpi, payload in requests
+                    if parse_hhmm(payload.end_time) > parse_hhmm(payload.start_time)]
+
+        profile = None
+        if not await collection_catalog.exists(db, date):
+            for window, kpi, _ in requests:
+                self.errors[(window.name, kpi)] = f"No collection found for date {date}"
+            requests = []
+        elif await db[date].find_one({}, {"_id": 1}) is not None:
+            overflow_locations = set(config.get("overflow_locations", []))
+            profile = await reduce_kpi(db[date], "day", tuple(self.settings.kpis), overflow_locations)
+
+        for window, kpi, payload in requests:
+            computed = time.monotonic()
+            try:
+                if profile is None:
+                    value = {"message": "No data found for this date"}
+                else:
+                    value = await run_in_worker(self.renderers[kpi], payload, profile)
+            except HTTPException as e:
+                self.errors[(window.name, kpi)] = str(e.detail)
+                continue
+            except Exception as e:
+                logger.exception("Snapshot %s/%s failed", window.name, kpi)
+                self.errors[(window.name, kpi)] = str(e)
+                continue
+            self.errors.pop((window.name, kpi), None)
+            self.store.put(Snapshot(window.name, kpi, payload, value, now.isoformat(timespec="seconds"),
+                                    time.monotonic(), round(time.monotonic() - computed, 3)))
+
+        self.refreshes += 1
+        self.last_refresh_seconds = round(time.monotonic() - started, 3)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "running": self._task is not None and not self._task.done(),
+            "windows": [window.name for window in self.settings.windows],
+            "kpis": self.settings.kpis,
+            "refresh_seconds": self.settings.refresh_seconds,
+            "refreshes": self.refreshes,
+            "last_refresh_seconds": self.last_refresh_seconds,
+            "hits": self.store.hits,
+            "errors": {f"{window}/{kpi}": error for (window, kpi), error in self.errors.items()},
+        }
+
+
+snapshot_settings = load_settings(config.get("snapshots"))
+snapshot_store = SnapshotStore(snapshot_settings.max_age_seconds)
+snapshot_scheduler = SnapshotScheduler(snapshot_settings, snapshot_store)
@@ -0,0 +1,166 @@
+# app/services/startup.py
+"""
+Startup warm-up and the readiness/liveness state behind /health.
+
+config.json is checked when app.config is imported, and its sections when
+main imports the modules that compile them, so a malformed deploy fails
+before the server binds its port. After the lifespan has opened the
+MongoDB clients, a background task warms everything a first request would
+otherwise pay for, one phase after the other:
+
+    database    a ping through the async and the sync client, retried until
+                MongoDB answers; opens the first pooled connection of each
+    catalog     the collection listing behind the routes' date checks
+    workers     the KPI process pool, started and each worker's imports and
+                MongoClient done, when today's collection is large enough
+                to be reduced in parallel (PARALLEL_MIN_DOCS)
+    snapshots   the first refresh of today's snapshot windows, i.e. today's
+                aggregates as operations will request them
+
+/health/live answers as soon as the process serves HTTP. /health/ready
+answers 503 until the warm-up has finished and the database was reached,
+so a platform health check (e.g. Render's) only routes traffic to a warm
+instance. Only the database phase is required; a phase that fails or
+exceeds WARMUP_TIMEOUT_SECONDS is reported and skipped.
+
+    STARTUP_REQUIRE_DB=1         abort startup when MongoDB cannot be reached
+    WARMUP_TIMEOUT_SECONDS=120   per phase, database retries excepted
+    WARMUP_DB_RETRY_SECONDS=2
+"""
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from pymongo.asynchronous.database import AsyncDatabase
+
+from app.database import db
+from app.services.catalog import collection_catalog
+from app.services.parallel import PARALLEL_MIN_DOCS, warm_up_worker
+from app.services.siteclock import site_clock
+from app.services.snapshots import snapshot_scheduler
+from app.services.workers import KPI_PROCESSES, process_pool, run_in_process, run_in_worker
+
+logger = logging.getLogger(__name__)
+
+STARTUP_REQUIRE_DB = os.getenv("STARTUP_REQUIRE_DB", "0") == "1"
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("WARMUP_TIMEOUT_SECONDS", "120"))
+WARMUP_DB_RETRY_SECONDS = float(os.getenv("WARMUP_DB_RETRY_SECONDS", "2"))
+
+
+async def ping(adb: AsyncDatabase) -> None:
+    """One round-trip through each client; raises when MongoDB cannot be reached."""
+    await adb.command("ping")
+    await run_in_worker(db.get_db().command, "ping")
+
+
+class Startup:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.import_seconds: Optional[float] = None
+        self.ready_seconds: Optional[float] = None
+        self.database_ok = False
+        self.phases: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def imported(self, started: float) -> None:
+        """Called by main once the app is built, with the time.monotonic() its imports began at."""
+        self.started = started
+        self.import_seconds = round(time.monotonic() - started, 3)
+
+    @property
+    def ready(self) -> bool:
+        return self.database_ok and self.ready_seconds is not None
+
+    def start(self, adb: AsyncDatabase) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self.warm_up(adb))
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+
+    async def _phase(self, name: str, run: Callable[[], Awaitable[Dict[str, Any]]],
+                     timeout: Optional[float] = WARMUP_TIMEOUT_SECONDS) -> None:
+        started = time.monotonic()
+        self.phases[name] = {"status": "running"}
+        try:
+            detail = await asyncio.wait_for(run(), timeout)
+            self.phases[name] = {"status": "ok", **detail}
+        except asyncio.TimeoutError:
+            logger.warning("Warm-up %s exceeded %ss", name, timeout)
+            self.phases[name] = {"status": "timeout"}
+        except Exception as e:
+            logger.warning("Warm-up %s failed: %s", name, e)
+            self.phases[name] = {"status": "failed", "error": str(e)}
+        self.phases[name]["seconds"] = round(time.monotonic() - started, 3)
+
+    async def warm_up(self, adb: AsyncDatabase) -> None:
+        await self._phase("database", lambda: self._database(adb), timeout=None)
+        await self._phase("catalog", lambda: self._catalog(adb))
+        await self._phase("workers", lambda: self._workers(adb))
+        await self._phase("snapshots", self._snapshots)
+        self.ready_seconds = round(time.monotonic() - self.started, 3)
+        logger.info("Ready %.2fs after startup: %s", self.ready_seconds, self.phases)
+
+    async def _database(self, adb: AsyncDatabase) -> Dict[str, Any]:
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                await ping(adb)
+                break
+            except Exception as e:
+                # Not ready yet, e.g. the database is still starting next to us
+                logger.warning("MongoDB not reachable (attempt %d): %s", attempts, e)
+                self.phases["database"] = {"status": "retrying", "attempts": attempts, "error": str(e)}
+                await asyncio.sleep(WARMUP_DB_RETRY_SECONDS)
+        self.database_ok = True
+        return {"attempts": attempts}
+
+    async def _catalog(self, adb: AsyncDatabase) -> Dict[str, Any]:
+        return {"collections": len(await collection_catalog.names(adb))}
+
+    async def _workers(self, adb: AsyncDatabase) -> Dict[str, Any]:
+        today = site_clock.today()
+        if KPI_PROCESSES <= 1 or not await collection_catalog.exists(adb, today):
+            return {"processes": 0}
+        if await adb[today].estimated_document_count() < PARALLEL_MIN_DOCS or process_pool() is None:
+            return {"processes": 0}
+        # Submitted together, so the pool spawns every worker instead of reusing the first
+        pids = await asyncio.gather(*(run_in_process(warm_up_worker) for _ in range(KPI_PROCESSES)))
+        return {"processes": len(set(pids))}
+
+    async def _snapshots(self) -> Dict[str, Any]:
+        if not snapshot_scheduler.enabled:
+            return {"windows": 0}
+        await snapshot_scheduler.wait_refreshed()
+        return {"windows": len(snapshot_scheduler.settings.windows),
+                "refresh_seconds": snapshot_scheduler.last_refresh_seconds}
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "uptime_seconds": round(time.monotonic() - self.started, 1),
+            "import_seconds": self.import_seconds,
+            "ready_seconds": self.ready_seconds,
+            "phases": self.phases,
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        """Numeric values for /metrics."""
+        return {
+            "ready": self.ready,
+            "import_seconds": self.import_seconds,
+            "ready_seconds": self.ready_seconds,
+            **{f"{name}_seconds": phase["seconds"] for name, phase in self.phases.items() if "seconds" in phase},
+        }
+
+
+startup = Startup()
@@ -0,0 +1,44 @@
+# app/services/streaming.py
+import asyncio
+import os
+from typing import Any, Dict, Optional
+
+from pymongo.asynchronous.collection import AsyncCollection
+
+from app.services.metrics import stage
+from app.services.workers import run_in_worker
+
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "2000"))
+
+
+async def reduce_collection(collection: AsyncCollection, projection: Dict[str, Any], accumulator: Any,
+                            query: Optional[Dict[str, Any]] = None, batch_size: int = STREAM_BATCH_SIZE) -> Any:
+    """
+    Streams the projected documents of `collection` into `accumulator.add` batch by batch.
+
+    Each batch is reduced in the worker pool while the next one is being
+    fetched, so at most two batches are held in memory whatever the size of
+    the day. Returns the accumulator.
+    """
+    cursor = collection.find(query or {}, projection, batch_size=batch_size)
+    pending = None
+    try:
+        while True:
+            with stage("fetch"):
+                batch = await cursor.to_list(batch_size)
+            if pending is not None:
+                await pending
+                pending = None
+            if not batch:
+                break
+            pending = asyncio.ensure_future(run_in_worker(_reduce, accumulator, batch))
+    finally:
+        if pending is not None:
+            pending.cancel()
+        await cursor.close()
+    return accumulator
+
+
+def _reduce(accumulator: Any, batch: list) -> None:
+    with stage("reduce"):
+        accumulator.add(batch)
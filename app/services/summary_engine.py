@@ -0,0 +1,285 @@
+# app/services/summary_engine.py
+from typing import Any, Collection, Dict, Iterable, List
+
+from pymongo.asynchronous.collection import AsyncCollection
+
+from app.services.kpi_rules import kpi_rules
+from app.services.parcel_record import MATERIALIZED_EXPR, OVERFLOW_NONE, ParcelRecord, classify_parcel
+
+NUMERIC_TYPES = ["int", "long", "double"]
+
+
+# ---------------------------------------------------------------------------
+# Reference implementation: pulls the documents into Python
+# ---------------------------------------------------------------------------
+
+class SummaryAccumulator:
+    """Reduces parcels to the /summary KPIs for one registerTS window, batch by batch."""
+
+    def __init__(self, start_ms: int, end_ms: int, overflow_locations: Collection[str]):
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.overflow_locations = overflow_locations
+        self.unique_hosts = set()
+        self.total_in_system = self.sorted_parcels = self.overflow = 0
+        self.barcode_read = self.volume_valid = self.tracking_ok = 0
+        self.in_count = 0
+        self.in_min = self.in_max = None
+
+    def add(self, parcels: Iterable[Dict[str, Any]]) -> None:
+        for p in parcels:
+            self.add_record(classify_parcel(p, self.overflow_locations))
+
+    def add_record(self, r: ParcelRecord) -> None:
+        # --- Filter parcels by time range ---
+        if r.register_ms is None or not (self.start_ms <= r.register_ms <= self.end_ms):
+            return
+
+        if r.host_id:
+            self.unique_hosts.add(r.host_id)
+        self.sorted_parcels += r.is_sorted
+        self.total_in_system += r.in_system
+        self.overflow += r.overflow != OVERFLOW_NONE
+        self.barcode_read += r.barcode_read
+        self.volume_valid += r.volume_valid
+        self.tracking_ok += r.tracking_ok
+        if r.in_ms is not None:
+            self.in_count += 1
+            self.in_min = r.in_ms if self.in_min is None else min(self.in_min, r.in_ms)
+            self.in_max = r.in_ms if self.in_max is None else max(self.in_max, r.in_ms)
+
+    def totals(self) -> Dict[str, Any]:
+        return {
+            "hosts": len(self.unique_hosts),
+            "total_in_system": self.total_in_system,
+            "sorted_parcels": self.sorted_parcels,
+            "overflow": self.overflow,
+            "barcode_read": self.barcode_read,
+            "volume_valid": self.volume_valid,
+            "tracking_ok": self.tracking_ok,
+            "in_count": self.in_count,
+            "in_min": self.in_min,
+            "in_max": self.in_max,
+        }
+
+    def result(self) -> Dict[str, Any]:
+        return summary_from_totals(self.totals())
+
+
+# Counters every engine reduces a window to; they add up across windows and days
+SUMMARY_COUNTERS = ("hosts", "total_in_system", "sorted_parcels", "overflow", "barcode_read", "volume_valid",
+                    "tracking_ok", "in_count")
+
+
+def merge_summary_totals(parts: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Adds up the totals of several windows. in_min/in_max must already be on
+    a common time axis. Hosts are summed, i.e. a hostId is assumed to appear
+    in one date collection only.
+    """
+    merged = {field: 0 for field in SUMMARY_COUNTERS}
+    merged["in_min"] = merged["in_max"] = None
+    for part in parts:
+        for field in SUMMARY_COUNTERS:
+            merged[field] += part.get(field, 0)
+        if part.get("in_min") is not None:
+            merged["in_min"] = part["in_min"] if merged["in_min"] is None else min(merged["in_min"], part["in_min"])
+            merged["in_max"] = part["in_max"] if merged["in_max"] is None else max(merged["in_max"], part["in_max"])
+    return merged
+
+
+def offset_summary_totals(totals: Dict[str, Any], offset_ms: int) -> Dict[str, Any]:
+    """Moves in_min/in_max from ms of day onto a multi-day time axis."""
+    if totals.get("in_min") is None:
+        return totals
+    return {**totals, "in_min": totals["in_min"] + offset_ms, "in_max": totals["in_max"] + offset_ms}
+
+
+def summary_from_totals(totals: Dict[str, Any]) -> Dict[str, Any]:
+    in_count = totals.get("in_count", 0)
+    in_span_hours = (totals["in_max"] - totals["in_min"]) / 3_600_000 if in_count else 0.0
+    return finalize_summary(
+        totals.get("hosts", 0),
+        totals.get("total_in_system", 0),
+        totals.get("sorted_parcels", 0),
+        totals.get("overflow", 0),
+        totals.get("barcode_read", 0),
+        totals.get("volume_valid", 0),
+        in_count,
+        in_span_hours,
+        totals.get("tracking_ok", 0),
+    )
+
+
+def finalize_summary(total_parcels, total_in_system, sorted_parcels, overflow, barcode_read,
+              volume_valid, in_count, in_span_hours, tracking_ok) -> Dict[str, Any]:
+    def percent(count):
+        return round((count / total_parcels) * 100, 2) if total_parcels else 0.0
+
+    throughput_per_hour = 0.0
+    if in_count and in_span_hours > 0:
+        throughput_per_hour = round(in_count / in_span_hours, 2)
+
+    return {
+        "total_parcels": total_parcels,
+        "total_in_system": total_in_system,
+        "sorted_parcels": sorted_parcels,
+        "overflow": overflow,
+        "barcode_read_ratio_percent": percent(barcode_read),
+        "volume_rate_percent": percent(volume_valid),
+        "throughput_avg_per_hour": throughput_per_hour,
+        "tracking_performance_percent": percent(tracking_ok),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Aggregation pipeline: the same KPIs computed inside MongoDB
+# ---------------------------------------------------------------------------
+
+def time_to_ms_expr(field: Any) -> Dict[str, Any]:
+    """
+    Aggregation expression turning "HH:MM:SS,mmm" or "HH:MM:SS" into
+    milliseconds since midnight. Malformed or missing values become null.
+    """
+    to_int = lambda value: {"$convert": {"input": value, "to": "int", "onError": None, "onNull": None}}
+    return {"$let": {
+        "vars": {"parts": {"$split": [
+            {"$cond": [{"$eq": [{"$type": field}, "string"]}, {"$trim": {"input": field}}, ""]}, ","
+        ]}},
+        "in": {"$let": {
+            "vars": {
+                "hms": {"$split": [{"$arrayElemAt": ["$$parts", 0]}, ":"]},
+                "frac": {"$ifNull": [{"$arrayElemAt": ["$$parts", 1]}, "0"]},
+                "extra": {"$gt": [{"$size": "$$parts"}, 2]},
+            },
+            "in": {"$let": {
+                "vars": {
+                    "h": to_int({"$arrayElemAt": ["$$hms", 0]}),
+                    "m": to_int({"$arrayElemAt": ["$$hms", 1]}),
+                    "s": to_int({"$arrayElemAt": ["$$hms", 2]}),
+                    "ms": to_int({"$substrCP": [{"$concat": ["$$frac", "000"]}, 0, 3]}),
+                },
+                "in": {"$cond": [
+                    {"$and": [
+                        {"$not": ["$$extra"]},
+                        {"$eq": [{"$size": "$$hms"}, 3]},
+                        {"$gt": [{"$strLenCP": "$$frac"}, 0]},
+                        {"$in": [{"$type": "$$h"}, ["int"]]},
+                        {"$in": [{"$type": "$$m"}, ["int"]]},
+                        {"$in": [{"$type": "$$s"}, ["int"]]},
+                        {"$in": [{"$type": "$$ms"}, ["int"]]},
+                        {"$gte": ["$$h", 0]}, {"$lte": ["$$h", 23]},
+                        {"$gte": ["$$m", 0]}, {"$lte": ["$$m", 59]},
+                        {"$gte": ["$$s", 0]}, {"$lte": ["$$s", 59]},
+                        {"$gte": ["$$ms", 0]},
+                    ]},
+                    {"$add": [
+                        {"$multiply": ["$$h", 3600000]},
+                        {"$multiply": ["$$m", 60000]},
+                        {"$multiply": ["$$s", 1000]},
+                        "$$ms",
+                    ]},
+                    None,
+                ]},
+            }},
+        }},
+    }}
+
+
+def summary_pipeline(start_ms: int, end_ms: int, overflow_locations: List[str]) -> List[Dict[str, Any]]:
+    count_if = lambda cond: {"$sum": {"$cond": [cond, 1, 0]}}
+    # Parcels written by app.jobs.materialize under the current rules and locations carry pre-parsed fields under "kpi"
+    materialized = MATERIALIZED_EXPR
+
+    return [
+        # Served by the kpi.register_ms index; parcels not materialized yet are matched below
+        {"$match": {"$or": [
+            {"kpi.register_ms": {"$gte": start_ms, "$lte": end_ms}},
+            {"kpi.register_ms": {"$exists": False}},
+        ]}},
+        {"$project": {
+            "_id": 0,
+            "hostId": 1,
+            "status": 1,
+            "sort_strategy": 1,
+            "barcode_error": 1,
+            "kpi": 1,
+            "real_volume": "$volume_data.real_volume",
+            "register_ms": {"$ifNull": ["$kpi.register_ms", time_to_ms_expr("$registerTS")]},
+            "events": {"$cond": [{"$isArray": "$events"}, "$events", []]},
+        }},
+        {"$match": {"register_ms": {"$gte": start_ms, "$lte": end_ms}}},
+        {"$project": {
+            "hostId": 1,
+            "status": 1,
+            "sort_strategy": 1,
+            "barcode_error": 1,
+            "real_volume": 1,
+            # Materialized parcels answer from their "kpi" flags, like every other field of theirs
+            "in_system": {"$cond": [materialized, kpi_rules.flag_rule_record_expr(kpi_rules.in_system, "$kpi"),
+                                    kpi_rules.flag_rule_expr(kpi_rules.in_system, "$events.msg_id")]},
+            "tracking_ok": {"$cond": [materialized, kpi_rules.flag_rule_record_expr(kpi_rules.tracking, "$kpi"),
+                                      kpi_rules.flag_rule_expr(kpi_rules.tracking, "$events.msg_id")]},
+            # First "in" event whose timestamp parses
+            "in_ms": {"$cond": [materialized, "$kpi.in_ms", {"$arrayElemAt": [
+                {"$filter": {
+                    "input": {"$map": {
+                        "input": {"$filter": {
+                            "input": "$events", "as": "e", "cond": kpi_rules.event_role_expr("in", "$$e"),
+                        }},
+                        "as": "e",
+                        "in": time_to_ms_expr("$$e.ts"),
+                    }},
+                    "as": "t",
+                    "cond": {"$ne": ["$$t", None]},
+                }},
+                0,
+            ]}]},
+            "is_overflow": {"$cond": [materialized, {"$ne": [{"$ifNull": ["$kpi.overflow", 0]}, 0]},
+                                     kpi_rules.overflow_expr("$events", "$events.msg_id", overflow_locations)]},
+        }},
+        {"$facet": {
+            "hosts": [
+                {"$match": {"hostId": {"$exists": True, "$nin": [None, "", 0, False]}}},
+                {"$group": {"_id": "$hostId"}},
+                {"$count": "n"},
+            ],
+            "totals": [
+                {"$group": {
+                    "_id": None,
+                    "sorted_parcels": count_if({"$and": [
+                        {"$eq": ["$status", "sorted"]},
+                        {"$eq": ["$sort_strategy", "1"]},
+                    ]}),
+                    "total_in_system": count_if("$in_system"),
+                    "overflow": count_if("$is_overflow"),
+                    "barcode_read": count_if({"$eq": ["$barcode_error", False]}),
+                    "volume_valid": count_if({"$and": [
+                        {"$in": [{"$type": "$real_volume"}, NUMERIC_TYPES]},
+                        {"$gt": ["$real_volume", 0]},
+                    ]}),
+                    "tracking_ok": count_if("$tracking_ok"),
+                    "in_count": count_if({"$in": [{"$type": "$in_ms"}, NUMERIC_TYPES]}),
+                    "in_min": {"$min": "$in_ms"},
+                    "in_max": {"$max": "$in_ms"},
+                }},
+            ],
+        }},
+    ]
+
+
+async def summary_totals_with_pipeline(collection: AsyncCollection, start_ms: int, end_ms: int,
+                                      overflow_locations: List[str]) -> Dict[str, Any]:
+    """Computes the /summary counters server-side; only the final counters cross the wire."""
+    pipeline = summary_pipeline(start_ms, end_ms, overflow_locations)
+    cursor = await collection.aggregate(pipeline)
+    results = await cursor.to_list(1)
+    result = results[0] if results else {"hosts": [], "totals": []}
+
+    totals = result["totals"][0] if result["totals"] else {}
+    return {
+        **{field: totals.get(field, 0) for field in SUMMARY_COUNTERS},
+        "hosts": result["hosts"][0]["n"] if result["hosts"] else 0,
+        "in_min": totals.get("in_min"),
+        "in_max": totals.get("in_max"),
+    }
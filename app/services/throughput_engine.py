@@ -0,0 +1,124 @@
+# app/services/throughput_engine.py
+from typing import Any, Collection, Dict, Iterable, List
+
+import numpy as np
+
+from app.services.parcel_record import ParcelRecord, classify_parcel
+
+MAX_BIN_SIZE = 24 * 60
+
+
+def bin_labels(start_minute: int, end_minute: int, bin_size: int) -> List[str]:
+    """"HH:MM" of every bin starting in [start_minute, end_minute); minutes past 1440 wrap to the next day."""
+    return [f"{m // 60 % 24:02d}:{m % 60:02d}" for m in range(start_minute, end_minute, bin_size)]
+
+
+def minute_counts(times_ms: List[int], start_ms: int, n_minutes: int) -> np.ndarray:
+    """Events per minute since start_ms; times must already be in [start_ms, start_ms + n_minutes min]."""
+    offsets = np.floor_divide(np.asarray(times_ms, dtype=np.int64) - start_ms, 60_000)
+    return np.bincount(offsets, minlength=n_minutes + 1)
+
+
+def bin_series(per_minute: np.ndarray, bin_size: int, n_bins: int) -> np.ndarray:
+    """Sums a per-minute series into bins of `bin_size` minutes, dropping what falls past the last bin."""
+    index = np.floor_divide(np.arange(len(per_minute)), bin_size)
+    return np.bincount(index, weights=per_minute, minlength=n_bins)[:n_bins].astype(np.int64)
+
+
+def throughput_bins(in_per_minute: np.ndarray, out_per_minute: np.ndarray, start_minute: int, end_minute: int,
+                    bin_size: int, periods: int = 1) -> Dict[str, Any]:
+    """Bins per-minute counts; averages are per bin and per period (day) when several days were summed."""
+    labels = bin_labels(start_minute, end_minute, bin_size)
+    parcels_in = bin_series(in_per_minute, bin_size, len(labels))
+    parcels_out = bin_series(out_per_minute, bin_size, len(labels))
+    n_bins = len(labels) * periods
+    return {
+        "avg_in": round(int(in_per_minute.sum()) / n_bins, 2) if n_bins else 0,
+        "avg_out": round(int(out_per_minute.sum()) / n_bins, 2) if n_bins else 0,
+        "parcels_in_time": dict(zip(labels, parcels_in.tolist())),
+        "parcels_out_time": dict(zip(labels, parcels_out.tolist())),
+    }
+
+
+class ThroughputAccumulator:
+    """
+    Counts IN/OUT/overflow parcels between start_ms and end_ms.
+
+    IN and OUT events are kept as per-minute counts, so the result can be
+    binned at any whole-minute bin size without another pass.
+    """
+
+    def __init__(self, start_ms: int, end_ms: int, overflow_locations: Collection[str]):
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.overflow_locations = overflow_locations
+        # end_ms itself is in range, so the last minute may hold the single end-boundary millisecond
+        self.n_minutes = (end_ms - start_ms) // 60_000
+        self.in_per_minute = np.zeros(self.n_minutes + 1, dtype=np.int64)
+        self.out_per_minute = np.zeros(self.n_minutes + 1, dtype=np.int64)
+        self.overflow = 0
+
+    def add(self, parcels: Iterable[Dict[str, Any]]) -> None:
+        self.add_records(classify_parcel(parcel, self.overflow_locations) for parcel in parcels)
+
+    def add_records(self, records: Iterable[ParcelRecord]) -> None:
+        start_ms, end_ms = self.start_ms, self.end_ms
+        in_times, out_times = [], []
+
+        for record in records:
+            # IN event
+            if record.in_ms is not None and start_ms <= record.in_ms <= end_ms:
+                in_times.append(record.in_ms)
+
+            # OUT event
+            if record.out_ms is not None and start_ms <= record.out_ms <= end_ms:
+                out_times.append(record.out_ms)
+
+            # Overflow (same classification as /summary, counted when the overflow event is in range)
+            if record.overflow and record.overflow_ms is not None and start_ms <= record.overflow_ms <= end_ms:
+                self.overflow += 1
+
+        if in_times:
+            self.in_per_minute += minute_counts(in_times, start_ms, self.n_minutes)
+        if out_times:
+            self.out_per_minute += minute_counts(out_times, start_ms, self.n_minutes)
+
+    def result(self) -> Dict[str, Any]:
+        return {
+            "total_in": int(self.in_per_minute.sum()),
+            "total_out": int(self.out_per_minute.sum()),
+            "overflow": self.overflow,
+            "in_per_minute": self.in_per_minute,
+            "out_per_minute": self.out_per_minute,
+        }
+
+
+def join_counts(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Per-minute counts of consecutive windows as one window, e.g. the two
+    dates of an overnight shift. Every window but the last must end at
+    midnight, so its end-boundary slot is empty and dropped.
+    """
+    in_per_minute = np.concatenate([p["in_per_minute"][:-1] for p in parts[:-1]] + [parts[-1]["in_per_minute"]])
+    out_per_minute = np.concatenate([p["out_per_minute"][:-1] for p in parts[:-1]] + [parts[-1]["out_per_minute"]])
+    return {
+        "total_in": int(in_per_minute.sum()),
+        "total_out": int(out_per_minute.sum()),
+        "overflow": sum(p["overflow"] for p in parts),
+        "in_per_minute": in_per_minute,
+        "out_per_minute": out_per_minute,
+    }
+
+
+def sum_counts(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Adds up the per-minute counts of the same window on several days."""
+    in_per_minute = np.sum([p["in_per_minute"] for p in parts], axis=0)
+    out_per_minute = np.sum([p["out_per_minute"] for p in parts], axis=0)
+    return {
+        "total_in": int(in_per_minute.sum()),
+        "total_out": int(out_per_minute.sum()),
+        "overflow": sum(p["overflow"] for p in parts),
+        "in_per_minute": in_per_minute,
+        "out_per_minute": out_per_minute,
+    }
+
@@ -0,0 +1,90 @@
+# app/services/timeparse.py
+"""
+Parsing of the sorter's time-of-day strings into milliseconds since midnight.
+
+Every registerTS and event ts is "HH:MM:SS,mmm". Accepted, after trimming
+whitespace:
+
+    H:M:S         1-2 digits each; no fraction means 0 ms
+    H:M:S,f       1 or more fraction digits; the first three are the
+                  milliseconds, so ",5" is 500 ms and ",1234" is 123 ms
+
+with hours 0-23 and minutes and seconds 0-59. Anything else, and any
+non-string, is malformed: None from parse_ms, MISSING_MS from
+parse_ms_many. This is the strptime("%H:%M:%S,%f") / ("%H:%M:%S")
+behaviour the routes had before, except that more than six fraction digits
+are truncated rather than rejected, as time_to_ms_expr does inside MongoDB.
+"""
+import re
+from typing import Any, Optional, Sequence
+
+import numpy as np
+
+MISSING_MS = -1
+
+_FIXED = re.compile(r"\d\d:\d\d:\d\d,\d\d\d", re.ASCII)
+_GENERAL = re.compile(r"(\d{1,2}):(\d{1,2}):(\d{1,2})(?:,(\d+))?", re.ASCII)
+_HHMM = re.compile(r"(\d{1,2}):(\d{1,2})", re.ASCII)
+
+# Byte offsets of the digits in "HH:MM:SS,mmm"
+_FIXED_WIDTH = 12
+_DIGITS = np.array([0, 1, 3, 4, 6, 7, 9, 10, 11])
+_WEIGHTS = np.array([36_000_000, 3_600_000, 600_000, 60_000, 10_000, 1000, 100, 10, 1], dtype=np.int64)
+
+
+def _parse_general(value: str) -> Optional[int]:
+    match = _GENERAL.fullmatch(value.strip())
+    if match is None:
+        return None
+    h, m, s, fraction = match.groups()
+    h, m, s = int(h), int(m), int(s)
+    if h > 23 or m > 59 or s > 59:
+        return None
+    return (h * 60 + m) * 60_000 + s * 1000 + (int((fraction + "00")[:3]) if fraction else 0)
+
+
+def parse_ms(value: Any) -> Optional[int]:
+    """Milliseconds since midnight of one timestamp, or None when it is missing or malformed."""
+    if type(value) is not str:
+        return None
+    if _FIXED.fullmatch(value):
+        h, m, s = int(value[:2]), int(value[3:5]), int(value[6:8])
+        if h < 24 and m < 60 and s < 60:
+            return (h * 60 + m) * 60_000 + s * 1000 + int(value[9:])
+        return None
+    return _parse_general(value)
+
+
+def parse_ms_many(values: Sequence[Any]) -> np.ndarray:
+    """
+    parse_ms over a whole column at once, as int64 with MISSING_MS for
+    missing or malformed values. Values in the fixed layout are decoded with
+    array arithmetic; only the rest go through parse_ms one by one.
+    """
+    n = len(values)
+    fixed = [v if type(v) is str and len(v) == _FIXED_WIDTH and v.isascii() else "" for v in values]
+    raw = np.array(fixed, dtype=f"S{_FIXED_WIDTH}").view(np.uint8).reshape(n, _FIXED_WIDTH)
+    # Shorter (empty) rows are zero-padded and fail the separator check
+    ok = (raw[:, 2] == ord(":")) & (raw[:, 5] == ord(":")) & (raw[:, 8] == ord(","))
+    digits = raw[:, _DIGITS].astype(np.int64) - ord("0")
+    ok &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+    ok &= (digits[:, 0] * 10 + digits[:, 1] < 24) & (digits[:, 2] < 6) & (digits[:, 4] < 6)
+
+    out = np.full(n, MISSING_MS, dtype=np.int64)
+    out[ok] = digits[ok] @ _WEIGHTS
+    for i in np.flatnonzero(~ok):
+        value = values[i]
+        if type(value) is str:
+            ms = _parse_general(value)
+            if ms is not None:
+                out[i] = ms
+    return out
+
+
+def parse_hhmm(value: Any) -> Optional[int]:
+    """Minute of day of an "HH:MM" request parameter, or None when malformed."""
+    match = _HHMM.fullmatch(value) if type(value) is str else None
+    if match is None:
+        return None
+    h, m = int(match.group(1)), int(match.group(2))
+    return h * 60 + m if h < 24 and m < 60 else None
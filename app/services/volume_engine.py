@@ -0,0 +1,187 @@
+# app/services/volume_engine.py
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.services.timeparse import parse_ms_many
+
+DIMENSIONS = ("height", "width", "length")
+
+# The only fields /volume reads
+VOLUME_PROJECTION = {"registerTS": 1, **{f"volume_data.{dim}": 1 for dim in DIMENSIONS}}
+
+PERCENTILES = (50, 90, 99)
+
+# Tukey fences: values beyond 1.5 IQR outside the quartiles are outliers
+OUTLIER_IQR_FACTOR = 1.5
+
+
+# ---------------------------------------------------------------------------
+# Distributions from (distinct values, counts)
+#
+# Both the document scan and the rollup reduce a dimension to its sorted
+# distinct values and their counts; every statistic below is exact on that
+# form, so the two paths return the same numbers. The distinct values keep
+# the types they are stored with, so the *_distribution keys read "10" for
+# an int and "10.5" for a float even in a column holding both; only the
+# statistics cast them to float.
+# ---------------------------------------------------------------------------
+
+def _column(values: List[Any]) -> np.ndarray:
+    # int64 or float64 when the values share that type, else an object array of the values as they are
+    if all(type(v) is int for v in values):
+        return np.array(values, dtype=np.int64)
+    if all(type(v) is float for v in values):
+        return np.array(values, dtype=float)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+
+def _concatenate(arrays: List[np.ndarray]) -> np.ndarray:
+    # int64 and float64 chunks of one column would otherwise be joined as float64
+    if len({a.dtype for a in arrays}) > 1:
+        arrays = [a.astype(object) for a in arrays]
+    return np.concatenate(arrays)
+
+
+def _numeric(values: np.ndarray) -> np.ndarray:
+    return values.astype(float) if values.dtype == object else values
+
+
+def value_counts(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    return np.unique(values, return_counts=True)
+
+
+def counts_from_histogram(histogram: Dict[Any, int]) -> Tuple[np.ndarray, np.ndarray]:
+    if not histogram:
+        return np.empty(0), np.empty(0, dtype=np.int64)
+    values = _column(list(histogram.keys()))
+    counts = np.fromiter(histogram.values(), dtype=np.int64, count=len(histogram))
+    order = np.argsort(values, kind="stable")
+    return values[order], counts[order]
+
+
+def merge_columns(parts: Iterable[Dict[str, Tuple[np.ndarray, np.ndarray]]]) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+    """Adds up the value counts of several windows, e.g. the days of a date range."""
+    merged = {dim: ([], []) for dim in DIMENSIONS}
+    for part in parts:
+        for dim, (values, counts) in part.items():
+            merged[dim][0].append(values)
+            merged[dim][1].append(counts)
+
+    columns = {}
+    for dim, (values, counts) in merged.items():
+        if not values:
+            columns[dim] = (np.empty(0), np.empty(0, dtype=np.int64))
+            continue
+        distinct, inverse = np.unique(_concatenate(values), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(counts), minlength=len(distinct)).astype(np.int64)
+        columns[dim] = (distinct, totals)
+    return columns
+
+
+def weighted_stats(values: np.ndarray, counts: np.ndarray) -> Dict[str, float]:
+    n = counts.sum()
+    if not n:
+        return {"mean": 0, "std_dev": 0}
+    mean = float(np.dot(values, counts) / n)
+    variance = float(np.dot(counts, (values - mean) ** 2) / n)
+    return {"mean": round(mean, 2), "std_dev": round(float(np.sqrt(variance)), 2)}
+
+
+def weighted_percentiles(values: np.ndarray, counts: np.ndarray, q) -> np.ndarray:
+    """np.percentile (linear interpolation) of the data the histogram describes."""
+    cumulative = np.cumsum(counts)
+    position = np.asarray(q, dtype=float) / 100 * (cumulative[-1] - 1)
+    lower = np.floor(position)
+    below = values[np.searchsorted(cumulative, lower, side="right")]
+    above = values[np.searchsorted(cumulative, np.ceil(position), side="right")]
+    return below + (above - below) * (position - lower)
+
+
+def binned_counts(values: np.ndarray, counts: np.ndarray, bin_width: float) -> Dict[Any, int]:
+    """Fixed-width histogram keyed by the lower edge of each bin."""
+    edges = np.floor(values / bin_width) * bin_width
+    if float(bin_width).is_integer() and np.issubdtype(values.dtype, np.integer):
+        edges = edges.astype(np.int64)
+    bins, inverse = np.unique(edges, return_inverse=True)
+    totals = np.bincount(inverse, weights=counts, minlength=len(bins)).astype(np.int64)
+    return dict(zip(bins.tolist(), totals.tolist()))
+
+
+def volume_report(columns: Dict[str, Tuple[np.ndarray, np.ndarray]],
+                  bin_width: Optional[float] = None) -> Dict[str, Any]:
+    percentiles, outliers = {}, {}
+    for dim, (values, counts) in columns.items():
+        if not len(values):
+            percentiles[dim] = {f"p{q}": 0 for q in PERCENTILES}
+            outliers[dim] = {"count": 0, "lower_fence": 0, "upper_fence": 0}
+            continue
+        values = _numeric(values)
+        p = weighted_percentiles(values, counts, PERCENTILES)
+        percentiles[dim] = {f"p{q}": round(float(v), 2) for q, v in zip(PERCENTILES, p)}
+        q1, q3 = weighted_percentiles(values, counts, (25, 75))
+        low, high = q1 - OUTLIER_IQR_FACTOR * (q3 - q1), q3 + OUTLIER_IQR_FACTOR * (q3 - q1)
+        outliers[dim] = {
+            "count": int(counts[(values < low) | (values > high)].sum()),
+            "lower_fence": round(float(low), 2),
+            "upper_fence": round(float(high), 2),
+        }
+
+    result = {
+        **{f"{dim}_distribution": dict(zip(values.tolist(), counts.tolist()))
+           for dim, (values, counts) in columns.items()},
+        "normal_distribution": {dim: weighted_stats(_numeric(values), counts)
+                                for dim, (values, counts) in columns.items()},
+        "percentiles": percentiles,
+        "outliers": outliers,
+    }
+    if bin_width:
+        result["binned_distribution"] = {
+            "bin_width": bin_width,
+            **{dim: binned_counts(_numeric(values), counts, bin_width) for dim, (values, counts) in columns.items()},
+        }
+    return result
+
+
+class VolumeAccumulator:
+    """Height, width and length histograms + distribution statistics for a window of registerTS minutes."""
+
+    def __init__(self, start_minute: int, end_minute: int, bin_width: Optional[float] = None):
+        # Whole minutes, both ends included: "22:00" keeps 22:00:59,999
+        self.start_ms = start_minute * 60_000
+        self.end_ms = end_minute * 60_000 + 59_999
+        self.bin_width = bin_width
+        self.chunks = {dim: [] for dim in DIMENSIONS}
+
+    def add(self, parcels: Iterable[Dict[str, Any]]) -> None:
+        parcels = parcels if isinstance(parcels, list) else list(parcels)
+        self.add_registered(parcels, parse_ms_many([parcel.get("registerTS") for parcel in parcels]))
+
+    def add_registered(self, parcels: List[Dict[str, Any]], register_ms: np.ndarray) -> None:
+        """add() for parcels whose registerTS is already parsed (MISSING_MS when missing or malformed)."""
+        # Filter parcels by time range; a missing or malformed registerTS is outside every window
+        selected = np.flatnonzero((register_ms >= self.start_ms) & (register_ms <= self.end_ms))
+
+        columns = {dim: [] for dim in DIMENSIONS}
+        for i in selected:
+            volume = parcels[i].get("volume_data") or {}
+            for dim in DIMENSIONS:
+                if (value := volume.get(dim)) is not None:
+                    columns[dim].append(value)
+
+        for dim, values in columns.items():
+            if values:
+                self.chunks[dim].append(_column(values))
+
+    def columns(self) -> Dict[str, Tuple[np.ndarray, np.ndarray]]:
+        columns = {}
+        for dim, chunks in self.chunks.items():
+            values = _concatenate(chunks) if chunks else np.empty(0)
+            columns[dim] = value_counts(values)
+        return columns
+
+    def result(self) -> Dict[str, Any]:
+        return volume_report(self.columns(), self.bin_width)
+
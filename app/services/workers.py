@@ -0,0 +1,90 @@
+# app/services/workers.py
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+# CPU-heavy KPI reductions run here so the event loop keeps serving other requests
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("KPI_WORKER_THREADS", str(min(8, (os.cpu_count() or 1) + 2)))),
+    thread_name_prefix="kpi-worker",
+)
+
+
+async def run_in_worker(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    # The caller's context goes along, so the work is counted towards its request (app.services.metrics)
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, partial(context.run, fn, *args, **kwargs))
+
+
+# Long maintenance work (rollup builds) runs here, one job at a time, so no request waits for it
+_background = ThreadPoolExecutor(max_workers=1, thread_name_prefix="kpi-background")
+
+
+def submit_background(fn: Callable[..., Any], *args: Any) -> None:
+    _background.submit(fn, *args)
+
+
+def available_cpus() -> int:
+    """CPUs this process may run on: its affinity mask, capped by a cgroup v2 CPU quota."""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+# Chunked scans of large days are reduced here, one core per process. Every worker is a
+# separate interpreter with its own imports, MongoClient and batches, so the default of 1
+# keeps them serial (e.g. on a 512 MB instance). Opt in with a number, or "auto" for the
+# CPUs the container may use, where the memory allows one such process per CPU.
+_processes = os.getenv("KPI_PROCESSES", "1")
+KPI_PROCESSES = available_cpus() if _processes == "auto" else int(_processes)
+
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_lock = threading.Lock()
+
+
+def process_pool() -> Optional[ProcessPoolExecutor]:
+    """The shared process pool, started on first use; None when parallel reduction is disabled."""
+    global _process_pool
+    if KPI_PROCESSES <= 1:
+        return None
+    with _process_pool_lock:
+        if _process_pool is None:
+            # spawn: a forked child would inherit the parent's MongoClient sockets and threads
+            _process_pool = ProcessPoolExecutor(max_workers=KPI_PROCESSES,
+                                                mp_context=multiprocessing.get_context("spawn"))
+        return _process_pool
+
+
+async def run_in_process(fn: Callable[..., Any], *args: Any) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(process_pool(), partial(fn, *args))
+
+
+def discard_process_pool() -> None:
+    """Drops a broken pool; the next process_pool() call starts a new one."""
+    global _process_pool
+    with _process_pool_lock:
+        pool, _process_pool = _process_pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
+    _background.shutdown(wait=False, cancel_futures=True)
+    discard_process_pool()
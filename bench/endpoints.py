@@ -0,0 +1,212 @@
+# bench/endpoints.py
+"""
+Latency, throughput and server RSS of /summary, /throughput, /volume and
+/parcel-journey over HTTP, against a synthetic day from bench.generator.
+
+    python -m bench.endpoints --embedded --scale 100k --out before.json
+    python -m bench.endpoints --uri mongodb://localhost:27017 --scale 1m --seed-data --out after.json
+    python -m bench.endpoints --embedded --scale 100k --compare before.json
+
+The app runs under uvicorn in a child process with the response cache and
+the snapshot scheduler disabled, so every request does the full work;
+ROLLUP_MODE and the other settings come from the environment as usual.
+--embedded starts a temporary mongod (bench.mongod) instead of using
+--uri. The JSON report records the commit and parameters; --compare
+prints the p50 and throughput ratios against an earlier report.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional
+
+from pymongo import MongoClient
+
+from bench.generator import DB_NAME, parcel_count, seed
+from bench.mongod import LocalMongod
+
+
+def endpoints(date: str, parcels: int, rng: random.Random) -> Dict[str, Any]:
+    """Route -> a function returning the next request body."""
+    window = {"date": date, "start_time": "06:00", "end_time": "22:00"}
+    return {
+        "/summary": lambda: window,
+        "/throughput": lambda: {**window, "bin_size": 60},
+        "/volume": lambda: window,
+        "/parcel-journey": lambda: {"date": date, "search_by": "host_id",
+                                    "search_value": f"H{rng.randrange(parcels):08d}"},
+    }
+
+
+def _post(base: str, path: str, body: Dict[str, Any]) -> Dict[str, Any]:
+    request = urllib.request.Request(base + path, data=json.dumps(body).encode(),
+                                     headers={"Content-Type": "application/json"})
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=600) as response:
+        payload = response.read()
+        server_timing = response.headers.get("Server-Timing", "")
+    return {"seconds": time.perf_counter() - started, "bytes": len(payload), "server_timing": server_timing}
+
+
+def _stages(headers: List[str]) -> Dict[str, float]:
+    """Mean milliseconds per Server-Timing stage."""
+    totals: Dict[str, List[float]] = {}
+    for header in headers:
+        for entry in filter(None, (part.strip() for part in header.split(","))):
+            name, _, rest = entry.partition(";")
+            if rest.startswith("dur="):
+                totals.setdefault(name, []).append(float(rest[4:]))
+    return {name: round(statistics.fmean(values), 2) for name, values in totals.items()}
+
+
+def _rss_mb(pid: int) -> Dict[str, Optional[float]]:
+    # Linux only; VmHWM is the peak
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            fields = dict(line.split(":", 1) for line in f if ":" in line)
+        return {key: round(int(fields[name].split()[0]) / 1024, 1)
+                for key, name in (("rss_mb", "VmRSS"), ("peak_rss_mb", "VmHWM"))}
+    except (OSError, KeyError, ValueError):
+        return {"rss_mb": None, "peak_rss_mb": None}
+
+
+def _percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def measure(base: str, path: str, next_body, requests: int, concurrency: int, pid: int) -> Dict[str, Any]:
+    _post(base, path, next_body())  # warm-up: connections, rollups, imports
+    bodies = [next_body() for _ in range(requests)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda body: _post(base, path, body), bodies))
+    elapsed = time.perf_counter() - started
+    latencies = [r["seconds"] * 1000 for r in results]
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "p50_ms": round(_percentile(latencies, 50), 2),
+        "p95_ms": round(_percentile(latencies, 95), 2),
+        "p99_ms": round(_percentile(latencies, 99), 2),
+        "mean_ms": round(statistics.fmean(latencies), 2),
+        "max_ms": round(max(latencies), 2),
+        "requests_per_second": round(requests / elapsed, 2),
+        "response_bytes": results[-1]["bytes"],
+        "server_timing_ms": _stages([r["server_timing"] for r in results]),
+        **_rss_mb(pid),
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(base: str, server: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(base + "/", timeout=2):
+                return
+        except OSError:
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise RuntimeError("the API server did not start")
+            time.sleep(0.2)
+
+
+def _commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any]) -> Dict[str, Any]:
+    """Ratios against a previous report; below 1 for p50 and above 1 for throughput is better."""
+    ratios = {}
+    for path, result in report["results"].items():
+        old = baseline.get("results", {}).get(path)
+        if old:
+            ratios[path] = {
+                "p50_ratio": round(result["p50_ms"] / old["p50_ms"], 3) if old["p50_ms"] else None,
+                "throughput_ratio": round(result["requests_per_second"] / old["requests_per_second"], 3)
+                if old["requests_per_second"] else None,
+            }
+    return {"baseline_commit": baseline.get("commit"), "ratios": ratios}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--embedded", action="store_true", help="start a temporary mongod instead of --uri")
+    parser.add_argument("--date", default="2025-01-01")
+    parser.add_argument("--scale", type=parcel_count, default="100k", help="10k, 100k, 1m or a parcel count")
+    parser.add_argument("--seed-data", action="store_true", help="(re)generate the day even if it exists")
+    parser.add_argument("--requests", type=int, default=20, help="timed requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--endpoints", nargs="+", help="subset of the routes to measure")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    with (LocalMongod() if args.embedded else nullcontext(args.uri)) as uri:
+        client = MongoClient(uri)
+        if args.seed_data or client[DB_NAME][args.date].estimated_document_count() != args.scale:
+            seed(client, args.date, args.scale)
+        client.close()
+
+        port = _free_port()
+        env = {**os.environ, "MONGODB_URI": uri, "MONGODB_DB": DB_NAME,
+               "CACHE_TTL_PAST_SECONDS": "0", "CACHE_TTL_TODAY_SECONDS": "0", "SNAPSHOTS_ENABLED": "0"}
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+             "--log-level", "warning"],
+            env=env, stdout=subprocess.DEVNULL,
+        )
+        base = f"http://127.0.0.1:{port}"
+        try:
+            _wait_ready(base, server)
+            rng = random.Random(7)
+            results = {}
+            for path, next_body in endpoints(args.date, args.scale, rng).items():
+                if args.endpoints and path not in args.endpoints:
+                    continue
+                results[path] = measure(base, path, next_body, args.requests, args.concurrency, server.pid)
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    report = {
+        "benchmark": "endpoints",
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "parcels": args.scale,
+        "settings": {name: os.environ[name] for name in sorted(os.environ)
+                     if name.startswith(("ROLLUP_", "SUMMARY_", "KPI_", "STREAM_", "PARALLEL_"))},
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare(report, json.load(f))
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
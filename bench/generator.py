@@ -0,0 +1,179 @@
+# bench/generator.py
+"""
+Synthetic sorter days for the benchmarks.
+
+    python -m bench.generator --uri mongodb://localhost:27017 --date 2025-01-01 --scale 100k
+    python -m bench.generator --uri mongodb://localhost:27017 --date 2025-01-02 --parcels 250000 --overflow-rate 0.1
+
+Every parcel registers between 05:00 and 22:00, busiest around the two
+shift peaks, and gets the events a real one would:
+
+    2  ItemInstruction (IN)
+    3  identification; missing on some no-reads
+    5  volume measurement
+    6  sort report; raw field 10 is the sort status, "999" when it could not be sorted
+    7  deregistration; raw field 9 is the reason, field 11 the location
+
+A share `overflow_rate` of the parcels ends in overflow, half of them by a
+999 sort and half by deregistering at one of the configured overflow
+locations. Output is deterministic for a given seed, so reports from
+different commits measure the same data.
+"""
+import argparse
+import random
+from typing import Any, Dict, Iterator, List
+
+from pymongo import MongoClient
+
+from app.config import config
+from app.services.kpi_rules import DEFAULT_RULES
+
+DB_NAME = "bench_kpi"
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+# Parcels follow the default telegram layout of app.services.kpi_rules
+RAW_SORT_STATUS = DEFAULT_RULES["events"]["sort"]["raw_fields"]["sort_status"]
+RAW_DEREG_REASON = DEFAULT_RULES["events"]["dereg"]["raw_fields"]["dereg_reason"]
+RAW_DEREG_LOCATION = DEFAULT_RULES["events"]["dereg"]["raw_fields"]["dereg_location"]
+RAW_FIELDS = 14
+
+OVERFLOW_LOCATIONS = list(config.get("overflow_locations", [])) or ["1001.0045.0040.B31"]
+REGULAR_LOCATIONS = [f"1001.{n:04d}.0000.C01" for n in range(1, 41)]
+REGISTER_LOCATIONS = ["1001.0001.0010.I01", "1001.0001.0020.I02", "1001.0001.0030.I03"]
+SCANNER_LOCATIONS = ["1001.0010.0000.S01", "1001.0010.0000.S02"]
+
+# (mean minute of day, standard deviation, weight): morning and afternoon shift peaks
+REGISTER_PEAKS = ((9 * 60, 90, 0.55), (17 * 60, 120, 0.45))
+FIRST_MINUTE, LAST_MINUTE = 5 * 60, 22 * 60
+
+
+def ts(ms: int) -> str:
+    return f"{ms // 3_600_000:02d}:{ms // 60_000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+
+def raw(msg_id: str, at: str, host_id: str, fields: Dict[int, str]) -> str:
+    parts = [msg_id, at, host_id] + ["0"] * (RAW_FIELDS - 3)
+    for index, value in fields.items():
+        parts[index] = value
+    return "|".join(parts)
+
+
+def register_ms(rng: random.Random) -> int:
+    mean, sigma, _ = rng.choices(REGISTER_PEAKS, weights=[peak[2] for peak in REGISTER_PEAKS])[0]
+    minute = min(max(rng.gauss(mean, sigma), FIRST_MINUTE), LAST_MINUTE - 1)
+    return int(minute * 60_000) + rng.randrange(60_000)
+
+
+def parcel(i: int, rng: random.Random, overflow_rate: float) -> Dict[str, Any]:
+    host_id = f"H{i:08d}"
+    t = register_ms(rng)
+    registered_at = rng.choice(REGISTER_LOCATIONS)
+    events: List[Dict[str, Any]] = []
+
+    def event(msg_id: str, at: int, fields: Dict[int, str] = None, **extra) -> None:
+        events.append({"msg_id": msg_id, "ts": ts(at), "raw": raw(msg_id, ts(at), host_id, fields or {}), **extra})
+
+    event("2", t + rng.randrange(20, 200))
+
+    no_read = rng.random() < 0.03
+    identified_at = t + rng.randrange(2_000, 8_000)
+    scanner = rng.choice(SCANNER_LOCATIONS)
+    if not no_read:
+        event("3", identified_at)
+
+    length, width, height = rng.randint(10, 80), rng.randint(10, 60), rng.randint(5, 60)
+    box_volume = length * width * height
+    measured = rng.random() > 0.02
+    if measured:
+        event("5", identified_at + rng.randrange(100, 1_000))
+
+    fate = rng.random()
+    in_system = fate < 0.03
+    overflow = not in_system and fate < 0.03 + overflow_rate
+    destination = rng.choice(REGULAR_LOCATIONS)
+    exit_ms, exit_location, status = None, None, "in_system"
+
+    if not in_system:
+        sorted_at = identified_at + rng.randrange(30_000, 240_000)
+        dereg_at = sorted_at + rng.randrange(1_000, 5_000)
+        if overflow and rng.random() < 0.5:
+            # Could not be sorted: 999, then deregistered with reason 2
+            event("6", sorted_at, {RAW_SORT_STATUS: "999"}, sort_code="2")
+            event("7", dereg_at, {RAW_DEREG_REASON: "2", RAW_DEREG_LOCATION: destination})
+            exit_ms, exit_location, status = dereg_at, destination, "overflow"
+        elif overflow:
+            # Sorted, but ended up on an overflow chute
+            location = rng.choice(OVERFLOW_LOCATIONS)
+            event("6", sorted_at, {RAW_SORT_STATUS: "1"}, sort_code="2")
+            event("7", dereg_at, {RAW_DEREG_REASON: "1", RAW_DEREG_LOCATION: location})
+            exit_ms, exit_location, status = dereg_at, location, "overflow"
+        else:
+            event("6", sorted_at, {RAW_SORT_STATUS: "1"}, sort_code="1")
+            event("7", dereg_at, {RAW_DEREG_REASON: "1", RAW_DEREG_LOCATION: destination})
+            exit_ms, exit_location, status = dereg_at, destination, "sorted"
+    if no_read and status == "sorted":
+        status = "lost"
+
+    return {
+        "hostId": host_id,
+        "alibi_id": f"A{i:08d}",
+        "registerTS": ts(t),
+        "Registered_location": registered_at,
+        "identificationTS": "" if no_read else ts(identified_at),
+        "identification_location": "" if no_read else scanner,
+        "exitTS": ts(exit_ms) if exit_ms is not None else "",
+        "exit_location": exit_location or "",
+        "actual_destination": exit_location,
+        "status": status,
+        "sort_strategy": "1",
+        "barcode_error": no_read,
+        "barcode_data": {"barcodes": [] if no_read else [f"{rng.randrange(10 ** 12):012d}"]},
+        "volume_data": {
+            "length": length, "width": width, "height": height, "box_volume": box_volume,
+            "real_volume": int(box_volume * rng.uniform(0.4, 0.95)) if measured else 0,
+        },
+        "events": events,
+    }
+
+
+def parcels(n: int, seed: int = 42, overflow_rate: float = 0.05) -> Iterator[Dict[str, Any]]:
+    rng = random.Random(seed)
+    for i in range(n):
+        yield parcel(i, rng, overflow_rate)
+
+
+def seed(client: MongoClient, date: str, n: int, db_name: str = DB_NAME, seed_value: int = 42,
+         overflow_rate: float = 0.05, batch_size: int = 10_000) -> int:
+    """(Re)creates one date collection with `n` synthetic parcels."""
+    collection = client[db_name][date]
+    collection.drop()
+    batch = []
+    for doc in parcels(n, seed_value, overflow_rate):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            collection.insert_many(batch)
+            batch = []
+    if batch:
+        collection.insert_many(batch)
+    return collection.estimated_document_count()
+
+
+def parcel_count(value: str) -> int:
+    return SCALES[value.lower()] if value.lower() in SCALES else int(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--db", default=DB_NAME)
+    parser.add_argument("--date", default="2025-01-01")
+    parser.add_argument("--scale", type=parcel_count, default="100k", help="10k, 100k, 1m or a parcel count")
+    parser.add_argument("--overflow-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    count = seed(MongoClient(args.uri), args.date, args.scale, args.db, args.seed, args.overflow_rate)
+    print({"db": args.db, "collection": args.date, "parcels": count})
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# bench/mongod.py
+"""
+A throwaway local mongod for the benchmarks: started on a free port with a
+temporary data directory, and removed again afterwards.
+
+    with LocalMongod() as uri:
+        ...
+
+Needs the mongod binary on PATH, or its path in MONGOD_BINARY. mongomock is
+not an option here: the routes use the async client, aggregation
+expressions and change streams, none of which it implements.
+"""
+import os
+import shutil
+import socket
+import subprocess
+import tempfile
+import time
+
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class LocalMongod:
+    def __init__(self, binary: str = None, startup_timeout: float = 30):
+        self.binary = binary or os.getenv("MONGOD_BINARY") or shutil.which("mongod")
+        if not self.binary:
+            raise RuntimeError("mongod not found; put it on PATH, set MONGOD_BINARY or pass --uri")
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.dbpath = None
+        self.uri = None
+
+    def __enter__(self) -> str:
+        self.dbpath = tempfile.mkdtemp(prefix="bench-mongod-")
+        port = _free_port()
+        # A single-node replica set, so /live can use change streams
+        self.process = subprocess.Popen(
+            [self.binary, "--dbpath", self.dbpath, "--port", str(port), "--bind_ip", "127.0.0.1",
+             "--replSet", "bench", "--quiet"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        self.uri = f"mongodb://127.0.0.1:{port}/?directConnection=true"
+        deadline = time.monotonic() + self.startup_timeout
+        client = MongoClient(self.uri, serverSelectionTimeoutMS=500)
+        try:
+            while True:
+                try:
+                    client.admin.command("replSetInitiate")
+                except PyMongoError:
+                    pass  # not listening yet, or already initiated
+                try:
+                    # Writes fail until the node has elected itself primary
+                    if client.admin.command("hello").get("isWritablePrimary"):
+                        return self.uri
+                except PyMongoError:
+                    pass
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.__exit__(None, None, None)
+                    raise RuntimeError(f"mongod did not start (exit code {self.process.returncode})")
+                time.sleep(0.2)
+        finally:
+            client.close()
+
+    def __exit__(self, *exc) -> None:
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        if self.dbpath:
+            shutil.rmtree(self.dbpath, ignore_errors=True)
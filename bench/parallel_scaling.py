@@ -0,0 +1,105 @@
+# bench/parallel_scaling.py
+"""
+Wall time of the /summary, /throughput and /volume scans of one large day
+by number of KPI worker processes, and whether every count matches the
+serial path.
+
+    python -m bench.parallel_scaling --uri mongodb://localhost:27017 --seed --parcels 1000000
+    python -m bench.parallel_scaling --uri mongodb://localhost:27017 --processes 1 2 4 8 --out scaling.json
+
+Each process count runs in its own interpreter, since KPI_PROCESSES is read
+at import. Uses the synthetic day of bench.streaming_memory.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+from pymongo import MongoClient
+
+from bench.streaming_memory import DB_NAME, OVERFLOW_LOCATIONS, seed
+
+KPIS = {
+    "summary": (0, (23 * 60 + 59) * 60_000, OVERFLOW_LOCATIONS),
+    "throughput": (0, (23 * 60 + 59) * 60_000, OVERFLOW_LOCATIONS),
+    "volume": (0, 23 * 60 + 59),
+}
+
+
+def _digest(partial) -> str:
+    def plain(value):
+        if hasattr(value, "tolist"):
+            return value.tolist()
+        if isinstance(value, dict):
+            return {str(k): plain(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [plain(v) for v in value]
+        return value
+    return hashlib.sha256(json.dumps(plain(partial), sort_keys=True).encode()).hexdigest()[:16]
+
+
+async def _run(date: str) -> dict:
+    from app.database.db import get_async_db
+    from app.services import workers
+    from app.services.parallel import reduce_kpi
+
+    collection = get_async_db()[date]
+    timings, digests = {}, {}
+    try:
+        for kind, args in KPIS.items():
+            started = time.perf_counter()
+            partial = await reduce_kpi(collection, kind, *args)
+            timings[kind] = round(time.perf_counter() - started, 3)
+            digests[kind] = _digest(partial)
+    finally:
+        workers.shutdown()
+    return {"processes": workers.KPI_PROCESSES, "seconds": timings, "digests": digests}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--date", default="2025-01-01")
+    parser.add_argument("--parcels", type=int, default=1_000_000)
+    parser.add_argument("--seed", action="store_true", help="(re)create the synthetic collection first")
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    parser.add_argument("--single", action="store_true", help="run one process count in this interpreter")
+    parser.add_argument("--out", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    if args.single:
+        print(json.dumps(asyncio.run(_run(args.date))))
+        return
+
+    if args.seed:
+        seed(MongoClient(args.uri), args.date, args.parcels)
+
+    results = []
+    for processes in sorted(set(args.processes)):
+        env = {**os.environ, "MONGODB_URI": args.uri, "MONGODB_DB": DB_NAME, "KPI_PROCESSES": str(processes),
+               "PARALLEL_MIN_DOCS": "1"}
+        output = subprocess.run(
+            [sys.executable, "-m", "bench.parallel_scaling", "--date", args.date, "--single"],
+            check=True, capture_output=True, text=True, env=env,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    serial = results[0]
+    for result in results:
+        total = sum(result["seconds"].values())
+        result["speedup"] = round(sum(serial["seconds"].values()) / total, 2) if total else None
+        result["identical_to_first"] = result["digests"] == serial["digests"]
+
+    report = json.dumps({"benchmark": "parallel_scaling", "results": results}, indent=2)
+    print(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# bench/record_memory.py
+"""
+Memory held per parcel by the in-memory representations of a day.
+
+    python -m bench.record_memory
+    python -m bench.record_memory --parcels 1000000 --out record_memory.json
+
+    documents      the parcel dicts as pymongo returns them, events and raw telegrams included
+    records        one ParcelRecord per parcel
+    contributions  _id -> Contribution, what LiveState kept before
+    table          ParcelTable plus its _id -> row map and parcels per hostId code, what LiveState keeps now
+
+Each representation is built from bench.generator parcels, streamed so
+that only what the representation itself keeps is counted, and measured
+with tracemalloc in a fresh interpreter.
+"""
+import argparse
+import json
+import subprocess
+import sys
+import tracemalloc
+from typing import Any, Dict
+
+from bson import ObjectId
+
+from app.services.live import contribution
+from app.services.parcel_record import classify_parcel
+from app.services.parcel_table import ParcelTable
+from bench.generator import OVERFLOW_LOCATIONS, parcels
+
+REPRESENTATIONS = ("documents", "records", "contributions", "table")
+
+
+def build(kind: str, n: int) -> Any:
+    locations = set(OVERFLOW_LOCATIONS)
+    if kind == "documents":
+        return [{"_id": ObjectId(), **doc} for doc in parcels(n)]
+    if kind == "records":
+        return [classify_parcel(doc, locations) for doc in parcels(n)]
+    if kind == "contributions":
+        return {ObjectId(): contribution(classify_parcel(doc, locations)) for doc in parcels(n)}
+    table, rows, host_parcels = ParcelTable(), {}, []
+    for doc in parcels(n):
+        rows[ObjectId()] = table.append(classify_parcel(doc, locations))
+        host_parcels.append(1)
+    return table, rows, host_parcels
+
+
+def measure(kind: str, n: int) -> Dict[str, Any]:
+    tracemalloc.start()
+    kept = build(kind, n)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return {
+        "mb": round(current / 2 ** 20, 1),
+        "peak_mb": round(peak / 2 ** 20, 1),
+        "bytes_per_parcel": round(current / n),
+        "mb_per_million_parcels": round(current / n * 1_000_000 / 2 ** 20),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parcels", type=int, default=100_000)
+    parser.add_argument("--kinds", nargs="+", choices=REPRESENTATIONS, default=list(REPRESENTATIONS))
+    parser.add_argument("--one", choices=REPRESENTATIONS, help=argparse.SUPPRESS)
+    parser.add_argument("--out", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    if args.one:
+        print(json.dumps(measure(args.one, args.parcels)))
+        return
+
+    results = {}
+    for kind in args.kinds:
+        # A fresh interpreter per representation, so nothing allocated by the previous one is reused
+        out = subprocess.run([sys.executable, "-m", "bench.record_memory", "--one", kind, "--parcels",
+                              str(args.parcels)], capture_output=True, text=True, check=True).stdout
+        results[kind] = json.loads(out)
+
+    report = {"benchmark": "record_memory", "parcels": args.parcels, "results": results}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# bench/responses.py
+"""
+Payload size and encoding time of the large responses: FastAPI's default
+encoding against app.services.responses, and what gzip and brotli make of
+the result at a few levels.
+
+    python -m bench.responses
+    python -m bench.responses --parcels 200000 --journeys 5000 --out responses.json
+
+    throughput  a whole day in 1-minute bins, plus "bins" at 5, 15 and 60
+    volume      dimension distributions with 1-unit histograms
+    dashboard   summary, throughput and volume of the day in one body
+    journey     /parcel-journey rows with raw telegrams, `--journeys` parcels
+
+    fastapi     jsonable_encoder + json.dumps, what a route returning a dict costs
+    orjson      KPIResponse.render, what the KPI routes do now
+
+Payloads are built from bench.generator parcels without a database, and
+every encoding is checked to decode to the same JSON.
+"""
+import argparse
+import json
+import time
+from typing import Any, Callable, Dict
+
+from fastapi.encoders import jsonable_encoder
+
+from app.routes.parcel_journey import journey_row
+from app.routes.throughput import throughput_response
+from app.services.compression import Compressor, brotli
+from app.services.responses import KPIResponse
+from app.services.summary_engine import SummaryAccumulator, summary_from_totals
+from app.services.throughput_engine import ThroughputAccumulator
+from app.services.volume_engine import VolumeAccumulator, volume_report
+from bench.generator import OVERFLOW_LOCATIONS, parcels
+
+GZIP_LEVELS = (1, 6, 9)
+BROTLI_QUALITIES = (1, 4, 11)
+
+
+def fastapi_encode(content: Any) -> bytes:
+    """A dict returned by a route: jsonable_encoder, then Starlette's JSONResponse.render."""
+    return json.dumps(jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None,
+                      separators=(",", ":")).encode("utf-8")
+
+
+def orjson_encode(content: Any) -> bytes:
+    return KPIResponse(content).body
+
+
+def payloads(n_parcels: int, n_journeys: int) -> Dict[str, Any]:
+    locations = set(OVERFLOW_LOCATIONS)
+    day_ms = 24 * 60 * 60_000 - 60_000
+    docs = list(parcels(n_parcels))
+
+    summary = SummaryAccumulator(0, day_ms, locations)
+    throughput = ThroughputAccumulator(0, day_ms, locations)
+    volume = VolumeAccumulator(0, 24 * 60 - 1, 1)
+    for accumulator in (summary, throughput, volume):
+        accumulator.add(docs)
+
+    throughput_body = throughput_response(throughput.result(), "00:00", "23:59", 0, 24 * 60 - 1, 1, [5, 15, 60])
+    volume_body = volume_report(volume.columns(), 1)
+    return {
+        "throughput": throughput_body,
+        "volume": volume_body,
+        "dashboard": {
+            "summary": {"date": "2025-01-01", **summary_from_totals(summary.totals())},
+            "throughput": throughput_body,
+            "volume": volume_body,
+        },
+        "journey": [journey_row(doc) for doc in docs[:n_journeys]],
+    }
+
+
+def timed(fn: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def measure(content: Any, repeat: int) -> Dict[str, Any]:
+    encoded = {"fastapi": fastapi_encode(content), "orjson": orjson_encode(content)}
+    same = json.loads(encoded["fastapi"]) == json.loads(encoded["orjson"])
+    seconds = {
+        "fastapi": timed(lambda: fastapi_encode(content), repeat),
+        "orjson": timed(lambda: orjson_encode(content), repeat),
+    }
+    body = encoded["orjson"]
+
+    compressors = {f"gzip_{level}": lambda level=level: Compressor("gzip", gzip_level=level) for level in GZIP_LEVELS}
+    if brotli is not None:
+        compressors.update({f"br_{quality}": lambda quality=quality: Compressor("br", brotli_quality=quality)
+                            for quality in BROTLI_QUALITIES})
+    compressed = {}
+    for name, make in compressors.items():
+        size = len(make().compress(body))
+        compressed[name] = {
+            "bytes": size,
+            "ratio": round(len(body) / size, 1),
+            "ms": round(timed(lambda: make().compress(body), repeat) * 1000, 2),
+        }
+
+    return {
+        "same_json": same,
+        "bytes": {name: len(data) for name, data in encoded.items()},
+        "encode_ms": {name: round(s * 1000, 2) for name, s in seconds.items()},
+        "encode_speedup": round(seconds["fastapi"] / seconds["orjson"], 1),
+        "compressed": compressed,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--parcels", type=int, default=100_000)
+    parser.add_argument("--journeys", type=int, default=1_000, help="rows in the journey payload")
+    parser.add_argument("--repeat", type=int, default=5, help="best of this many runs")
+    parser.add_argument("--out", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    bodies = payloads(args.parcels, args.journeys)
+    report = {
+        "benchmark": "responses",
+        "parcels": args.parcels,
+        "journeys": args.journeys,
+        "brotli": brotli is not None,
+        "results": {name: measure(content, args.repeat) for name, content in bodies.items()},
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+# bench/startup.py
+"""
+Import cost of the app and its time to the first fast response after a
+(re)deploy.
+
+    python -m bench.startup --imports-only
+    python -m bench.startup --embedded --scale 100k --out startup.json
+    python -m bench.startup --embedded --scale 100k --gate live     # what a client saw before /health/ready
+
+imports     `python -X importtime -c "import main"` in a fresh interpreter:
+            self time summed per top-level package, and the modules with
+            the largest cumulative time
+startup     uvicorn started in a child process on a synthetic day seeded as
+            today's collection, so the snapshot windows and the warm-up
+            apply. Timed from the spawn: /health/live answering, then
+            `--gate` (/health/ready returning 200 by default), then the
+            first request of each endpoint against the median of the
+            `--requests` that follow it.
+
+The app runs with the response cache off, as in bench.endpoints, so the
+later requests measure the work rather than a cache hit; snapshots stay on
+because they are part of the warm-up.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pymongo import MongoClient
+
+from bench.endpoints import _commit, _free_port, _post
+from bench.generator import DB_NAME, parcel_count, seed
+from bench.mongod import LocalMongod
+
+
+def import_times(top: int = 15) -> Dict[str, Any]:
+    """Where `import main` spends its time, from -X importtime in a fresh interpreter."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            capture_output=True, text=True, check=True)
+    modules = []  # (name, self us, cumulative us)
+    for line in result.stderr.splitlines():
+        parts = line[len("import time:"):].split("|") if line.startswith("import time:") else []
+        if len(parts) == 3 and parts[0].strip().isdigit():
+            modules.append((parts[2].strip(), int(parts[0]), int(parts[1])))
+
+    # Self times add up to the total, so they can be summed per top-level package
+    packages = defaultdict(int)
+    for name, self_us, _ in modules:
+        packages[name.split(".")[0]] += self_us
+    return {
+        "total_ms": round(sum(self_us for _, self_us, _ in modules) / 1000, 1),
+        "packages_ms": {name: round(us / 1000, 1)
+                        for name, us in sorted(packages.items(), key=lambda item: -item[1])[:top]},
+        "slowest_modules_ms": {name: round(us / 1000, 1)
+                               for name, _, us in sorted(modules, key=lambda item: -item[2])[:top]},
+    }
+
+
+def _wait(url: str, server: subprocess.Popen, timeout: float) -> float:
+    """Seconds until `url` answers 200."""
+    started = time.monotonic()
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                return time.monotonic() - started
+        except (OSError, urllib.error.HTTPError):
+            if server.poll() is not None or time.monotonic() - started > timeout:
+                raise RuntimeError(f"{url} did not answer 200")
+            time.sleep(0.05)
+
+
+def _get_json(url: str) -> Dict[str, Any]:
+    with urllib.request.urlopen(url, timeout=10) as response:
+        return json.loads(response.read())
+
+
+def endpoints(date: str) -> Dict[str, Dict[str, Any]]:
+    # shift_1 of config.json, so /summary and /throughput can be answered from a snapshot
+    window = {"date": date, "start_time": "06:00", "end_time": "14:00"}
+    return {
+        "/summary": window,
+        "/throughput": {**window, "bin_size": 60},
+        "/dashboard": {"date": date, "start_time": "00:00", "end_time": "23:59"},
+    }
+
+
+def first_responses(base: str, date: str, requests: int) -> Dict[str, Any]:
+    results = {}
+    for path, body in endpoints(date).items():
+        first = _post(base, path, body)["seconds"] * 1000
+        after = [_post(base, path, body)["seconds"] * 1000 for _ in range(requests)]
+        p50 = statistics.median(after)
+        results[path] = {"first_ms": round(first, 2), "p50_ms": round(p50, 2),
+                         "first_over_p50": round(first / p50, 2) if p50 else None}
+    return results
+
+
+def startup(uri: str, date: str, gate: str, requests: int, timeout: float) -> Dict[str, Any]:
+    port = _free_port()
+    env = {**os.environ, "MONGODB_URI": uri, "MONGODB_DB": DB_NAME,
+           "CACHE_TTL_PAST_SECONDS": "0", "CACHE_TTL_TODAY_SECONDS": "0"}
+    base = f"http://127.0.0.1:{port}"
+    spawned = time.monotonic()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL,
+    )
+    try:
+        live = _wait(base + "/health/live", server, timeout)
+        gated = _wait(base + "/health/ready", server, timeout) if gate == "ready" else 0.0
+        opened = time.monotonic() - spawned
+        responses = first_responses(base, date, requests)
+        ready = _get_json(base + "/health/ready") if gate == "ready" else None
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return {
+        "gate": gate,
+        "live_seconds": round(live, 3),
+        "gate_seconds": round(opened, 3),
+        "ready_wait_seconds": round(gated, 3),
+        # The app's own account: imports, then each warm-up phase
+        "server": ready,
+        "first_responses": responses,
+        "first_fast_seconds": round(opened + sum(r["first_ms"] for r in responses.values()) / 1000, 3),
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--embedded", action="store_true", help="start a temporary mongod instead of --uri")
+    parser.add_argument("--scale", type=parcel_count, default="100k", help="10k, 100k, 1m or a parcel count")
+    parser.add_argument("--gate", choices=("ready", "live"), default="ready",
+                        help="wait for /health/ready, or send the first requests as soon as the port answers")
+    parser.add_argument("--requests", type=int, default=5, help="requests after the first, per endpoint")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for the server")
+    parser.add_argument("--imports-only", action="store_true", help="skip the server and only measure imports")
+    parser.add_argument("--out", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    report = {"benchmark": "startup", "commit": _commit(), "imports": import_times()}
+    if not args.imports_only:
+        date = datetime.now().strftime("%Y-%m-%d")
+        with (LocalMongod() if args.embedded else nullcontext(args.uri)) as uri:
+            client = MongoClient(uri)
+            if client[DB_NAME][date].estimated_document_count() != args.scale:
+                seed(client, date, args.scale)
+            client.close()
+            report["parcels"] = args.scale
+            report["startup"] = startup(uri, date, args.gate, args.requests, args.timeout)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
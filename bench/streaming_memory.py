@@ -0,0 +1,163 @@
+# bench/streaming_memory.py
+"""
+Bytes transferred and peak RSS of the KPI scans, before and after
+projection-limited streaming cursors.
+
+    python -m bench.streaming_memory --uri mongodb://localhost:27017 --seed --parcels 1000000
+    python -m bench.streaming_memory --uri mongodb://localhost:27017 --out streaming.json
+
+"before" materializes list(collection.find({})) once and reduces it with the
+/summary, /throughput and /volume engines; "after" streams the projected
+fields of each route in batches. Every mode runs in its own interpreter so
+ru_maxrss is not shared. Bytes come from the server's network.bytesOut.
+"""
+import argparse
+import json
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from pymongo import MongoClient
+
+from app.services.parcel_record import RECORD_PROJECTION
+from app.services.summary_engine import SummaryAccumulator
+from app.services.throughput_engine import ThroughputAccumulator
+from app.services.volume_engine import VOLUME_PROJECTION, VolumeAccumulator
+
+DB_NAME = "bench_kpi"
+OVERFLOW_LOCATIONS = {"1001.0045.0040.B31", "1001.0043.0000.B71"}
+
+
+def _ts(ms: int) -> str:
+    return f"{ms // 3_600_000:02d}:{ms // 60_000 % 60:02d}:{ms // 1000 % 60:02d},{ms % 1000:03d}"
+
+
+def _raw(fields) -> str:
+    return "|".join(fields)
+
+
+def synthetic_parcel(i: int, rng: random.Random) -> dict:
+    register = rng.randrange(0, 86_300_000)
+    sort_status = "999" if rng.random() < 0.05 else "1"
+    sort_fields = [str(i)] * 14
+    sort_fields[10] = sort_status
+    dereg_fields = [str(i)] * 14
+    dereg_fields[9] = "2"
+    dereg_fields[11] = "1001.0045.0040.B31" if rng.random() < 0.02 else "1001.0001.0000.C01"
+    events = [
+        {"msg_id": "2", "ts": _ts(register + 50), "raw": _raw([str(i)] * 14)},
+        {"msg_id": "3", "ts": _ts(register + 4_000), "raw": _raw([str(i)] * 20)},
+        {"msg_id": "6", "ts": _ts(register + 60_000), "raw": _raw(sort_fields), "sort_code": "1"},
+        {"msg_id": "7", "ts": _ts(register + 62_000), "raw": _raw(dereg_fields)},
+    ]
+    return {
+        "hostId": f"H{i:08d}",
+        "alibi_id": f"A{i:08d}",
+        "registerTS": _ts(register),
+        "status": "sorted",
+        "sort_strategy": "1",
+        "barcode_error": rng.random() < 0.03,
+        "barcode_data": {"barcodes": [f"{rng.randrange(10**12):012d}"]},
+        "volume_data": {"height": rng.randint(5, 60), "width": rng.randint(10, 60), "length": rng.randint(10, 80),
+                        "box_volume": rng.randint(500, 200_000), "real_volume": rng.randint(400, 180_000)},
+        "events": events,
+    }
+
+
+def seed(client: MongoClient, date: str, parcels: int) -> None:
+    collection = client[DB_NAME][date]
+    collection.drop()
+    rng = random.Random(42)
+    for start in range(0, parcels, 10_000):
+        collection.insert_many([synthetic_parcel(i, rng) for i in range(start, min(start + 10_000, parcels))])
+
+
+def _accumulators():
+    start_ms, end_ms = 0, (23 * 60 + 59) * 60_000
+    return (
+        SummaryAccumulator(start_ms, end_ms, OVERFLOW_LOCATIONS),
+        ThroughputAccumulator(start_ms, end_ms, OVERFLOW_LOCATIONS),
+        VolumeAccumulator(0, 23 * 60 + 59),
+    )
+
+
+def run_mode(uri: str, date: str, mode: str, batch_size: int) -> dict:
+    client = MongoClient(uri)
+    collection = client[DB_NAME][date]
+    summary, throughput, volume = _accumulators()
+
+    bytes_before = client.admin.command("serverStatus")["network"]["bytesOut"]
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+
+    if mode == "before":
+        # What the routes did: one full-document list per route
+        for accumulator in (summary, throughput, volume):
+            parcels = list(collection.find({}))
+            accumulator.add(parcels)
+            del parcels
+    else:
+        for accumulator, projection in ((summary, RECORD_PROJECTION), (throughput, RECORD_PROJECTION),
+                                        (volume, VOLUME_PROJECTION)):
+            cursor = collection.find({}, projection, batch_size=batch_size)
+            batch = []
+            for doc in cursor:
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    accumulator.add(batch)
+                    batch = []
+            accumulator.add(batch)
+
+    summary.result(), throughput.result(), volume.result()
+    elapsed = time.perf_counter() - started
+    bytes_after = client.admin.command("serverStatus")["network"]["bytesOut"]
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return {
+        "mode": mode,
+        "parcels": collection.estimated_document_count(),
+        "bytes_transferred": bytes_after - bytes_before,
+        "peak_rss_mb": round(rss_after / 1024, 1),
+        "rss_growth_mb": round((rss_after - rss_before) / 1024, 1),
+        "seconds": round(elapsed, 3),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uri", default="mongodb://localhost:27017")
+    parser.add_argument("--date", default="2025-01-01")
+    parser.add_argument("--parcels", type=int, default=1_000_000)
+    parser.add_argument("--seed", action="store_true", help="(re)create the synthetic collection first")
+    parser.add_argument("--batch-size", type=int, default=2000)
+    parser.add_argument("--mode", choices=["before", "after"], help="run a single mode in this process")
+    parser.add_argument("--out", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    if args.mode:
+        print(json.dumps(run_mode(args.uri, args.date, args.mode, args.batch_size)))
+        return
+
+    if args.seed:
+        seed(MongoClient(args.uri), args.date, args.parcels)
+
+    results = []
+    for mode in ("before", "after"):
+        output = subprocess.run(
+            [sys.executable, "-m", "bench.streaming_memory", "--uri", args.uri, "--date", args.date,
+             "--batch-size", str(args.batch_size), "--mode", mode],
+            check=True, capture_output=True, text=True,
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    report = json.dumps({"benchmark": "streaming_memory", "results": results}, indent=2)
+    print(report)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(report)
+
+
+if __name__ == "__main__":
+    main()
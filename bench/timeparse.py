@@ -0,0 +1,117 @@
+# bench/timeparse.py
+"""
+Time-of-day parsing: app.services.timeparse against the strptime parser
+and the HH:MM string truncation the routes used before.
+
+    python -m bench.timeparse
+    python -m bench.timeparse --values 1000000 --malformed 0.01 --out timeparse.json
+
+The values are the registerTS and event ts strings of bench.generator
+parcels, with a share `--malformed` replaced by short, empty or garbage
+strings so the fallback paths are measured too.
+"""
+import argparse
+import json
+import random
+import time
+from datetime import datetime
+from typing import Any, Callable, List, Optional
+
+from app.services.timeparse import MISSING_MS, parse_ms, parse_ms_many
+from bench.generator import parcels
+
+MALFORMED = ["", "09:15:26", "9:15:26,5", " 09:15:26,625 ", "25:00:00,000", "n/a", "09-15-26"]
+
+
+def strptime_ms(ts_str: Any) -> Optional[int]:
+    """The parser the routes had before."""
+    if not isinstance(ts_str, str):
+        return None
+    for fmt in ("%H:%M:%S,%f", "%H:%M:%S"):
+        try:
+            t = datetime.strptime(ts_str.strip(), fmt)
+            return (t.hour * 3600 + t.minute * 60 + t.second) * 1000 + t.microsecond // 1000
+        except ValueError:
+            continue
+    return None
+
+
+def truncated_hhmm(ts_str: Any) -> str:
+    """The /volume window key the route had before."""
+    try:
+        return ts_str.split(",")[0][:5]
+    except Exception:
+        return "00:00"
+
+
+def sample(n: int, malformed: float, seed: int) -> List[Any]:
+    rng = random.Random(seed)
+    values = []
+    for doc in parcels(max(1, n // 5), seed):
+        values.append(doc["registerTS"])
+        values.extend(event["ts"] for event in doc["events"])
+        if len(values) >= n:
+            break
+    values = values[:n]
+    for i in range(n):
+        if rng.random() < malformed:
+            values[i] = rng.choice(MALFORMED)
+    return values
+
+
+def timed(fn: Callable[[List[Any]], Any], values: List[Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(values)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--values", type=int, default=200_000)
+    parser.add_argument("--malformed", type=float, default=0.01, help="share of malformed values")
+    parser.add_argument("--repeat", type=int, default=3, help="best of this many runs")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    values = sample(args.values, args.malformed, args.seed)
+    expected = [strptime_ms(v) for v in values]
+    scalar = [parse_ms(v) for v in values]
+    batch = parse_ms_many(values).tolist()
+    mismatches = sum(e != s for e, s in zip(expected, scalar))
+    mismatches += sum((MISSING_MS if e is None else e) != b for e, b in zip(expected, batch))
+
+    candidates = {
+        "strptime": lambda vs: [strptime_ms(v) for v in vs],
+        "hhmm_truncation": lambda vs: [truncated_hhmm(v) for v in vs],
+        "parse_ms": lambda vs: [parse_ms(v) for v in vs],
+        "parse_ms_many": parse_ms_many,
+    }
+    seconds = {name: timed(fn, values, args.repeat) for name, fn in candidates.items()}
+    report = {
+        "benchmark": "timeparse",
+        "values": len(values),
+        "malformed": args.malformed,
+        "mismatches": mismatches,
+        "results": {
+            name: {
+                "seconds": round(s, 4),
+                "ns_per_value": round(s / len(values) * 1e9, 1),
+                "speedup_vs_strptime": round(seconds["strptime"] / s, 1),
+            }
+            for name, s in seconds.items()
+        },
+    }
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
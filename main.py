@@ -1,11 +1,59 @@
-from fastapi import FastAPI
+import time
+# Startup is timed from here: /health/ready reports the import and warm-up seconds
+IMPORT_STARTED = time.monotonic()
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from app.database import db
+from app.services import workers
+from app.services.cache import response_cache
+from app.services.catalog import collection_catalog
+from app.services.compression import CompressionMiddleware
+from app.services.live import live_hub
+from app.services.metrics import registry, track_request
+from app.services.profiler import PROFILER_ENABLED, profiler
+from app.services.responses import KPIResponse
+from app.services.snapshots import snapshot_scheduler, snapshot_store
+from app.services.startup import STARTUP_REQUIRE_DB, ping, startup
 from app.routes import summary,volume, throughput  # Import your router module
 from app.routes import parcel_journey  
+from app.routes import live
+from app.routes import dates
+from app.routes import snapshots
+from app.routes import dashboard
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled MongoClient for the whole process, shared by every request
+    db.connect()
+    if STARTUP_REQUIRE_DB:
+        # Fail the deploy instead of starting an instance that can never become ready
+        await ping(db.get_async_db())
+    # Background refresh of today's configured windows (config.json "snapshots")
+    snapshot_scheduler.register("summary", summary.summary_from_profile)
+    snapshot_scheduler.register("throughput", throughput.throughput_from_profile)
+    snapshot_scheduler.register("volume", volume.volume_from_profile)
+    snapshot_scheduler.start(db.get_async_db())
+    # Connections, catalog, worker processes and today's snapshots, before /health/ready says so
+    startup.start(db.get_async_db())
+    yield
+    await startup.stop()
+    await snapshot_scheduler.stop()
+    profiler.stop()
+    await live_hub.close()
+    await db.close()
+    workers.shutdown()
+
+
 app = FastAPI(
     title="Parcel KPI API",
     description="API to get parcel processing KPIs from MongoDB collections",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=KPIResponse
 )
 
 # CORS for frontend (e.g., React, Streamlit)
@@ -17,14 +65,107 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# gzip/brotli for clients that accept it (Accept-Encoding), streamed NDJSON included
+app.add_middleware(CompressionMiddleware)
+
+# Per-stage timings of every request: a Server-Timing header, and counters for /metrics
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    with track_request() as metrics:
+        response = await call_next(request)
+    finished = time.perf_counter()
+    if metrics.handler_done is not None:
+        metrics.add_stage("serialize", finished - metrics.handler_done)
+    total = finished - metrics.started
+    route = request.scope.get("route")
+    registry.observe_request(route.path if route is not None else "unmatched", response.status_code, total, metrics)
+    response.headers["Server-Timing"] = metrics.server_timing(total)
+    return response
+
 # ✅ Root route to check if server is running
 @app.get("/")
-def root():
+async def root():
     print("🌐 Root URL '/' accessed")
     return {"message": "🚀 FastAPI backend is running and ready!"}
 
+# Liveness: the process serves HTTP
+@app.get("/health/live")
+async def health_live():
+    return {"status": "alive", "uptime_seconds": startup.status()["uptime_seconds"]}
+
+# Readiness: 503 until the startup warm-up is done, for the platform's health check
+@app.get("/health/ready")
+async def health_ready():
+    status = startup.status()
+    return KPIResponse(status, status_code=200 if status["ready"] else 503)
+
+# MongoDB connection pool statistics
+@app.get("/pool-stats")
+def get_pool_stats():
+    return db.pool_stats()
+
+# KPI response cache statistics
+@app.get("/cache-stats")
+def get_cache_stats():
+    return response_cache.stats()
+
+# Drop cached KPI responses, e.g. after a date collection was re-imported
+@app.post("/cache/invalidate")
+def invalidate_cache(date: Optional[str] = None):
+    collection_catalog.invalidate()
+    snapshot_store.clear(date)
+    return {"date": date, "dropped": response_cache.invalidate(date)}
+
+# Collection catalog used for the routes' date checks
+@app.get("/catalog-stats")
+def get_catalog_stats():
+    return collection_catalog.stats()
+
+# Live feeds and their subscribers
+@app.get("/live-stats")
+def get_live_stats():
+    return live_hub.stats()
+
+# Prometheus scrape endpoint
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return registry.render({
+        "kpi_cache": response_cache.stats(),
+        "kpi_catalog": collection_catalog.stats(),
+        "mongo_pool": db.pool_stats(),
+        "live": {"feeds": len(live_hub.feeds)},
+        "kpi_snapshots": snapshot_scheduler.stats(),
+        "kpi_startup": startup.stats(),
+    })
+
+# Sampling profiler, only with PROFILER_ENABLED=1
+@app.post("/profiler/start")
+def start_profiler(interval_ms: float = 10, max_seconds: float = 300):
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=403, detail="Set PROFILER_ENABLED=1 to use the profiler")
+    profiler.start(interval_ms / 1000, max_seconds)
+    return profiler.status()
+
+@app.post("/profiler/stop")
+def stop_profiler():
+    profiler.stop()
+    return profiler.status()
+
+# Collapsed stacks, for flamegraph.pl or speedscope
+@app.get("/profiler", response_class=PlainTextResponse)
+def get_profile(min_count: int = 1):
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=403, detail="Set PROFILER_ENABLED=1 to use the profiler")
+    return profiler.collapsed(min_count)
+
 # Register KPI summary route
 app.include_router(summary.router)
 app.include_router(volume.router)
 app.include_router(parcel_journey.router)
 app.include_router(throughput.router)
+app.include_router(live.router)
+app.include_router(dates.router)
+app.include_router(snapshots.router)
+app.include_router(dashboard.router)
+
+startup.imported(IMPORT_STARTED)
@@ -0,0 +1,75 @@
+# tests/conftest.py
+"""
+The tests run against a real MongoDB: the one at TEST_MONGODB_URI when it
+is set, else a throwaway mongod from bench.mongod. They are skipped when
+neither is available; mongomock implements neither the aggregation
+expressions nor the async client.
+
+Everything is written to the TEST_MONGODB_DB database (default
+"kpi_tests"), which is dropped afterwards.
+
+    python -m pytest tests
+    TEST_MONGODB_URI=mongodb://localhost:27017 python -m pytest tests
+"""
+import asyncio
+import os
+
+# Before app.database.db reads it, also in the worker processes the parallel tests start
+os.environ["MONGODB_DB"] = os.getenv("TEST_MONGODB_DB", "kpi_tests")
+
+import pytest
+from pymongo import AsyncMongoClient, MongoClient
+from pymongo.errors import PyMongoError
+
+from bench.mongod import LocalMongod
+
+
+@pytest.fixture(scope="session")
+def mongo_uri():
+    uri = os.getenv("TEST_MONGODB_URI")
+    mongod = None
+    if uri is None:
+        try:
+            mongod = LocalMongod()
+            uri = mongod.__enter__()
+        except RuntimeError as e:
+            pytest.skip(f"no MongoDB: {e}")
+    else:
+        try:
+            MongoClient(uri, serverSelectionTimeoutMS=2000).admin.command("ping")
+        except PyMongoError as e:
+            pytest.skip(f"no MongoDB at TEST_MONGODB_URI: {e}")
+    # Worker processes connect through app.database.db
+    previous = os.environ.get("MONGODB_URI")
+    os.environ["MONGODB_URI"] = uri
+    try:
+        yield uri
+    finally:
+        if previous is None:
+            os.environ.pop("MONGODB_URI", None)
+        else:
+            os.environ["MONGODB_URI"] = previous
+        if mongod is not None:
+            mongod.__exit__(None, None, None)
+
+
+@pytest.fixture(scope="session")
+def db(mongo_uri):
+    client = MongoClient(mongo_uri)
+    yield client[os.environ["MONGODB_DB"]]
+    client.drop_database(os.environ["MONGODB_DB"])
+    client.close()
+
+
+@pytest.fixture(scope="session")
+def run_async(mongo_uri):
+    """Runs `fn(async_db)` on a fresh event loop and client, as a route would."""
+    def run(fn):
+        async def main():
+            client = AsyncMongoClient(mongo_uri)
+            try:
+                return await fn(client[os.environ["MONGODB_DB"]])
+            finally:
+                await client.close()
+        return asyncio.run(main())
+    return run
@@ -0,0 +1,91 @@
+# tests/parcels.py
+"""
+Parcel fixtures: a generated day from bench.generator, plus hand-written
+parcels for the cases it never produces.
+"""
+from typing import Any, Dict, List
+
+from bench.generator import OVERFLOW_LOCATIONS, RAW_DEREG_LOCATION, RAW_DEREG_REASON, RAW_SORT_STATUS, parcels, raw
+
+
+def _event(msg_id: str, ts: Any, fields: Dict[int, str] = None, **extra) -> Dict[str, Any]:
+    return {"msg_id": msg_id, "ts": ts, "raw": raw(msg_id, str(ts), "H", fields or {}), **extra}
+
+
+def _parcel(host_id: Any, register_ts: Any, events: Any, status: str = "sorted", **extra) -> Dict[str, Any]:
+    """A parcel document; a hostId or registerTS of ... is left out."""
+    doc = {"hostId": host_id, "registerTS": register_ts, "status": status, "sort_strategy": "1",
+           "barcode_error": False, "volume_data": {"height": 20, "width": 30, "length": 40, "real_volume": 1000},
+           "events": events, **extra}
+    return {field: value for field, value in doc.items() if value is not ...}
+
+
+def _sorted_events(register: str, location: str = "1001.0001.0000.C01") -> List[Dict[str, Any]]:
+    return [
+        _event("2", register),
+        _event("3", register),
+        _event("6", register, {RAW_SORT_STATUS: "1"}, sort_code="1"),
+        _event("7", register, {RAW_DEREG_REASON: "1", RAW_DEREG_LOCATION: location}),
+    ]
+
+
+def edge_parcels() -> List[Dict[str, Any]]:
+    overflow_location = OVERFLOW_LOCATIONS[0]
+    return [
+        # The same hostId on several parcels, in several windows and far apart in _id order
+        *(_parcel("DUP-1", f"{hour:02d}:00:00,000", _sorted_events(f"{hour:02d}:00:01,000")) for hour in (6, 9, 12)),
+        *(_parcel("DUP-2", "09:15:30,250", _sorted_events("09:15:31,000")) for _ in range(3)),
+        # hostIds that count as no host
+        _parcel(None, "09:16:00,000", _sorted_events("09:16:01,000")),
+        _parcel("", "09:16:00,000", _sorted_events("09:16:01,000")),
+        _parcel(..., "09:16:00,000", _sorted_events("09:16:01,000")),
+        # Missing and malformed registerTS
+        _parcel("REG-1", None, _sorted_events("09:17:00,000")),
+        _parcel("REG-2", ..., _sorted_events("09:17:00,000")),
+        _parcel("REG-3", "junk", _sorted_events("09:17:00,000")),
+        _parcel("REG-4", "25:00:00,000", _sorted_events("09:17:00,000")),
+        _parcel("REG-5", "09:17:00", _sorted_events("09:17:01,000")),
+        _parcel("REG-6", " 09:17:02,5 ", _sorted_events("09:17:03,000")),
+        # Missing and malformed event timestamps, and no events at all
+        _parcel("EV-1", "09:18:00,000", [_event("2", None), _event("2", "09:18:00,400"), _event("3", "bad")]),
+        _parcel("EV-2", "09:18:00,000", [{"msg_id": "2", "raw": "2|x"}, _event("7", "09:19:00")]),
+        _parcel("EV-3", "09:18:00,000", []),
+        {"hostId": "EV-4", "registerTS": "09:18:00,000", "status": "lost", "barcode_error": True},
+        # Overflow by a 999 sort report, and by deregistering at an overflow location
+        _parcel("OF-1", "10:00:00,000", [
+            _event("2", "10:00:00,100"),
+            _event("6", "10:01:00,000", {RAW_SORT_STATUS: "999"}, sort_code="2"),
+            _event("7", "10:01:05,000", {RAW_DEREG_REASON: "2", RAW_DEREG_LOCATION: "1001.0002.0000.C01"}),
+        ], status="overflow"),
+        _parcel("OF-2", "10:00:00,000", _sorted_events("10:00:30,000", overflow_location), status="overflow"),
+        # A 999 sort report without an ItemInstruction is no overflow
+        _parcel("OF-3", "10:02:00,000", [_event("6", "10:02:30,000", {RAW_SORT_STATUS: "999"}, sort_code="2")]),
+        # Volumes that do and do not count as valid
+        *(_parcel(f"VOL-{i}", "11:00:00,000", _sorted_events("11:00:01,000"),
+                  volume_data={"height": 10, "real_volume": volume})
+          for i, volume in enumerate((0, -5, 2.5, None, "12"))),
+        # Registered exactly on window bounds, and just outside them
+        _parcel("EDGE-1", "08:00:00,000", _sorted_events("08:00:00,000")),
+        _parcel("EDGE-2", "07:59:59,999", _sorted_events("08:00:00,000")),
+        _parcel("EDGE-3", "12:00:00,000", _sorted_events("12:00:00,000")),
+        _parcel("EDGE-4", "12:00:00,001", _sorted_events("12:00:00,001")),
+    ]
+
+
+def day(n: int, seed: int = 7) -> List[Dict[str, Any]]:
+    """n generated parcels with the edge cases spread among them, so they end up in different _id ranges."""
+    docs = list(parcels(n, seed=seed, overflow_rate=0.1))
+    edges = edge_parcels()
+    step = max(1, len(docs) // len(edges))
+    for i, edge in enumerate(edges):
+        docs.insert(i * (step + 1), edge)
+    return docs
+
+
+# (start_ms, end_ms) windows the tests compare the engines on
+WINDOWS = [
+    (0, (23 * 60 + 59) * 60_000),
+    (8 * 3_600_000, 12 * 3_600_000),
+    (9 * 3_600_000 + 15 * 60_000, 9 * 3_600_000 + 18 * 60_000),
+    (10 * 3_600_000, 10 * 3_600_000),
+]
@@ -0,0 +1,46 @@
+# tests/test_live.py
+"""LiveState's counters against SummaryAccumulator, as parcels are added, updated and removed."""
+import copy
+import random
+
+from app.config import config
+from app.services.live import LiveState
+from app.services.summary_engine import SummaryAccumulator
+from tests.parcels import day
+
+OVERFLOW_LOCATIONS = set(config.get("overflow_locations", []))
+
+
+def reference_counters(docs):
+    accumulator = SummaryAccumulator(0, 24 * 3_600_000 - 1, OVERFLOW_LOCATIONS)
+    accumulator.add(docs)
+    totals = accumulator.totals()
+    return {field: totals[field] for field in LiveState(()).counters}
+
+
+def test_live_counters_match_summary():
+    rng = random.Random(3)
+    docs = {}
+    for i, doc in enumerate(day(2000)):
+        # Many parcels share a few hostIds
+        if i % 7 == 0:
+            doc["hostId"] = f"SHARED-{i % 4}"
+        docs[i] = {**doc, "_id": i}
+    state = LiveState(OVERFLOW_LOCATIONS)
+    state.apply(docs.values())
+    assert state.counters == reference_counters(docs.values())
+
+    updated = [{**copy.deepcopy(doc), "hostId": rng.choice(["SHARED-1", "NEW", None])}
+               for doc in rng.sample(list(docs.values()), 300)]
+    state.apply(updated)
+    docs.update((doc["_id"], doc) for doc in updated)
+    assert state.counters == reference_counters(docs.values())
+
+    removed = rng.sample(list(docs), 500)
+    state.remove(removed)
+    for _id in removed:
+        del docs[_id]
+    assert state.counters == reference_counters(docs.values())
+
+    state.remove(list(docs))
+    assert state.counters["hosts"] == 0
@@ -0,0 +1,106 @@
+# tests/test_parallel.py
+"""Process-parallel reductions (app.services.parallel) against the serial path."""
+import numpy as np
+import pytest
+
+from app.config import config
+from app.services import parallel, workers
+from tests.parcels import WINDOWS, day
+
+OVERFLOW_LOCATIONS = set(config.get("overflow_locations", []))
+
+PARCELS = 1000
+PROCESSES, CHUNKS_PER_PROCESS = 2, 3
+
+
+@pytest.fixture(scope="module")
+def collection(db):
+    docs = day(PARCELS)
+    # One hostId on parcels all over the day, so in every _id range
+    for doc in docs[::97]:
+        doc["hostId"] = "SPREAD"
+    collection = db["2025-02-01"]
+    collection.drop()
+    collection.insert_many(docs)
+    yield collection
+    collection.drop()
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(workers, "KPI_PROCESSES", PROCESSES)
+    monkeypatch.setattr(parallel, "KPI_PROCESSES", PROCESSES)
+    monkeypatch.setattr(parallel, "PARALLEL_MIN_DOCS", 10)
+    monkeypatch.setattr(parallel, "PARALLEL_CHUNKS_PER_PROCESS", CHUNKS_PER_PROCESS)
+
+    def broken():
+        raise AssertionError("the process pool failed, so reduce_kpi fell back to the serial path")
+    monkeypatch.setattr(parallel, "discard_process_pool", broken)
+
+    chunks = []
+    run_in_process = parallel.run_in_process
+
+    async def counting(fn, *args):
+        chunks.append(args[3:])
+        return await run_in_process(fn, *args)
+    monkeypatch.setattr(parallel, "run_in_process", counting)
+    yield chunks
+    workers.discard_process_pool()
+
+
+def plain(value):
+    """A partial with its numpy arrays as lists, so partials compare with =="""
+    if isinstance(value, dict):
+        return {key: plain(v) for key, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [plain(v) for v in value]
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+def partials(run_async, collection, start_ms, end_ms):
+    kpis = {
+        "summary": (start_ms, end_ms, OVERFLOW_LOCATIONS),
+        "throughput": (start_ms, end_ms, OVERFLOW_LOCATIONS),
+        "volume": (start_ms // 60_000, end_ms // 60_000),
+        "dashboard": (("summary", "throughput", "volume"), start_ms, end_ms, OVERFLOW_LOCATIONS),
+    }
+
+    async def reduce_all(adb):
+        return {kind: plain(await parallel.reduce_kpi(adb[collection.name], kind, *args))
+                for kind, args in kpis.items()}
+    return run_async(reduce_all)
+
+
+def profile_windows(run_async, collection):
+    profile = run_async(lambda adb: parallel.reduce_kpi(adb[collection.name], "day",
+                                                        ("summary", "throughput", "volume"), OVERFLOW_LOCATIONS))
+    return [plain([profile.summary_totals(s // 60_000, e // 60_000),
+                   profile.throughput_counts(s // 60_000, e // 60_000),
+                   profile.volume_columns(s // 60_000, e // 60_000)])
+            for s, e in WINDOWS]
+
+
+@pytest.fixture(scope="module")
+def serial(collection, run_async):
+    assert workers.process_pool() is None
+    return [partials(run_async, collection, s, e) for s, e in WINDOWS], profile_windows(run_async, collection)
+
+
+def test_process_pool_matches_serial(collection, run_async, serial, pool):
+    assert [partials(run_async, collection, s, e) for s, e in WINDOWS] == serial[0]
+    assert profile_windows(run_async, collection) == serial[1]
+    # Every reduction went through the pool; the day's parcels do not split evenly into its ranges
+    assert len(pool) == (len(WINDOWS) * 4 + 1) * PROCESSES * CHUNKS_PER_PROCESS
+
+
+def test_hosts_are_distinct_across_ranges(collection, run_async, serial, pool):
+    totals = run_async(lambda adb: parallel.reduce_kpi(adb[collection.name], "summary", *WINDOWS[0],
+                                                       OVERFLOW_LOCATIONS))
+    assert totals == serial[0][0]["summary"]
+
+    def in_range(_id, lo, hi):
+        return (lo is None or lo <= _id) and (hi is None or _id < hi)
+    spread = [doc["_id"] for doc in collection.find({"hostId": "SPREAD"}, {"_id": 1})]
+    assert sum(any(in_range(_id, lo, hi) for _id in spread) for lo, hi in pool) > 1
@@ -0,0 +1,52 @@
+# tests/test_summary_pipeline.py
+"""The /summary aggregation pipeline against the Python reduction it stands in for."""
+import copy
+
+import pytest
+
+from app.config import config
+from app.jobs.materialize import materialize_collection
+from app.services.summary_engine import SummaryAccumulator, summary_totals_with_pipeline
+from tests.parcels import WINDOWS, day
+
+OVERFLOW_LOCATIONS = list(config.get("overflow_locations", []))
+
+
+@pytest.fixture(scope="module")
+def docs():
+    return day(3000)
+
+
+# Parcels with their events only, with a "kpi" sub-document each, and half and half
+@pytest.fixture(scope="module", params=["events", "materialized", "mixed"])
+def collection(request, db, docs):
+    collection = db[{"events": "2025-01-01", "materialized": "2025-01-02", "mixed": "2025-01-03"}[request.param]]
+    collection.drop()
+    collection.insert_many(copy.deepcopy(docs))
+    if request.param != "events":
+        materialize_collection(collection)
+    if request.param == "mixed":
+        ids = [doc["_id"] for doc in collection.find({}, {"_id": 1}).sort("_id", 1)][::2]
+        collection.update_many({"_id": {"$in": ids}}, {"$unset": {"kpi": ""}})
+    yield collection
+    collection.drop()
+
+
+def reference_totals(docs, start_ms, end_ms):
+    accumulator = SummaryAccumulator(start_ms, end_ms, set(OVERFLOW_LOCATIONS))
+    accumulator.add(docs)
+    return accumulator.totals()
+
+
+def test_fixtures_cover_the_edge_cases(docs):
+    totals = reference_totals(docs, *WINDOWS[0])
+    assert totals["overflow"] > 0
+    assert totals["hosts"] < sum(1 for doc in docs if doc.get("hostId") and doc.get("registerTS"))
+    assert any(not isinstance(doc.get("registerTS"), str) for doc in docs)
+
+
+@pytest.mark.parametrize("start_ms, end_ms", WINDOWS)
+def test_pipeline_matches_python(collection, docs, run_async, start_ms, end_ms):
+    totals = run_async(lambda adb: summary_totals_with_pipeline(adb[collection.name], start_ms, end_ms,
+                                                                OVERFLOW_LOCATIONS))
+    assert totals == reference_totals(docs, start_ms, end_ms)